@@ -0,0 +1,175 @@
+"""
+チャット回答キャッシュモジュール
+
+「東京都で募集中のIT導入補助金は？」のようなほぼ同一の質問に対して、
+LLMとツールの呼び出しを繰り返さずに前回の回答を返します。
+キーは正規化した質問の並び・モデル選択・カタログのバージョンから作り、
+カタログが更新されると自動的に別のキーになります。
+"""
+import hashlib
+import os
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .cache import TTLCache
+from .chat import CLAUDE_MODEL, OPENAI_MODEL, SYSTEM_PROMPT
+from .compaction import is_summary, is_user_turn
+from .jgrants import SEARCH_CACHE_TTL, detail_cache, search_cache
+from .singleflight import SingleFlight
+from . import mirror
+
+# 環境変数の読み込み
+load_dotenv()
+
+# 回答キャッシュ設定（TTLの既定値はカタログの更新間隔: ミラーの同期間隔または検索キャッシュのTTL）
+ANSWER_CACHE_TTL = float(os.getenv(
+    "ANSWER_CACHE_TTL",
+    str(mirror.MIRROR_SYNC_INTERVAL if mirror.mirror is not None else SEARCH_CACHE_TTL)
+))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+answer_cache = TTLCache(
+    ttl=ANSWER_CACHE_TTL,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    max_bytes=ANSWER_CACHE_MAX_BYTES,
+    name="answers"
+)
+
+# 同じ質問が同時に届いた場合はLLMの呼び出しを1回にまとめる
+answer_inflight = SingleFlight()
+
+# モデル・システムプロンプトが変わったら回答を使い回さない
+_PROMPT_FINGERPRINT = f"{CLAUDE_MODEL}|{OPENAI_MODEL}|{SYSTEM_PROMPT}"
+
+# 回答の取得関数の型: {"responses": モデル名 → レスポンス, "transcripts": モデル名 → 追加メッセージ} を返す
+AnswerFetch = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+def normalize_question(text: str) -> str:
+    """
+    質問を正規化します（NFKC・小文字化・空白と句読点の除去）
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(
+        c for c in text
+        if not c.isspace() and unicodedata.category(c)[0] not in ("P", "Z")
+    )
+
+
+def catalog_version() -> str:
+    """
+    カタログのバージョンを表すハッシュを返します
+
+    ミラーの最終同期時刻に加えて検索・詳細キャッシュの世代（上流から再取得した内容が変わった回数）を
+    含めるため、ミラーを使わない場合も上流のデータの更新を検知すると変わります。I/Oは行いません。
+    """
+    synced_at = mirror.mirror.synced_at if mirror.mirror is not None else None
+    source = f"{_PROMPT_FINGERPRINT}|{synced_at or ''}|{search_cache.generation}|{detail_cache.generation}"
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+
+
+def conversation_questions(
+    histories: Dict[str, List[Dict[str, Any]]],
+    models: List[str],
+    message: str
+) -> Optional[List[str]]:
+    """
+    セッション履歴中のユーザーの質問の並びに新しい質問を加えて返します
+
+    要約を含む（圧縮済みの）履歴や、モデルごとに質問の並びが異なる場合は
+    回答を再利用できないため None を返します。
+    """
+    sequences = []
+    for name in models:
+        history = histories.get(name, [])
+        if any(is_summary(item) for item in history):
+            return None
+        sequences.append([item["content"] for item in history if is_user_turn(item)])
+
+    if any(sequence != sequences[0] for sequence in sequences):
+        return None
+    return sequences[0] + [message]
+
+
+def answer_cache_key(model: str, questions: Optional[List[str]]) -> Optional[Hashable]:
+    """
+    回答キャッシュのキーを作成します（キャッシュできない場合は None）
+
+    Args:
+        model: "claude", "openai", "both"
+        questions: 会話中のユーザーの質問（最後が今回の質問）
+    """
+    if not questions:
+        return None
+    return ("answer", model, catalog_version(), tuple(normalize_question(q) for q in questions))
+
+
+def store_answer(key: Optional[Hashable], answer: Dict[str, Any]) -> None:
+    """
+    全モデルが成功した回答のみキャッシュします
+
+    キーは生成を始める前のカタログのバージョンで作られているため、生成中にカタログが
+    更新された（ツール呼び出しで上流の変更を検知した場合を含む）回答は、古いバージョンの
+    キーで保存しないよう破棄します。
+    """
+    if key is None or not all(result.get("success") for result in answer["responses"].values()):
+        return
+    _, _, version, _ = key
+    if version != catalog_version():
+        return
+    answer_cache.set(key, answer)
+
+
+async def fetch_answer(
+    key: Optional[Hashable],
+    fetch: AnswerFetch,
+    bypass: bool = False
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    回答キャッシュ経由で回答を取得します
+
+    Args:
+        key: answer_cache_key で作成したキー（None ならキャッシュしない）
+        fetch: LLMを呼び出して回答を作成するコルーチン関数
+        bypass: True ならキャッシュを参照せずに再生成する（結果はキャッシュに保存する）
+
+    Returns:
+        (回答, キャッシュから返したかどうか)
+    """
+    if key is None:
+        return await fetch(), False
+
+    if not bypass:
+        answer = answer_cache.get(key)
+        if answer is not None:
+            return answer, True
+        answer = await answer_inflight.do(key, fetch)
+    else:
+        answer = await fetch()
+
+    store_answer(key, answer)
+    return answer, False
+
+
+def replay_events(answer: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    キャッシュ済みの回答をストリーミングイベントの並びに変換します
+    """
+    events = []
+    for name, result in answer["responses"].items():
+        if result.get("response"):
+            events.append({"type": "token", "model": name, "text": result["response"]})
+        events.append({"type": "done", "model": name, "result": result, "cached": True})
+    return events
+
+
+def get_answer_cache_stats() -> Dict[str, Any]:
+    """
+    回答キャッシュの統計情報を返します
+    """
+    stats = answer_cache.stats()
+    stats["inflight"] = answer_inflight.stats()
+    return stats
@@ -0,0 +1,550 @@
+"""
+インメモリ結果キャッシュモジュール（TTL + LRU + stale-while-revalidate。任意でSQLiteに永続化）
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .tracing import span
+
+# 条件付き取得関数の型: 検証子を受け取り (結果 or None(304), 新しい検証子) を返す
+ConditionalFetch = Callable[[Optional[Dict[str, str]]], Awaitable[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, str]]]]]
+
+
+@dataclass
+class CacheEntry:
+    """キャッシュエントリ"""
+    value: Any
+    size: int
+    expires_at: float
+    stale_until: float
+    validators: Optional[Dict[str, str]] = None
+
+
+def estimate_size(value: Any) -> int:
+    """
+    値のおおよそのメモリサイズ（JSONシリアライズ後のバイト数）を返す
+    """
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(repr(value).encode("utf-8"))
+
+
+def _encode_key(key: Hashable) -> str:
+    return json.dumps(key, ensure_ascii=False)
+
+
+def _decode_key(value: Any) -> Hashable:
+    # JSONではタプルがリストになるため、タプルに戻す
+    if isinstance(value, list):
+        return tuple(_decode_key(item) for item in value)
+    return value
+
+
+class SQLiteStore:
+    """
+    TTLCache のエントリを保存するSQLiteファイル（任意の永続化先）
+
+    有効期限は壁時計の時刻で保存し、読み込み時に time.monotonic() 基準に戻します。
+    書き込みは専用の1スレッドで順番に行うため、イベントループを止めません。
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLiteデータベースファイルのパス（ディレクトリがなければ作成）
+        """
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-store")
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    "cache TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, validators TEXT, "
+                    "expires_at REAL NOT NULL, stale_until REAL NOT NULL, PRIMARY KEY (cache, key))"
+                )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self, cache: str, limit: int) -> List[Tuple[Hashable, Any, float, float, Optional[Dict[str, str]]]]:
+        """
+        保存済みのエントリを古い順に返します（提供期限を過ぎたものは削除）
+
+        Args:
+            cache: キャッシュ名
+            limit: 読み込む最大件数（有効期限が新しいものを優先）
+
+        Returns:
+            (キー, 値, 有効期限, 提供期限, 検証子) のリスト。期限は time.time() 基準
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM entries WHERE cache = ? AND stale_until < ?", (cache, time.time()))
+            rows = conn.execute(
+                "SELECT key, value, expires_at, stale_until, validators FROM entries "
+                "WHERE cache = ? ORDER BY expires_at DESC LIMIT ?",
+                (cache, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [
+            (_decode_key(json.loads(key)), json.loads(value), expires_at, stale_until,
+             json.loads(validators) if validators else None)
+            for key, value, expires_at, stale_until, validators in reversed(rows)
+        ]
+
+    def save(
+        self,
+        cache: str,
+        key: Hashable,
+        value: Any,
+        expires_at: float,
+        stale_until: float,
+        validators: Optional[Dict[str, str]] = None
+    ) -> None:
+        """
+        エントリの保存を予約します（書き込みは専用スレッドで行う。期限は time.time() 基準）
+        """
+        row = (
+            cache,
+            _encode_key(key),
+            json.dumps(value, ensure_ascii=False, default=str),
+            json.dumps(validators) if validators else None,
+            expires_at,
+            stale_until
+        )
+        self._executor.submit(self._write, row)
+
+    def _write(self, row: Tuple[Any, ...]) -> None:
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO entries (cache, key, value, validators, expires_at, stale_until) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        row
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # 永続化に失敗してもメモリ上のキャッシュはそのまま使える
+            pass
+
+    def close(self) -> None:
+        """
+        予約済みの書き込みを完了させてから終了します
+        """
+        self._executor.shutdown(wait=True)
+
+
+class TTLCache:
+    """
+    TTL付きLRUキャッシュ
+
+    エントリ数とバイト数の両方で上限を設け、超過時は最も古く使われたものから破棄します。
+    TTL切れ後も stale_ttl の間は「古い値」として返却でき、裏で再取得できます。
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int = 512,
+        max_bytes: int = 32 * 1024 * 1024,
+        stale_ttl: float = 0.0,
+        keep_expired: bool = False,
+        name: str = "cache"
+    ):
+        """
+        Args:
+            ttl: 新鮮とみなす秒数
+            max_entries: 最大エントリ数
+            max_bytes: 最大合計バイト数
+            stale_ttl: TTL切れ後に古い値を返してよい秒数
+            keep_expired: True なら完全に期限切れのエントリもLRUで追い出されるまで保持し、
+                上流が利用できない場合の最終手段として last_known で参照できるようにする
+            name: キャッシュ名（トレースのスパン属性と永続化先での区別に使う）
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self.keep_expired = keep_expired
+        self.name = name
+        self._data: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self.fallbacks = 0
+        # 既存エントリの値が別の内容に置き換わった回数（上流のデータの更新の検知用）
+        self.generation = 0
+        self.store: Optional[SQLiteStore] = None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def lookup(self, key: Hashable) -> Tuple[Optional[Any], bool]:
+        """
+        キャッシュを参照します
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            (値, 古い値かどうか)。見つからない・完全に期限切れの場合は (None, False)
+        """
+        with span("cache.lookup", cache=self.name) as current:
+            value, stale = self._lookup(key)
+            current.set(hit=value is not None, stale=stale)
+        return value, stale
+
+    def _lookup(self, key: Hashable) -> Tuple[Optional[Any], bool]:
+        entry = self._data.get(key)
+        now = time.monotonic()
+
+        if entry is None:
+            self.misses += 1
+            return None, False
+
+        if now >= entry.stale_until:
+            if not self.keep_expired:
+                self._remove(key)
+            self.misses += 1
+            return None, False
+
+        self._data.move_to_end(key)
+
+        if now >= entry.expires_at:
+            self.stale_hits += 1
+            return entry.value, True
+
+        self.hits += 1
+        return entry.value, False
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        新鮮な値のみを返します（古い値・未登録の場合はNone）
+        """
+        value, stale = self.lookup(key)
+        return None if stale else value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None,
+        validators: Optional[Dict[str, str]] = None
+    ) -> None:
+        """
+        値を登録します
+
+        Args:
+            key: キャッシュキー
+            value: 値
+            ttl: このエントリのTTL（省略時はキャッシュのTTL）
+            validators: 条件付きリクエスト用の検証子（ETag / Last-Modified）
+        """
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        previous = self._data.get(key)
+        if previous is not None:
+            if previous.value != value:
+                self.generation += 1
+            self._remove(key)
+
+        now = time.monotonic()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        self._data[key] = CacheEntry(
+            value=value,
+            size=size,
+            expires_at=expires_at,
+            stale_until=expires_at + self.stale_ttl,
+            validators=validators
+        )
+        self._bytes += size
+        self._evict()
+        self._save(key)
+
+    def persist(self, store: SQLiteStore) -> int:
+        """
+        SQLiteへの永続化を有効にし、保存済みのエントリを読み込みます
+
+        以降に登録・延長したエントリは store にも書き込まれます。
+
+        Args:
+            store: 永続化先
+
+        Returns:
+            読み込んだエントリ数
+        """
+        offset = time.monotonic() - time.time()
+        rows = store.load(self.name, self.max_entries)
+        for key, value, expires_at, stale_until, validators in rows:
+            if key in self._data:
+                self._remove(key)
+            size = estimate_size(value)
+            self._data[key] = CacheEntry(
+                value=value,
+                size=size,
+                expires_at=expires_at + offset,
+                stale_until=stale_until + offset,
+                validators=validators
+            )
+            self._bytes += size
+        self._evict()
+        self.store = store
+        return len(rows)
+
+    def values(self) -> List[Any]:
+        """
+        保持している全エントリの値を返します（有効期限は問わない。統計は更新しない）
+        """
+        return [entry.value for entry in self._data.values()]
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """
+        有効期限に関係なく保持している値を返します（統計・LRUの順序は更新しない）
+        """
+        entry = self._data.get(key)
+        return entry.value if entry is not None else None
+
+    def last_known(self, key: Hashable) -> Optional[Any]:
+        """
+        有効期限に関係なく保持している値を返します（上流が利用できない場合の代替用）
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        self.fallbacks += 1
+        return entry.value
+
+    def validators(self, key: Hashable) -> Optional[Dict[str, str]]:
+        """
+        エントリに保存された検証子（ETag / Last-Modified）を返します
+        """
+        entry = self._data.get(key)
+        return entry.validators if entry is not None else None
+
+    def touch(self, key: Hashable, ttl: Optional[float] = None) -> None:
+        """
+        既存エントリの有効期限を延長します（値は変更しない）
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            return
+        now = time.monotonic()
+        entry.expires_at = now + (self.ttl if ttl is None else ttl)
+        entry.stale_until = entry.expires_at + self.stale_ttl
+        self._data.move_to_end(key)
+        self._save(key)
+
+    def delete(self, key: Hashable) -> None:
+        """
+        エントリを削除します
+        """
+        if key in self._data:
+            self._remove(key)
+
+    def clear(self) -> None:
+        """
+        全エントリを削除します
+        """
+        self._data.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        キャッシュの統計情報を返します
+        """
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "refreshes": self.refreshes,
+            "fallbacks": self.fallbacks,
+            "generation": self.generation,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0
+        }
+
+    def _save(self, key: Hashable) -> None:
+        entry = self._data.get(key)
+        if self.store is None or entry is None:
+            return
+        offset = time.time() - time.monotonic()
+        self.store.save(
+            self.name, key, entry.value, entry.expires_at + offset, entry.stale_until + offset, entry.validators
+        )
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._data.pop(key)
+        self._bytes -= entry.size
+
+    def _evict(self) -> None:
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._data.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+
+# 実行中のバックグラウンド再取得タスク（GCで破棄されないよう参照を保持）
+_refresh_tasks: Dict[Tuple[int, Hashable], "asyncio.Task[Any]"] = {}
+
+
+async def cached_fetch(
+    cache: TTLCache,
+    key: Hashable,
+    fetch: Callable[[], Awaitable[Dict[str, Any]]]
+) -> Dict[str, Any]:
+    """
+    キャッシュ経由で結果を取得します（stale-while-revalidate）
+
+    新鮮な値があればそれを返し、古い値しかなければ即座に返しつつ裏で再取得します。
+    取得結果は "success" が真の場合のみキャッシュされます。
+
+    Args:
+        cache: 使用するキャッシュ
+        key: キャッシュキー
+        fetch: 上流から結果を取得するコルーチン関数
+
+    Returns:
+        結果の辞書
+    """
+    value, stale = cache.lookup(key)
+
+    if value is not None:
+        if stale:
+            _schedule_refresh(cache, key, lambda: _fetch_and_store(cache, key, fetch))
+        return value
+
+    return await _fetch_and_store(cache, key, fetch)
+
+
+async def conditional_fetch(
+    cache: TTLCache,
+    key: Hashable,
+    fetch: ConditionalFetch,
+    refresh: bool = False
+) -> Dict[str, Any]:
+    """
+    条件付きリクエストで再検証するキャッシュ取得（stale-while-revalidate）
+
+    fetch には前回保存した検証子（ETag / Last-Modified）が渡されます。
+    fetch は (結果, 新しい検証子) を返し、上流が 304 Not Modified を返した場合は
+    結果を None として返します。その場合はキャッシュ済みの値の有効期限を延長します。
+
+    Args:
+        cache: 使用するキャッシュ
+        key: キャッシュキー
+        fetch: 検証子を受け取り上流から取得するコルーチン関数
+        refresh: True なら新鮮な値があっても返さず、上流で再検証してから返す
+
+    Returns:
+        結果の辞書
+    """
+    value, stale = cache.lookup(key) if not refresh else (None, False)
+
+    if value is not None:
+        if stale:
+            validators = cache.validators(key)
+            _schedule_refresh(cache, key, lambda: _revalidate(cache, key, fetch, value, validators))
+        return value
+
+    # 提供期限を過ぎても keep_expired で保持している値があれば、その検証子で再検証する（304なら本文を再取得しない）
+    return await _revalidate(cache, key, fetch, cache.peek(key), cache.validators(key))
+
+
+def _fallback(cache: TTLCache, key: Hashable, result: Dict[str, Any]) -> Dict[str, Any]:
+    # 上流が利用できない（result["unavailable"]）場合は、期限切れでも保持している値を返す
+    if result.get("unavailable"):
+        value = cache.last_known(key)
+        if value is not None:
+            return value
+    return result
+
+
+async def _fetch_and_store(
+    cache: TTLCache,
+    key: Hashable,
+    fetch: Callable[[], Awaitable[Dict[str, Any]]]
+) -> Dict[str, Any]:
+    result = await fetch()
+    if result.get("success"):
+        cache.set(key, result)
+        return result
+    return _fallback(cache, key, result)
+
+
+async def _revalidate(
+    cache: TTLCache,
+    key: Hashable,
+    fetch: ConditionalFetch,
+    cached_value: Optional[Dict[str, Any]],
+    validators: Optional[Dict[str, str]]
+) -> Dict[str, Any]:
+    result, new_validators = await fetch(validators if cached_value is not None else None)
+
+    if result is None:
+        # 304 Not Modified: キャッシュ済みの値をそのまま延命する
+        if key in cache:
+            cache.touch(key)
+        else:
+            cache.set(key, cached_value, validators=validators)
+        return cached_value
+
+    if result.get("success"):
+        cache.set(key, result, validators=new_validators)
+        return result
+    return _fallback(cache, key, result)
+
+
+def _schedule_refresh(
+    cache: TTLCache,
+    key: Hashable,
+    refresh: Callable[[], Awaitable[Dict[str, Any]]]
+) -> None:
+    """
+    キーごとに1つだけバックグラウンド再取得を起動します
+    """
+    task_key = (id(cache), key)
+    if task_key in _refresh_tasks:
+        return
+
+    async def run() -> None:
+        try:
+            result = await refresh()
+            if result.get("success"):
+                cache.refreshes += 1
+        except Exception:
+            # 再取得に失敗しても古い値の提供は継続する
+            pass
+        finally:
+            _refresh_tasks.pop(task_key, None)
+
+    _refresh_tasks[task_key] = asyncio.create_task(run())
@@ -4,19 +4,77 @@ LLM統合モジュール（Claude API + OpenAI API）
 import os
 import json
 import asyncio
-from typing import Dict, Any, List, Optional
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable, AsyncIterator
 from dotenv import load_dotenv
-from anthropic import Anthropic
-from openai import OpenAI
-from .jgrants import search_subsidies, get_subsidy_detail, search_active_subsidies
+import httpx
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient as AnthropicHttpxClient
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient as OpenAIHttpxClient
+from .jgrants import (
+    search_subsidies, get_subsidy_detail, get_subsidy_details, search_active_subsidies, search_subsidies_multi,
+    find_similar_subsidies
+)
+from .tool_results import encode_tool_result
+from .compaction import compact_history, is_user_turn
+from .deadline import Deadline, DeadlineExceeded, TIMEOUT_MESSAGE, CANCELLED_MESSAGE
+from .metrics import CHAT_ITERATIONS, LLM_REQUEST_DURATION, LLM_TOKENS, TOOL_CALLS, TOOL_DURATION, outcome_of
+from .tracing import span
 
 # 環境変数の読み込み
 load_dotenv()
 
-# LLMクライアントの初期化
-anthropic_client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# LLM API用コネクションプールのサイズ（プロバイダーごと）
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
 
+# 1ターン内のツール呼び出しを並列実行する際の最大同時実行数
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "4"))
+
+# 使用するモデル
+CLAUDE_MODEL = "claude-sonnet-4-5-20250929"
+OPENAI_MODEL = "gpt-4-turbo-preview"
+
+# 1回の応答の最大出力トークン数（制限時間がある場合は残り時間に応じて減らす）
+CLAUDE_MAX_TOKENS = 4096
+OPENAI_MAX_TOKENS = 4096
+
+# 制限時間を過ぎたモデルが結果を返すのを待つ猶予（秒）
+DEADLINE_GRACE_SECONDS = 1.0
+
+# LLMクライアントの初期化（非同期クライアント + keep-alive接続を共有するHTTPプール）
+anthropic_client = AsyncAnthropic(
+    api_key=os.getenv("ANTHROPIC_API_KEY"),
+    http_client=AnthropicHttpxClient(
+        limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE)
+    )
+)
+openai_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    http_client=OpenAIHttpxClient(
+        limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE)
+    )
+)
+
+
+# 上流APIにない絞り込み条件（検索結果にローカルで適用する）
+SEARCH_FILTER_PROPERTIES = {
+    "subsidy_limit_min": {
+        "type": "number",
+        "description": "補助上限額の下限（円）。例: 1000万円以上なら 10000000"
+    },
+    "subsidy_limit_max": {
+        "type": "number",
+        "description": "補助上限額の上限（円）"
+    },
+    "deadline_within_days": {
+        "type": "integer",
+        "description": "申請締切が今日から指定日数以内のもののみ（例: 14）"
+    },
+    "employees": {
+        "type": "integer",
+        "description": "自社の従業員数（従業員数要件を満たすもののみ）"
+    }
+}
 
 # ツール定義（Function Calling用）
 TOOLS_DEFINITION = [
@@ -41,18 +99,44 @@ TOOLS_DEFINITION = [
                 },
                 "sort": {
                     "type": "string",
-                    "description": "ソート項目",
-                    "enum": ["created_date", "acceptance_start_datetime", "acceptance_end_datetime"]
+                    "description": "ソート項目（subsidy_max_limit: 補助上限額）",
+                    "enum": ["created_date", "acceptance_start_datetime", "acceptance_end_datetime", "subsidy_max_limit"]
                 },
                 "order": {
                     "type": "string",
                     "description": "ソート順",
                     "enum": ["ASC", "DESC"]
-                }
+                },
+                **SEARCH_FILTER_PROPERTIES
             },
             "required": ["keyword"]
         }
     },
+    {
+        "name": "search_subsidies_multi",
+        "description": "複数のキーワード・地域で補助金をまとめて検索します。結果は重複を除き、一致したキーワードが多い順・申請期限が近い順に並びます。複数の観点（例: DX、省エネ、設備投資）で探す場合は search_subsidies を繰り返さずにこちらを使ってください。",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "keywords": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "検索キーワードのリスト（各2～255文字）"
+                },
+                "target_areas": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "対象地域のリスト（例: [\"東京都\", \"神奈川県\"]）"
+                },
+                "acceptance": {
+                    "type": "integer",
+                    "description": "募集中フィルタ（1: 募集中のみ, 0: 全て。既定は1）",
+                    "enum": [0, 1]
+                }
+            },
+            "required": ["keywords"]
+        }
+    },
     {
         "name": "get_subsidy_detail",
         "description": "補助金IDを指定して詳細情報を取得します。補助率、概要、注意事項などの詳細が取得できます。",
@@ -67,6 +151,39 @@ TOOLS_DEFINITION = [
             "required": ["subsidy_id"]
         }
     },
+    {
+        "name": "get_subsidy_details",
+        "description": "複数の補助金IDの詳細情報をまとめて取得します。補助金を比較する場合は get_subsidy_detail を繰り返さずにこちらを使ってください。",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "subsidy_ids": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "補助金IDのリスト（search_subsidiesで取得したID、最大20件）"
+                }
+            },
+            "required": ["subsidy_ids"]
+        }
+    },
+    {
+        "name": "find_similar_subsidies",
+        "description": "指定した補助金と目的・概要が似ている補助金を探します。代わりの補助金や類似の制度を探す場合は、キーワードを考えて検索し直さずにこちらを使ってください。",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "subsidy_id": {
+                    "type": "string",
+                    "description": "基準とする補助金ID"
+                },
+                "k": {
+                    "type": "integer",
+                    "description": "返す件数（1～20、既定5）"
+                }
+            },
+            "required": ["subsidy_id"]
+        }
+    },
     {
         "name": "search_active_subsidies",
         "description": "現在募集中の補助金を検索します。申請期限が近い順に表示します。",
@@ -80,7 +197,8 @@ TOOLS_DEFINITION = [
                 "target_area": {
                     "type": "string",
                     "description": "対象地域（例: 東京都、大阪府など）"
-                }
+                },
+                **SEARCH_FILTER_PROPERTIES
             },
             "required": ["keyword"]
         }
@@ -88,268 +206,989 @@ TOOLS_DEFINITION = [
 ]
 
 
-def execute_tool(tool_name: str, tool_args: Dict[str, Any]) -> str:
+# システムプロンプト（ツール定義とともにプロンプトキャッシュの対象）
+SYSTEM_PROMPT = """あなたはJグランツ（補助金電子申請システム）の補助金情報を案内するアシスタントです。
+ユーザーの質問に応じてツールで補助金を検索・取得し、その結果に基づいて日本語で簡潔に回答してください。
+- ツールの結果にない情報を推測で補わないでください
+- 補助金を紹介する際は名称・対象地域・補助上限額・募集期間を明記してください
+- 補助率や概要などの詳細が必要な場合は get_subsidy_detail で確認してください
+- 複数の補助金の詳細が必要な場合は get_subsidy_details で一度に取得してください
+- 複数のキーワードや地域で探す場合は search_subsidies_multi で一度に検索してください
+- ある補助金の代わりや類似の補助金を探す場合は find_similar_subsidies を使ってください
+- 補助上限額・締切までの日数・従業員数の条件は、結果を読んで判断せず検索ツールの引数で絞り込んでください"""
+
+# Anthropicのプロンプトキャッシュのブレークポイント
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def build_claude_tools() -> List[Dict[str, Any]]:
+    """
+    Claudeのツール定義形式に変換（最後のツールにキャッシュブレークポイントを付与）
+    """
+    claude_tools = []
+    for tool in TOOLS_DEFINITION:
+        claude_tools.append({
+            "name": tool["name"],
+            "description": tool["description"],
+            "input_schema": tool["parameters"]
+        })
+    claude_tools[-1]["cache_control"] = CACHE_CONTROL
+    return claude_tools
+
+
+def build_openai_tools() -> List[Dict[str, Any]]:
     """
-    ツールを実行して結果を返す
+    OpenAIのツール定義形式に変換
+    """
+    openai_tools = []
+    for tool in TOOLS_DEFINITION:
+        openai_tools.append({
+            "type": "function",
+            "function": {
+                "name": tool["name"],
+                "description": tool["description"],
+                "parameters": tool["parameters"]
+            }
+        })
+    return openai_tools
+
+
+# プロバイダーごとのツール定義・システムプロンプト（起動時に一度だけ構築）
+CLAUDE_TOOLS = build_claude_tools()
+OPENAI_TOOLS = build_openai_tools()
+CLAUDE_SYSTEM = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": CACHE_CONTROL}]
+
+
+def with_cache_breakpoint(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    末尾のメッセージにキャッシュブレークポイントを付けたコピーを返す
+
+    ツールループでは直前までの履歴がそのまま次のリクエストの先頭になるため、
+    末尾にブレークポイントを置くと次の反復ではそこまでがキャッシュから読まれる。
+    元の履歴は変更しない。
+    """
+    if not messages:
+        return messages
+
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content}]
+    elif isinstance(content, list) and content and isinstance(content[-1], dict):
+        blocks = list(content)
+    else:
+        return messages
+
+    blocks[-1] = {**blocks[-1], "cache_control": CACHE_CONTROL}
+    return messages[:-1] + [{**last, "content": blocks}]
+
+
+def claude_content_to_dicts(blocks: List[Any]) -> List[Dict[str, Any]]:
+    """
+    SDKのコンテンツブロックを保存・再送可能な辞書形式に変換（空のテキストブロックは除く）
+    """
+    converted = []
+    for block in blocks:
+        if block.type == "text" and block.text:
+            converted.append({"type": "text", "text": block.text})
+        elif block.type == "tool_use":
+            converted.append({"type": "tool_use", "id": block.id, "name": block.name, "input": block.input})
+    return converted
+
+
+def messages_since_user_turn(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    最後のユーザー発言より後のメッセージ（このターンで追加されたもの）を返す
+
+    履歴の圧縮で古いターンの件数が変わっても、このターンの範囲は変わらない。
+    """
+    for index in range(len(messages) - 1, -1, -1):
+        if is_user_turn(messages[index]):
+            return messages[index + 1:]
+    return []
+
+
+def empty_usage() -> Dict[str, int]:
+    """
+    トークン使用量の集計用辞書を作成
+    """
+    return {
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cache_read_input_tokens": 0,
+        "cache_creation_input_tokens": 0
+    }
+
+
+# 集計のキー → メトリクスのトークン種別
+TOKEN_TYPES = {
+    "input_tokens": "input",
+    "output_tokens": "output",
+    "cache_read_input_tokens": "cache_read",
+    "cache_creation_input_tokens": "cache_creation"
+}
+
+
+def add_usage(totals: Dict[str, int], provider: str, model: str, counts: Dict[str, int]) -> None:
+    """
+    トークン使用量を集計とメトリクスに加算
+    """
+    for key, count in counts.items():
+        totals[key] += count
+        if count:
+            LLM_TOKENS.inc(provider, model, TOKEN_TYPES[key], amount=count)
+
+
+def add_claude_usage(totals: Dict[str, int], usage: Any) -> None:
+    """
+    Claudeのレスポンスのトークン使用量を集計に加算
+    """
+    if usage is None:
+        return
+    add_usage(totals, "anthropic", CLAUDE_MODEL, {
+        "input_tokens": usage.input_tokens or 0,
+        "output_tokens": usage.output_tokens or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0
+    })
+
+
+def add_openai_usage(totals: Dict[str, int], usage: Any) -> None:
+    """
+    OpenAIのレスポンスのトークン使用量を集計に加算（自動プロンプトキャッシュのヒット分を含む）
+    """
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    add_usage(totals, "openai", OPENAI_MODEL, {
+        "input_tokens": usage.prompt_tokens or 0,
+        "output_tokens": usage.completion_tokens or 0,
+        "cache_read_input_tokens": (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+    })
+
+
+# プロバイダー → レスポンスのトークン使用量を集計に加算する関数
+USAGE_ADDERS = {
+    "anthropic": add_claude_usage,
+    "openai": add_openai_usage
+}
+
+
+async def timed_llm_call(
+    provider: str,
+    model: str,
+    call: Awaitable[Any],
+    iteration: int,
+    usage: Dict[str, int]
+) -> Any:
+    """
+    LLM APIの呼び出しを待ち、所要時間をメトリクスとトレースのスパンに記録
+
+    レスポンスのトークン使用量は usage に加算し、この呼び出しの分をスパンの属性にも記録する
+    （ストリーミング中に加算された分を含む）
+
+    Args:
+        provider: "anthropic" または "openai"
+        model: モデル名
+        call: 呼び出しのコルーチン
+        iteration: ツールループの反復回数
+        usage: トークン使用量の集計
+    """
+    started_at = time.perf_counter()
+    before = dict(usage)
+    outcome = "error"
+    with span("llm.call", provider=provider, model=model, iteration=iteration) as current:
+        try:
+            result = await call
+            outcome = "success"
+            if getattr(result, "usage", None) is not None:
+                USAGE_ADDERS[provider](usage, result.usage)
+            return result
+        except asyncio.CancelledError:
+            # 制限時間切れ・先着モードでの中断
+            outcome = "cancelled"
+            raise
+        finally:
+            LLM_REQUEST_DURATION.observe_since(started_at, provider, model, outcome)
+            current.set(**{key: usage[key] - before[key] for key in usage})
+
+
+async def close_llm_clients() -> None:
+    """
+    LLMクライアントのHTTPプールを閉じます（アプリケーション終了時に呼び出す）
+    """
+    await anthropic_client.close()
+    await openai_client.close()
+
+
+def claude_call_options(deadline: Deadline, answer_now: bool) -> Dict[str, Any]:
+    """
+    残り時間に応じた Claude API の呼び出しオプション（answer_now ならツールを使わせない）
+    """
+    options: Dict[str, Any] = {"max_tokens": deadline.max_tokens(CLAUDE_MAX_TOKENS)}
+    if answer_now:
+        options["tool_choice"] = {"type": "none"}
+    return options
+
+
+def openai_call_options(deadline: Deadline, answer_now: bool) -> Dict[str, Any]:
+    """
+    残り時間に応じた OpenAI API の呼び出しオプション（answer_now ならツールを使わせない）
+    """
+    options: Dict[str, Any] = {"tool_choice": "none" if answer_now else "auto"}
+    if deadline.seconds is not None:
+        options["max_tokens"] = deadline.max_tokens(OPENAI_MAX_TOKENS)
+    return options
+
+
+def timed_out_result(
+    model: str,
+    text: str,
+    tool_calls: List[Dict[str, Any]],
+    usage: Dict[str, int],
+    error: str = TIMEOUT_MESSAGE
+) -> Dict[str, Any]:
+    """
+    時間切れ・中断したモデルの結果（それまでに生成したテキストとツール呼び出しを含む）
+    """
+    return {
+        "success": False,
+        "error": error,
+        "model": model,
+        "timed_out": True,
+        "response": text,
+        "tool_calls": tool_calls,
+        "usage": usage
+    }
+
+
+@dataclass
+class ChatProgress:
+    """
+    モデルごとの実行中の状態
+
+    呼び出し元と共有し、モデルの処理が中断（キャンセル）された場合でも、
+    それまでに生成したテキスト・ツール呼び出し・トークン使用量を結果として返せるようにする。
+    """
+    model: str
+    usage: Dict[str, int] = field(default_factory=empty_usage)
+    tool_calls: List[Dict[str, Any]] = field(default_factory=list)
+    # 最後に完了したターンのテキストと、生成中のターンのテキスト
+    final_text: str = ""
+    turn_text: str = ""
+
+    def timed_out(self, error: str = TIMEOUT_MESSAGE) -> Dict[str, Any]:
+        """
+        時間切れ・中断した結果（生成中のターンにテキストがなければ最後に完了したターンのテキスト）
+        """
+        return timed_out_result(self.model, self.turn_text or self.final_text, self.tool_calls, self.usage, error)
+
+
+def search_filter_args(tool_args: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    ツール引数から絞り込み条件（SEARCH_FILTER_PROPERTIES）を取り出す
+    """
+    return {name: tool_args[name] for name in SEARCH_FILTER_PROPERTIES if tool_args.get(name) is not None}
+
+
+async def execute_tool(tool_name: str, tool_args: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    ツールを実行して結果を返す（モデルに渡す際は encode_tool_result でエンコードする）
     """
     if tool_name == "search_subsidies":
-        result = search_subsidies(
+        result = await search_subsidies(
             keyword=tool_args["keyword"],
             sort=tool_args.get("sort", "created_date"),
             order=tool_args.get("order", "DESC"),
             acceptance=tool_args.get("acceptance"),
-            target_area_search=tool_args.get("target_area")
+            target_area_search=tool_args.get("target_area"),
+            **search_filter_args(tool_args)
+        )
+    elif tool_name == "search_subsidies_multi":
+        result = await search_subsidies_multi(
+            keywords=tool_args["keywords"],
+            target_areas=tool_args.get("target_areas"),
+            acceptance=tool_args.get("acceptance", 1)
         )
     elif tool_name == "get_subsidy_detail":
-        result = get_subsidy_detail(tool_args["subsidy_id"])
+        result = await get_subsidy_detail(tool_args["subsidy_id"])
+    elif tool_name == "get_subsidy_details":
+        result = await get_subsidy_details(tool_args["subsidy_ids"])
+    elif tool_name == "find_similar_subsidies":
+        result = await find_similar_subsidies(tool_args["subsidy_id"], k=tool_args.get("k", 5))
     elif tool_name == "search_active_subsidies":
-        result = search_active_subsidies(
+        result = await search_active_subsidies(
             keyword=tool_args["keyword"],
-            target_area=tool_args.get("target_area")
+            target_area=tool_args.get("target_area"),
+            **search_filter_args(tool_args)
         )
     else:
         result = {"error": f"Unknown tool: {tool_name}", "success": False}
 
-    return json.dumps(result, ensure_ascii=False, indent=2)
+    return result
 
 
-async def chat_with_claude(
-    messages: List[Dict[str, str]],
-    max_iterations: int = 5
+# トレースのスパン属性に記録するツール引数
+TRACED_TOOL_ARGUMENTS = ("subsidy_id", "subsidy_ids", "keyword", "keywords", "target_area")
+
+
+async def execute_tools(
+    tool_calls: List[Tuple[str, Dict[str, Any]]],
+    on_result: Optional[Callable[[int, Dict[str, Any]], Awaitable[None]]] = None,
+    iteration: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    1ターン内の複数のツール呼び出しを並列実行し、呼び出し順に結果を返す
+
+    Args:
+        tool_calls: (ツール名, 引数) のリスト
+        on_result: 各ツールの完了時に (インデックス, 結果) で呼ばれるコールバック
+        iteration: ツールループの反復回数（トレースのスパン属性）
+
+    Returns:
+        各ツールの実行結果のリスト
+    """
+    semaphore = asyncio.Semaphore(TOOL_CONCURRENCY)
+
+    async def run(index: int, tool_name: str, tool_args: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            started_at = time.perf_counter()
+            arguments = {name: tool_args.get(name) for name in TRACED_TOOL_ARGUMENTS}
+            with span("tool.execute", tool=tool_name, iteration=iteration, **arguments) as current:
+                try:
+                    result = await execute_tool(tool_name, tool_args)
+                except Exception as e:
+                    result = {"error": f"ツール実行エラー: {str(e)}", "success": False}
+                current.set(success=bool(result.get("success")), count=result.get("count"))
+            TOOL_DURATION.observe_since(started_at, tool_name)
+            TOOL_CALLS.inc(tool_name, outcome_of(result))
+        if on_result is not None:
+            await on_result(index, result)
+        return result
+
+    return await asyncio.gather(*[run(i, name, args) for i, (name, args) in enumerate(tool_calls)])
+
+
+# ストリーミングイベントの送信先（イベント辞書を受け取るコルーチン関数）
+EventEmitter = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+async def _run_tools_with_events(
+    model: str,
+    iteration: int,
+    calls: List[Tuple[str, str, Dict[str, Any]]],
+    emit: EventEmitter
+) -> List[Dict[str, Any]]:
+    """
+    ツール呼び出しの開始・完了イベントを送信しながら並列実行する
+
+    Args:
+        model: "claude" または "openai"
+        iteration: ツールループの反復回数
+        calls: (ツール呼び出しID, ツール名, 引数) のリスト
+        emit: イベント送信先
+    """
+    for call_id, name, args in calls:
+        await emit({
+            "type": "tool_start",
+            "model": model,
+            "iteration": iteration,
+            "id": call_id,
+            "name": name,
+            "arguments": args
+        })
+
+    async def on_result(index: int, result: Dict[str, Any]) -> None:
+        call_id, name, _ = calls[index]
+        await emit({
+            "type": "tool_end",
+            "model": model,
+            "iteration": iteration,
+            "id": call_id,
+            "name": name,
+            "success": bool(result.get("success"))
+        })
+
+    return await execute_tools([(name, args) for _, name, args in calls], on_result=on_result, iteration=iteration)
+
+
+@dataclass
+class ModelTurn:
+    """
+    1回のモデル呼び出しの結果（プロバイダーによらない形式）
+    """
+    text: str
+    # (ツール呼び出しID, ツール名, 引数) のリスト（空ならこのターンで回答が完了）
+    tool_calls: List[Tuple[str, str, Dict[str, Any]]]
+    # 履歴・transcript に追加するアシスタントのメッセージ（内容が空なら None）
+    message: Optional[Dict[str, Any]]
+
+
+# モデル呼び出しの関数の型: (履歴, answer_now, 反復回数) → ModelTurn
+ModelCall = Callable[[List[Dict[str, Any]], bool, int], Awaitable[ModelTurn]]
+
+
+def claude_turn(response: Any) -> ModelTurn:
+    """
+    Claude のレスポンス（ストリーミングの場合は最終メッセージ）を ModelTurn に変換
+    """
+    content = claude_content_to_dicts(response.content)
+    tool_calls = []
+    if response.stop_reason == "tool_use":
+        tool_calls = [(block.id, block.name, block.input) for block in response.content if block.type == "tool_use"]
+    return ModelTurn(
+        text="".join(block.text for block in response.content if block.type == "text"),
+        tool_calls=tool_calls,
+        message={"role": "assistant", "content": content} if content else None
+    )
+
+
+def openai_turn(content: Optional[str], calls: List[Tuple[str, str, str]]) -> ModelTurn:
+    """
+    OpenAI の応答テキストとツール呼び出し（ID, 関数名, 引数のJSON文字列）を ModelTurn に変換
+    """
+    if not calls:
+        return ModelTurn(text=content or "", tool_calls=[], message={"role": "assistant", "content": content} if content else None)
+
+    return ModelTurn(
+        text=content or "",
+        tool_calls=[(call_id, name, json.loads(arguments or "{}")) for call_id, name, arguments in calls],
+        message={
+            "role": "assistant",
+            "content": content or None,
+            "tool_calls": [
+                {"id": call_id, "type": "function", "function": {"name": name, "arguments": arguments}}
+                for call_id, name, arguments in calls
+            ]
+        }
+    )
+
+
+def claude_tool_messages(calls: List[Tuple[str, str, Dict[str, Any]]], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    ツール結果を Claude の履歴形式（tool_result ブロックをまとめた1件のユーザーメッセージ）に変換
+    """
+    return [{
+        "role": "user",
+        "content": [
+            {"type": "tool_result", "tool_use_id": call_id, "content": encode_tool_result(name, result)}
+            for (call_id, name, _), result in zip(calls, results)
+        ]
+    }]
+
+
+def openai_tool_messages(calls: List[Tuple[str, str, Dict[str, Any]]], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    ツール結果を OpenAI の履歴形式（呼び出しごとの tool メッセージ）に変換
+    """
+    return [
+        {"role": "tool", "tool_call_id": call_id, "content": encode_tool_result(name, result)}
+        for (call_id, name, _), result in zip(calls, results)
+    ]
+
+
+# モデル名 → ツール結果を履歴形式に変換する関数・エラーメッセージでのAPI名
+TOOL_MESSAGE_BUILDERS = {
+    "claude": claude_tool_messages,
+    "openai": openai_tool_messages
+}
+API_NAMES = {
+    "claude": "Claude",
+    "openai": "OpenAI"
+}
+
+
+async def run_tool_loop(
+    progress: ChatProgress,
+    messages: List[Dict[str, Any]],
+    call_model: ModelCall,
+    max_iterations: int,
+    transcript: Optional[List[Dict[str, Any]]],
+    deadline: Deadline,
+    emit: Optional[EventEmitter] = None
 ) -> Dict[str, Any]:
     """
-    Claude APIを使用してチャット処理
+    モデル呼び出しとツール実行を回答が完了するまで繰り返す（各プロバイダー・ストリーミングで共通）
+
+    同一ターンのツール呼び出しは並列実行し、呼び出し元には完全な結果、モデルにはコンパクトな結果を渡す。
 
     Args:
-        messages: チャット履歴 [{"role": "user", "content": "..."}]
+        progress: 実行中の状態（テキスト・ツール呼び出し・使用量を記録する）
+        messages: プロバイダー形式のチャット履歴
+        call_model: 1回のモデル呼び出し（使用量は progress.usage に加算し、
+            ストリーミングの場合は生成中のテキストを progress.turn_text に記録する）
         max_iterations: ツール呼び出しの最大反復回数
+        transcript: 指定された場合、成功時にこのターンで追加されたメッセージを追記する
+        deadline: 制限時間（時間切れの場合はそれまでの結果を timed_out として返す）
+        emit: 指定された場合、ツール呼び出しの開始・完了イベントを送信する
 
     Returns:
         レスポンス辞書
     """
+    model = progress.model
+    iterations = 0
+    outcome = "error"
     try:
-        # Claudeのツール定義形式に変換
-        claude_tools = []
-        for tool in TOOLS_DEFINITION:
-            claude_tools.append({
-                "name": tool["name"],
-                "description": tool["description"],
-                "input_schema": tool["parameters"]
-            })
-
-        current_messages = messages.copy()
-        iterations = 0
+        current_messages = list(messages)
+        round_seconds = 0.0
 
         while iterations < max_iterations:
-            response = anthropic_client.messages.create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=4096,
-                tools=claude_tools,
-                messages=current_messages
-            )
+            round_started = time.monotonic()
+            # 履歴がトークン予算を超えていれば古いターンを圧縮
+            current_messages = compact_history(current_messages)
+            # 残り時間に次のツール呼び出しの往復と最終回答が収まらなければ、ツールなしで回答させる
+            answer_now = iterations > 0 and not deadline.affords(2 * round_seconds)
+            progress.turn_text = ""
+            turn = await deadline.run(call_model(current_messages, answer_now, iterations))
+            # 最後に完了したターンのテキスト（時間切れの場合はこれを途中までの回答として返す）
+            progress.final_text = turn.text
 
             # ツール呼び出しがない場合は終了
-            if response.stop_reason != "tool_use":
-                final_text = ""
-                for block in response.content:
-                    if block.type == "text":
-                        final_text += block.text
+            if not turn.tool_calls:
+                if transcript is not None:
+                    transcript.extend(messages_since_user_turn(current_messages))
+                    if turn.message is not None:
+                        transcript.append(turn.message)
 
+                outcome = "success"
                 return {
                     "success": True,
-                    "model": "claude",
-                    "response": final_text,
-                    "tool_calls": []
+                    "model": model,
+                    "response": progress.final_text,
+                    "tool_calls": progress.tool_calls,
+                    "usage": progress.usage
                 }
 
-            # ツール呼び出しを処理
-            tool_calls_info = []
-            tool_results = []
-
-            for block in response.content:
-                if block.type == "tool_use":
-                    tool_name = block.name
-                    tool_args = block.input
-                    tool_call_id = block.id
-
-                    # ツール実行
-                    tool_result = execute_tool(tool_name, tool_args)
-
-                    tool_calls_info.append({
-                        "name": tool_name,
-                        "arguments": tool_args,
-                        "result": json.loads(tool_result)
-                    })
-
-                    tool_results.append({
-                        "type": "tool_result",
-                        "tool_use_id": tool_call_id,
-                        "content": tool_result
-                    })
-
-            # メッセージ履歴を更新
-            current_messages.append({
-                "role": "assistant",
-                "content": response.content
-            })
-            current_messages.append({
-                "role": "user",
-                "content": tool_results
-            })
+            if emit is None:
+                calls = [(name, args) for _, name, args in turn.tool_calls]
+                results = await deadline.run(execute_tools(calls, iteration=iterations))
+            else:
+                results = await deadline.run(_run_tools_with_events(model, iterations, turn.tool_calls, emit))
+
+            progress.tool_calls.extend(
+                {"name": name, "arguments": args, "result": result}
+                for (_, name, args), result in zip(turn.tool_calls, results)
+            )
+            current_messages.append(turn.message)
+            current_messages.extend(TOOL_MESSAGE_BUILDERS[model](turn.tool_calls, results))
 
+            round_seconds = time.monotonic() - round_started
             iterations += 1
 
         return {
             "success": False,
             "error": "最大反復回数に達しました",
-            "model": "claude"
+            "model": model,
+            "usage": progress.usage
         }
 
+    except DeadlineExceeded:
+        outcome = "timeout"
+        return progress.timed_out()
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
     except Exception as e:
         return {
             "success": False,
-            "error": f"Claude API error: {str(e)}",
-            "model": "claude"
+            "error": f"{API_NAMES[model]} API error: {str(e)}",
+            "model": model,
+            "usage": progress.usage
         }
+    finally:
+        CHAT_ITERATIONS.observe(iterations, model, outcome)
 
 
-async def chat_with_openai(
-    messages: List[Dict[str, str]],
-    max_iterations: int = 5
+async def chat_with_claude(
+    messages: List[Dict[str, Any]],
+    max_iterations: int = 5,
+    transcript: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+    progress: Optional[ChatProgress] = None
 ) -> Dict[str, Any]:
     """
-    OpenAI APIを使用してチャット処理
+    Claude APIを使用してチャット処理
 
     Args:
         messages: チャット履歴 [{"role": "user", "content": "..."}]
         max_iterations: ツール呼び出しの最大反復回数
+        transcript: 指定された場合、成功時にこのターンで追加されたメッセージ
+            （ツール呼び出し・ツール結果・最終応答）をプロバイダー形式で追記する
+        deadline: 制限時間（残り時間に応じて max_tokens と反復を調整し、
+            時間切れの場合はそれまでの結果を timed_out として返す）
+        progress: 実行中の状態の共有先（中断時に呼び出し元が途中までの結果を返すために使う）
 
     Returns:
         レスポンス辞書
     """
-    try:
-        # OpenAIのツール定義形式に変換
-        openai_tools = []
-        for tool in TOOLS_DEFINITION:
-            openai_tools.append({
-                "type": "function",
-                "function": {
-                    "name": tool["name"],
-                    "description": tool["description"],
-                    "parameters": tool["parameters"]
-                }
-            })
+    deadline = deadline or Deadline()
+    progress = progress or ChatProgress("claude")
 
-        current_messages = messages.copy()
-        iterations = 0
+    async def call_model(current_messages: List[Dict[str, Any]], answer_now: bool, iteration: int) -> ModelTurn:
+        call = anthropic_client.messages.create(
+            model=CLAUDE_MODEL,
+            system=CLAUDE_SYSTEM,
+            tools=CLAUDE_TOOLS,
+            messages=with_cache_breakpoint(current_messages),
+            **claude_call_options(deadline, answer_now)
+        )
+        return claude_turn(await timed_llm_call("anthropic", CLAUDE_MODEL, call, iteration, progress.usage))
 
-        while iterations < max_iterations:
-            response = openai_client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=current_messages,
-                tools=openai_tools,
-                tool_choice="auto"
-            )
+    return await run_tool_loop(progress, messages, call_model, max_iterations, transcript, deadline)
 
-            message = response.choices[0].message
 
-            # ツール呼び出しがない場合は終了
-            if not message.tool_calls:
-                return {
-                    "success": True,
-                    "model": "openai",
-                    "response": message.content or "",
-                    "tool_calls": []
-                }
+async def chat_with_openai(
+    messages: List[Dict[str, Any]],
+    max_iterations: int = 5,
+    transcript: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+    progress: Optional[ChatProgress] = None
+) -> Dict[str, Any]:
+    """
+    OpenAI APIを使用してチャット処理
 
-            # ツール呼び出しを処理
-            tool_calls_info = []
-            current_messages.append({
-                "role": "assistant",
-                "content": message.content,
-                "tool_calls": [
-                    {
-                        "id": tc.id,
-                        "type": "function",
-                        "function": {
-                            "name": tc.function.name,
-                            "arguments": tc.function.arguments
-                        }
-                    }
-                    for tc in message.tool_calls
-                ]
-            })
-
-            for tool_call in message.tool_calls:
-                tool_name = tool_call.function.name
-                tool_args = json.loads(tool_call.function.arguments)
-
-                # ツール実行
-                tool_result = execute_tool(tool_name, tool_args)
-
-                tool_calls_info.append({
-                    "name": tool_name,
-                    "arguments": tool_args,
-                    "result": json.loads(tool_result)
-                })
-
-                current_messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": tool_result
-                })
+    Args:
+        messages: チャット履歴 [{"role": "user", "content": "..."}]
+        max_iterations: ツール呼び出しの最大反復回数
+        transcript: 指定された場合、成功時にこのターンで追加されたメッセージ
+            （ツール呼び出し・ツール結果・最終応答）をプロバイダー形式で追記する
+        deadline: 制限時間（残り時間に応じて max_tokens と反復を調整し、
+            時間切れの場合はそれまでの結果を timed_out として返す）
+        progress: 実行中の状態の共有先（中断時に呼び出し元が途中までの結果を返すために使う）
 
-            iterations += 1
+    Returns:
+        レスポンス辞書
+    """
+    deadline = deadline or Deadline()
+    progress = progress or ChatProgress("openai")
 
-        return {
-            "success": False,
-            "error": "最大反復回数に達しました",
-            "model": "openai"
-        }
+    async def call_model(current_messages: List[Dict[str, Any]], answer_now: bool, iteration: int) -> ModelTurn:
+        call = openai_client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=current_messages,
+            tools=OPENAI_TOOLS,
+            **openai_call_options(deadline, answer_now)
+        )
+        response = await timed_llm_call("openai", OPENAI_MODEL, call, iteration, progress.usage)
+        message = response.choices[0].message
+        return openai_turn(
+            message.content,
+            [(tc.id, tc.function.name, tc.function.arguments) for tc in message.tool_calls or []]
+        )
 
-    except Exception as e:
-        return {
-            "success": False,
-            "error": f"OpenAI API error: {str(e)}",
-            "model": "openai"
-        }
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}] + messages
+    return await run_tool_loop(progress, messages, call_model, max_iterations, transcript, deadline)
+
+
+async def traced_run(model: str, run: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    モデルごとのチャット処理をトレースのスパンで囲む（LLM呼び出し・ツール実行はこの子スパンになる）
+    """
+    with span("chat.model", model=model) as current:
+        result = await run()
+        current.set(
+            success=bool(result.get("success")),
+            timed_out=result.get("timed_out"),
+            tool_calls=len(result.get("tool_calls") or [])
+        )
+        return result
 
 
 async def chat_with_both(
-    messages: List[Dict[str, str]]
+    messages: List[Dict[str, str]],
+    deadline: Optional[float] = None,
+    first_finished: bool = False
 ) -> Dict[str, Any]:
     """
     Claude と OpenAI の両方に並列でリクエストを送信
 
     Args:
         messages: チャット履歴
+        deadline: 2モデル全体の制限時間（秒。省略時は無制限）
+        first_finished: True なら先に成功したモデルの回答が揃った時点で返し、もう一方は中断する
 
     Returns:
         両方のレスポンスを含む辞書
     """
-    claude_task = chat_with_claude(messages)
-    openai_task = chat_with_openai(messages)
-
-    claude_result, openai_result = await asyncio.gather(
-        claude_task, openai_task, return_exceptions=True
+    return await run_chat(
+        {"claude": messages, "openai": messages},
+        deadline=Deadline(deadline),
+        first_finished=first_finished
     )
 
-    # 例外処理
-    if isinstance(claude_result, Exception):
-        claude_result = {
-            "success": False,
-            "error": str(claude_result),
-            "model": "claude"
-        }
 
-    if isinstance(openai_result, Exception):
-        openai_result = {
-            "success": False,
-            "error": str(openai_result),
-            "model": "openai"
-        }
+async def run_chat(
+    histories: Dict[str, List[Dict[str, Any]]],
+    transcripts: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    deadline: Optional[Deadline] = None,
+    first_finished: bool = False
+) -> Dict[str, Any]:
+    """
+    モデルごとの履歴で各モデルに並列でリクエストを送信
 
-    return {
-        "claude": claude_result,
-        "openai": openai_result
+    制限時間を過ぎたモデルはそれまでの結果を timed_out として返し、完了したモデルの回答を待たせません。
+
+    Args:
+        histories: モデル名（"claude" / "openai"）→ プロバイダー形式のチャット履歴
+        transcripts: モデル名 → このターンで追加されたメッセージの追記先（省略可）
+        deadline: 全モデルで共有する制限時間（省略時は無制限）
+        first_finished: True なら最初に成功したモデルの回答で返し、残りのモデルは中断する
+
+    Returns:
+        モデル名 → レスポンス辞書
+    """
+    runners = {
+        "claude": chat_with_claude,
+        "openai": chat_with_openai
+    }
+    transcripts = transcripts or {}
+    deadline = deadline or Deadline()
+    # 中断したモデルもそれまでの結果（テキスト・ツール呼び出し・使用量）を返せるよう実行中の状態を共有する
+    progress = {name: ChatProgress(name) for name in histories}
+    tasks = {
+        asyncio.create_task(traced_run(
+            name,
+            lambda name=name: runners[name](
+                histories[name],
+                transcript=transcripts.get(name),
+                deadline=deadline,
+                progress=progress[name]
+            )
+        )): name
+        for name in histories
+    }
+    results: Dict[str, Dict[str, Any]] = {}
+
+    try:
+        pending = set(tasks)
+        while pending:
+            # 各モデルは自身で制限時間を守るが、応答しない呼び出しに備えて外側でも待ち時間を区切る
+            timeout = None if deadline.seconds is None else deadline.remaining() + DEADLINE_GRACE_SECONDS
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+
+            for task in done:
+                name = tasks[task]
+                try:
+                    results[name] = task.result()
+                except Exception as e:
+                    results[name] = {"success": False, "error": str(e), "model": name, "usage": empty_usage()}
+
+            if first_finished and any(result.get("success") for result in results.values()):
+                for task in pending:
+                    results[tasks[task]] = progress[tasks[task]].timed_out(CANCELLED_MESSAGE)
+                break
+
+        for task in pending:
+            results.setdefault(tasks[task], progress[tasks[task]].timed_out())
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return {name: results[name] for name in histories}
+
+
+async def stream_with_claude(
+    messages: List[Dict[str, Any]],
+    emit: EventEmitter,
+    max_iterations: int = 5,
+    transcript: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+    progress: Optional[ChatProgress] = None
+) -> Dict[str, Any]:
+    """
+    Claude APIのストリーミングモードでチャット処理（トークンごとにイベントを送信）
+
+    Args:
+        messages: チャット履歴 [{"role": "user", "content": "..."}]
+        emit: イベント送信先
+        max_iterations: ツール呼び出しの最大反復回数
+        transcript: 指定された場合、成功時にこのターンで追加されたメッセージ
+            （ツール呼び出し・ツール結果・最終応答）をプロバイダー形式で追記する
+        deadline: 制限時間（残り時間に応じて max_tokens と反復を調整し、
+            時間切れの場合はそれまでの結果を timed_out として返す）
+        progress: 実行中の状態の共有先（中断時に呼び出し元が途中までの結果を返すために使う）
+
+    Returns:
+        chat_with_claude と同じ形式のレスポンス辞書（回答は最後のターンのみ。ツール呼び出し前の説明は含めない）
+    """
+    deadline = deadline or Deadline()
+    progress = progress or ChatProgress("claude")
+
+    async def generate(current_messages: List[Dict[str, Any]], options: Dict[str, Any]) -> Any:
+        async with anthropic_client.messages.stream(
+            model=CLAUDE_MODEL,
+            system=CLAUDE_SYSTEM,
+            tools=CLAUDE_TOOLS,
+            messages=with_cache_breakpoint(current_messages),
+            **options
+        ) as stream:
+            async for text in stream.text_stream:
+                progress.turn_text += text
+                await emit({"type": "token", "model": "claude", "text": text})
+            return await stream.get_final_message()
+
+    async def call_model(current_messages: List[Dict[str, Any]], answer_now: bool, iteration: int) -> ModelTurn:
+        call = generate(current_messages, claude_call_options(deadline, answer_now))
+        return claude_turn(await timed_llm_call("anthropic", CLAUDE_MODEL, call, iteration, progress.usage))
+
+    return await run_tool_loop(progress, messages, call_model, max_iterations, transcript, deadline, emit=emit)
+
+
+async def stream_with_openai(
+    messages: List[Dict[str, Any]],
+    emit: EventEmitter,
+    max_iterations: int = 5,
+    transcript: Optional[List[Dict[str, Any]]] = None,
+    deadline: Optional[Deadline] = None,
+    progress: Optional[ChatProgress] = None
+) -> Dict[str, Any]:
+    """
+    OpenAI APIのストリーミングモードでチャット処理（トークンごとにイベントを送信）
+
+    Args:
+        messages: チャット履歴 [{"role": "user", "content": "..."}]
+        emit: イベント送信先
+        max_iterations: ツール呼び出しの最大反復回数
+        transcript: 指定された場合、成功時にこのターンで追加されたメッセージ
+            （ツール呼び出し・ツール結果・最終応答）をプロバイダー形式で追記する
+        deadline: 制限時間（残り時間に応じて max_tokens と反復を調整し、
+            時間切れの場合はそれまでの結果を timed_out として返す）
+        progress: 実行中の状態の共有先（中断時に呼び出し元が途中までの結果を返すために使う）
+
+    Returns:
+        chat_with_openai と同じ形式のレスポンス辞書（回答は最後のターンのみ。ツール呼び出し前の説明は含めない）
+    """
+    deadline = deadline or Deadline()
+    progress = progress or ChatProgress("openai")
+
+    async def generate(current_messages: List[Dict[str, Any]], options: Dict[str, Any]) -> Dict[int, Dict[str, str]]:
+        stream = await openai_client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=current_messages,
+            tools=OPENAI_TOOLS,
+            stream=True,
+            stream_options={"include_usage": True},
+            **options
+        )
+        # ストリームで分割されて届くツール呼び出しをインデックスごとに組み立てる
+        tool_calls: Dict[int, Dict[str, str]] = {}
+
+        async for chunk in stream:
+            # 使用量は choices が空の最終チャンクで届く
+            add_openai_usage(progress.usage, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+
+            if delta.content:
+                progress.turn_text += delta.content
+                await emit({"type": "token", "model": "openai", "text": delta.content})
+
+            for tc in delta.tool_calls or []:
+                entry = tool_calls.setdefault(tc.index, {"id": "", "name": "", "arguments": ""})
+                if tc.id:
+                    entry["id"] = tc.id
+                if tc.function and tc.function.name:
+                    entry["name"] += tc.function.name
+                if tc.function and tc.function.arguments:
+                    entry["arguments"] += tc.function.arguments
+        return tool_calls
+
+    async def call_model(current_messages: List[Dict[str, Any]], answer_now: bool, iteration: int) -> ModelTurn:
+        call = generate(current_messages, openai_call_options(deadline, answer_now))
+        tool_calls = await timed_llm_call("openai", OPENAI_MODEL, call, iteration, progress.usage)
+        return openai_turn(
+            progress.turn_text,
+            [(tc["id"], tc["name"], tc["arguments"]) for _, tc in sorted(tool_calls.items())]
+        )
+
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}] + messages
+    return await run_tool_loop(progress, messages, call_model, max_iterations, transcript, deadline, emit=emit)
+
+
+async def stream_chat(
+    messages: List[Dict[str, str]],
+    model: str = "both",
+    histories: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    transcripts: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    deadline: Optional[Deadline] = None,
+    first_finished: bool = False
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    チャット処理のイベントを順次返す（"both" の場合は2モデルのイベントを1本に多重化）
+
+    イベントの種類:
+        token: 生成されたテキスト断片 {"model", "text"}
+        tool_start / tool_end: ツール呼び出しの開始・完了 {"model", "iteration", "id", "name", ...}
+        done: モデルごとの完了 {"model", "result"}（result は chat_with_* と同じ形式。
+            result["response"] は最後のターンの回答のみで、ツール呼び出し前に token で送った説明は含まない。
+            制限時間を過ぎた・中断したモデルは timed_out と、最新のターンで生成済みのテキスト・
+            それまでのツール呼び出し・トークン使用量）
+
+    Args:
+        messages: チャット履歴
+        model: "claude", "openai", "both"
+        histories: モデルごとの履歴（指定時は messages の代わりに使用）
+        transcripts: モデル名 → このターンで追加されたメッセージの追記先（省略可）
+        deadline: 全モデルで共有する制限時間（省略時は無制限）
+        first_finished: True なら最初に成功したモデルの完了で残りのモデルを中断する
+
+    Yields:
+        イベント辞書
+    """
+    runners = {
+        "claude": stream_with_claude,
+        "openai": stream_with_openai
     }
+    models = ["claude", "openai"] if model == "both" else [model]
+    histories = histories or {}
+    transcripts = transcripts or {}
+    deadline = deadline or Deadline()
+    queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    # モデルごとの実行中の状態（中断時の done イベントに生成済みのテキスト・ツール呼び出し・使用量を含める）
+    progress = {name: ChatProgress(name) for name in models}
+
+    async def run(name: str) -> None:
+        try:
+            result = await traced_run(name, lambda: runners[name](
+                histories.get(name, messages),
+                queue.put,
+                transcript=transcripts.get(name),
+                deadline=deadline,
+                progress=progress[name]
+            ))
+        except Exception as e:
+            result = {"success": False, "error": str(e), "model": name, "usage": empty_usage()}
+        await queue.put({"type": "done", "model": name, "result": result})
+
+    tasks = {name: asyncio.create_task(run(name)) for name in models}
+    pending = set(models)
+
+    try:
+        while pending:
+            # 各モデルは自身で制限時間を守るが、応答しない呼び出しに備えて外側でも待ち時間を区切る
+            timeout = None if deadline.seconds is None else deadline.remaining() + DEADLINE_GRACE_SECONDS
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                break
+            if event["type"] == "done":
+                pending.discard(event["model"])
+            yield event
+
+            if event["type"] == "done" and first_finished and event["result"].get("success"):
+                for name in list(pending):
+                    tasks[name].cancel()
+                    pending.discard(name)
+                    result = progress[name].timed_out(CANCELLED_MESSAGE)
+                    yield {"type": "done", "model": name, "result": result}
+
+        for name in pending:
+            tasks[name].cancel()
+            yield {"type": "done", "model": name, "result": progress[name].timed_out()}
+    finally:
+        # クライアント切断時などは実行中のモデル呼び出しを中断する
+        for task in tasks.values():
+            task.cancel()
@@ -0,0 +1,261 @@
+"""
+補助金レコードの列指向ストアモジュール（NumPy）
+
+JグランツAPIは補助上限額の範囲・締切までの日数・従業員数での絞り込みに対応していないため、
+キャッシュ済み・ミラー済みの検索結果を列（配列）に展開し、ローカルでベクトル化して絞り込み・並べ替えます。
+数値の上限額・エポック秒の日時・従業員数の範囲は列の作成時に一度だけ解析します。
+"""
+import math
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+# 列ビューを保持する検索結果の最大数（検索キャッシュのエントリごとに1つ）
+COLUMN_VIEW_MAX_ENTRIES = int(os.getenv("COLUMN_VIEW_MAX_ENTRIES", "512"))
+
+# ローカルで並べ替える項目（上流APIのソート項目にはない）
+LOCAL_SORT_FIELDS = {"subsidy_max_limit"}
+
+# 従業員数要件の表記（例: 「20名以下」「901名以上」「従業員数の制約なし」）
+EMPLOYEES_PATTERN = re.compile(r"(\d+)\s*(?:名|人)?\s*(以下|未満|以上|超)")
+
+DAY_SECONDS = 86400
+
+
+def parse_amount(value: Any) -> float:
+    """
+    補助上限額を数値（円）に変換します（不明な場合はNaN）
+    """
+    if isinstance(value, bool) or value is None:
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = unicodedata.normalize("NFKC", str(value)).replace(",", "").replace("円", "").strip()
+    try:
+        return float(text)
+    except ValueError:
+        return math.nan
+
+
+def parse_epoch(value: Optional[str]) -> float:
+    """
+    ISO8601日時文字列をエポック秒に変換します（不明な場合はNaN）
+    """
+    if not value:
+        return math.nan
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return math.nan
+
+
+def parse_employees(value: Optional[str]) -> Tuple[float, float]:
+    """
+    従業員数要件を対象となる従業員数の範囲 (下限, 上限) に変換します
+
+    「制約なし」や解析できない表記は全範囲 (0, inf) とみなします。
+    """
+    if not value:
+        return 0.0, math.inf
+    match = EMPLOYEES_PATTERN.search(unicodedata.normalize("NFKC", str(value)))
+    if match is None:
+        return 0.0, math.inf
+    number, relation = float(match.group(1)), match.group(2)
+    if relation == "以下":
+        return 0.0, number
+    if relation == "未満":
+        return 0.0, number - 1
+    if relation == "以上":
+        return number, math.inf
+    return number + 1, math.inf
+
+
+@dataclass(frozen=True)
+class SubsidyFilters:
+    """
+    ローカルで適用する絞り込み条件
+    """
+    subsidy_limit_min: Optional[float] = None
+    subsidy_limit_max: Optional[float] = None
+    deadline_within_days: Optional[float] = None
+    employees: Optional[int] = None
+
+    def active(self) -> bool:
+        return any(value is not None for value in (
+            self.subsidy_limit_min, self.subsidy_limit_max, self.deadline_within_days, self.employees
+        ))
+
+    def key(self) -> Tuple[Any, ...]:
+        return (self.subsidy_limit_min, self.subsidy_limit_max, self.deadline_within_days, self.employees)
+
+    def validate(self) -> Optional[str]:
+        """
+        条件が不正な場合はエラーメッセージを返します
+        """
+        if self.subsidy_limit_min is not None and self.subsidy_limit_min < 0:
+            return "subsidy_limit_minは0以上で指定してください"
+        if self.subsidy_limit_max is not None and self.subsidy_limit_max < 0:
+            return "subsidy_limit_maxは0以上で指定してください"
+        if (
+            self.subsidy_limit_min is not None and self.subsidy_limit_max is not None
+            and self.subsidy_limit_min > self.subsidy_limit_max
+        ):
+            return "subsidy_limit_minはsubsidy_limit_max以下で指定してください"
+        if self.deadline_within_days is not None and self.deadline_within_days < 0:
+            return "deadline_within_daysは0以上で指定してください"
+        if self.employees is not None and self.employees < 0:
+            return "employeesは0以上で指定してください"
+        return None
+
+
+class SubsidyColumns:
+    """
+    検索結果のレコードを列に展開したもの
+
+    records は元の検索結果のリストをそのまま参照し、絞り込み・並べ替えは
+    列に対するマスクと argsort で行ってからレコードを取り出します。
+    """
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        """
+        Args:
+            records: search_subsidies の "subsidies"（整形済みレコード）
+        """
+        self.records = records
+        size = len(records)
+        self.max_limit = np.fromiter(
+            (parse_amount(record.get("subsidy_max_limit")) for record in records), dtype=np.float64, count=size
+        )
+        self.start_ts = np.fromiter(
+            (parse_epoch(record.get("acceptance_start")) for record in records), dtype=np.float64, count=size
+        )
+        self.end_ts = np.fromiter(
+            (parse_epoch(record.get("acceptance_end")) for record in records), dtype=np.float64, count=size
+        )
+        employees = np.array(
+            [parse_employees(record.get("target_employees")) for record in records], dtype=np.float64
+        ).reshape(size, 2)
+        self.employees_min = employees[:, 0]
+        self.employees_max = employees[:, 1]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def mask(self, filters: SubsidyFilters, now: Optional[float] = None) -> np.ndarray:
+        """
+        条件に一致する行の真偽値配列を返します
+
+        上限額・締切で絞り込む場合、値が不明なレコードは除外します。
+        従業員数要件が不明なレコードは対象外とせず残します。
+        """
+        selected = np.ones(len(self.records), dtype=bool)
+        if filters.subsidy_limit_min is not None:
+            selected &= self.max_limit >= filters.subsidy_limit_min
+        if filters.subsidy_limit_max is not None:
+            selected &= self.max_limit <= filters.subsidy_limit_max
+        if filters.deadline_within_days is not None:
+            now = time.time() if now is None else now
+            selected &= (self.end_ts >= now) & (self.end_ts <= now + filters.deadline_within_days * DAY_SECONDS)
+        if filters.employees is not None:
+            selected &= (self.employees_min <= filters.employees) & (self.employees_max >= filters.employees)
+        return selected
+
+    def select(
+        self,
+        filters: SubsidyFilters,
+        sort: Optional[str] = None,
+        order: str = "DESC",
+        now: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        条件に一致するレコードを返します
+
+        Args:
+            filters: 絞り込み条件
+            sort: ローカルで並べ替える項目（LOCAL_SORT_FIELDS。None なら元の順序）
+            order: ソート順（ASC, DESC。値が不明なレコードは常に最後）
+            now: 締切の基準時刻（省略時は現在時刻）
+        """
+        indices = np.flatnonzero(self.mask(filters, now))
+        if sort == "subsidy_max_limit" and indices.size:
+            values = self.max_limit[indices]
+            # 安定ソートで同額は元の順序を保つ。NaN は符号に関係なく最後に並ぶ
+            indices = indices[np.argsort(values if order == "ASC" else -values, kind="stable")]
+        return [self.records[i] for i in indices]
+
+
+class ColumnViews:
+    """
+    検索結果ごとの列ビューのLRUキャッシュ
+
+    キャッシュキーに対応する結果オブジェクトが差し替わった場合（再取得・再検証）は列を作り直します。
+    """
+
+    def __init__(self, max_entries: int = COLUMN_VIEW_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._views: "OrderedDict[Hashable, Tuple[Dict[str, Any], SubsidyColumns]]" = OrderedDict()
+        self.builds = 0
+        self.hits = 0
+
+    def get(self, key: Hashable, result: Dict[str, Any]) -> SubsidyColumns:
+        """
+        検索結果の列ビューを返します（未作成・結果が更新された場合は作成）
+        """
+        entry = self._views.get(key)
+        if entry is not None and entry[0] is result:
+            self._views.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        columns = SubsidyColumns(result["subsidies"])
+        self._views[key] = (result, columns)
+        self._views.move_to_end(key)
+        self.builds += 1
+        while len(self._views) > self.max_entries:
+            self._views.popitem(last=False)
+        return columns
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._views), "builds": self.builds, "hits": self.hits}
+
+
+# 共有の列ビューキャッシュ
+column_views = ColumnViews()
+
+
+def filter_result(
+    key: Hashable,
+    result: Dict[str, Any],
+    filters: SubsidyFilters,
+    sort: Optional[str] = None,
+    order: str = "DESC"
+) -> Dict[str, Any]:
+    """
+    検索結果にローカルの絞り込み・並べ替えを適用します（元の結果は変更しない）
+
+    Args:
+        key: 検索結果のキャッシュキー（列ビューの再利用に使う）
+        result: search_subsidies と同じ形式の結果
+        filters: 絞り込み条件
+        sort: ローカルで並べ替える項目（LOCAL_SORT_FIELDS）
+        order: ソート順
+
+    Returns:
+        count を絞り込み後の件数にした結果（total_before_filter に元の件数）
+    """
+    if not result.get("success") or (not filters.active() and sort not in LOCAL_SORT_FIELDS):
+        return result
+
+    subsidies = column_views.get(key, result).select(filters, sort=sort, order=order)
+    filtered = {field: value for field, value in result.items() if field != "subsidies"}
+    filtered["count"] = len(subsidies)
+    filtered["total_before_filter"] = len(result["subsidies"])
+    filtered["subsidies"] = subsidies
+    return filtered
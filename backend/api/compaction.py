@@ -0,0 +1,287 @@
+"""
+チャット履歴の圧縮モジュール
+
+長い会話では履歴（特に埋め込まれたツール結果）がターンごとに再送され、
+レイテンシとコストが線形に増えていきます。LLM呼び出しの前に履歴のトークン数を見積もり、
+予算を超えた場合は直近のターンをそのまま残して、古いターンを次の順に圧縮します。
+
+1. 古いツール結果を、見つかった補助金のIDと名称だけの参照に置き換える
+2. それでも超える場合は、古いターンを決定的な要約メッセージ1件にまとめる
+
+圧縮結果は入力だけで決まるため、同じ履歴からは常に同じ先頭部分が得られ、
+プロンプトキャッシュを無効化しません。Claude・OpenAI どちらの履歴形式も扱えます。
+"""
+import json
+import os
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .tool_results import dumps_compact, estimate_tokens
+
+# 圧縮を始める履歴のトークン予算（システムプロンプト・ツール定義は含まない）
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "12000"))
+
+# そのまま残す直近のターン数（ユーザーの発言から次の発言までを1ターンとする）
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "2"))
+
+# 要約に残す過去ターン数・補助金の件数（古いものから破棄）
+SUMMARY_MAX_TURNS = int(os.getenv("HISTORY_SUMMARY_MAX_TURNS", "20"))
+SUMMARY_MAX_SUBSIDIES = int(os.getenv("HISTORY_SUMMARY_MAX_SUBSIDIES", "30"))
+
+# 要約メッセージの先頭に付ける見出し（以降は要約のJSON）
+SUMMARY_PREFIX = "【これまでの会話の要約】"
+
+# 要約に含める質問・回答・補助金名の最大文字数
+SUMMARY_QUESTION_CHARS = 100
+SUMMARY_ANSWER_CHARS = 200
+REFERENCE_TITLE_CHARS = 60
+
+# メッセージ1件あたりの固定オーバーヘッド（役割・区切りなど）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+Message = Dict[str, Any]
+
+
+def is_summary(message: Message) -> bool:
+    """
+    圧縮で作成した要約メッセージかどうか
+    """
+    content = message.get("content")
+    return message.get("role") == "user" and isinstance(content, str) and content.startswith(SUMMARY_PREFIX)
+
+
+def is_user_turn(message: Message) -> bool:
+    """
+    ターンの始まりとなるユーザー本人の発言かどうか（ツール結果・要約は含まない）
+    """
+    return message.get("role") == "user" and isinstance(message.get("content"), str) and not is_summary(message)
+
+
+def estimate_message_tokens(message: Message) -> int:
+    """
+    メッセージ1件のトークン数を概算します
+    """
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    content = message.get("content")
+    if isinstance(content, str):
+        tokens += estimate_tokens(content)
+    elif content:
+        tokens += estimate_tokens(dumps_compact(content))
+    if message.get("tool_calls"):
+        tokens += estimate_tokens(dumps_compact(message["tool_calls"]))
+    return tokens
+
+
+def estimate_history_tokens(messages: List[Message]) -> int:
+    """
+    履歴全体のトークン数を概算します
+    """
+    return sum(estimate_message_tokens(message) for message in messages)
+
+
+def _text_of(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            block.get("text", "")
+            for block in content
+            if isinstance(block, dict) and block.get("type") == "text"
+        )
+    return ""
+
+
+def _iter_tool_calls(message: Message) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # Claude: assistant の tool_use ブロック / OpenAI: assistant の tool_calls
+    if message.get("role") != "assistant":
+        return
+    content = message.get("content")
+    if isinstance(content, list):
+        for block in content:
+            if isinstance(block, dict) and block.get("type") == "tool_use":
+                yield block["name"], block.get("input") or {}
+    for call in message.get("tool_calls") or []:
+        try:
+            args = json.loads(call["function"]["arguments"] or "{}")
+        except ValueError:
+            args = {}
+        yield call["function"]["name"], args
+
+
+def _iter_tool_results(message: Message) -> Iterator[str]:
+    # Claude: user の tool_result ブロック / OpenAI: role=tool
+    if message.get("role") == "tool" and isinstance(message.get("content"), str):
+        yield message["content"]
+    elif message.get("role") == "user" and isinstance(message.get("content"), list):
+        for block in message["content"]:
+            if isinstance(block, dict) and block.get("type") == "tool_result" and isinstance(block.get("content"), str):
+                yield block["content"]
+
+
+def _subsidy_ref(record: Dict[str, Any]) -> Dict[str, Any]:
+    ref = {"id": record.get("id")}
+    label = record.get("title") or record.get("name")
+    if label:
+        ref["title"] = label[:REFERENCE_TITLE_CHARS]
+    return ref
+
+
+def _found_subsidies(result_text: str) -> List[Dict[str, Any]]:
+    try:
+        data = json.loads(result_text)
+    except ValueError:
+        return []
+    if not isinstance(data, dict):
+        return []
+    if isinstance(data.get("subsidies"), list):
+        return [_subsidy_ref(record) for record in data["subsidies"] if isinstance(record, dict) and record.get("id")]
+    if isinstance(data.get("subsidy"), dict) and data["subsidy"].get("id"):
+        return [_subsidy_ref(data["subsidy"])]
+    return []
+
+
+def tool_result_reference(result_text: str) -> str:
+    """
+    ツール結果を、見つかった補助金のIDと名称だけの参照に置き換えます
+
+    補助金を含まない結果（エラーなど）と参照済みの結果はそのまま返します。
+    """
+    try:
+        data = json.loads(result_text)
+    except ValueError:
+        return result_text
+    if not isinstance(data, dict) or data.get("compacted"):
+        return result_text
+
+    if isinstance(data.get("subsidies"), list):
+        return dumps_compact({
+            "compacted": True,
+            "count": data.get("count", len(data["subsidies"])),
+            "subsidies": _found_subsidies(result_text)
+        })
+    if isinstance(data.get("subsidy"), dict):
+        return dumps_compact({"compacted": True, "subsidy": _subsidy_ref(data["subsidy"])})
+    return result_text
+
+
+def _with_references(message: Message) -> Message:
+    if message.get("role") == "tool" and isinstance(message.get("content"), str):
+        return {**message, "content": tool_result_reference(message["content"])}
+
+    if message.get("role") == "user" and isinstance(message.get("content"), list):
+        return {
+            **message,
+            "content": [
+                {**block, "content": tool_result_reference(block["content"])}
+                if isinstance(block, dict) and block.get("type") == "tool_result" and isinstance(block.get("content"), str)
+                else block
+                for block in message["content"]
+            ]
+        }
+
+    return message
+
+
+def _split_turns(messages: List[Message]) -> Tuple[List[Message], List[Message], List[List[Message]]]:
+    # (先頭のシステムメッセージ, 既存の要約, ターンのリスト) に分ける
+    head: List[Message] = []
+    summaries: List[Message] = []
+    turns: List[List[Message]] = []
+
+    for message in messages:
+        if is_summary(message):
+            summaries.append(message)
+        elif is_user_turn(message):
+            turns.append([message])
+        elif turns:
+            turns[-1].append(message)
+        else:
+            head.append(message)
+
+    return head, summaries, turns
+
+
+def _summarize(summaries: List[Message], turns: List[List[Message]]) -> Message:
+    state: Dict[str, List[Dict[str, Any]]] = {"turns": [], "subsidies": []}
+    for summary in summaries:
+        try:
+            previous = json.loads(summary["content"][len(SUMMARY_PREFIX):])
+            state["turns"] += previous.get("turns", [])
+            state["subsidies"] += previous.get("subsidies", [])
+        except ValueError:
+            pass
+
+    for turn in turns:
+        tools = []
+        answer = ""
+        for message in turn:
+            for name, args in _iter_tool_calls(message):
+                tools.append(f"{name}({', '.join(f'{key}={value}' for key, value in args.items())})")
+            for result_text in _iter_tool_results(message):
+                state["subsidies"] += _found_subsidies(result_text)
+            if message.get("role") == "assistant":
+                text = _text_of(message.get("content"))
+                if text:
+                    answer = text
+
+        entry: Dict[str, Any] = {"q": turn[0]["content"][:SUMMARY_QUESTION_CHARS]}
+        if tools:
+            entry["tools"] = tools
+        if answer:
+            entry["a"] = answer[:SUMMARY_ANSWER_CHARS]
+        state["turns"].append(entry)
+
+    # 補助金はIDで重複を除き、後から見つかったものを優先して残す
+    subsidies: Dict[str, Dict[str, Any]] = {}
+    for ref in state["subsidies"]:
+        subsidies.pop(ref["id"], None)
+        subsidies[ref["id"]] = ref
+
+    return {
+        "role": "user",
+        "content": SUMMARY_PREFIX + "\n" + dumps_compact({
+            "turns": state["turns"][-SUMMARY_MAX_TURNS:],
+            "subsidies": list(subsidies.values())[-SUMMARY_MAX_SUBSIDIES:]
+        })
+    }
+
+
+def compact_history(
+    messages: List[Message],
+    budget: int = 0,
+    keep_turns: int = 0
+) -> List[Message]:
+    """
+    履歴がトークン予算を超えている場合に古いターンを圧縮します
+
+    直近 keep_turns ターン（進行中のツールループを含む）はそのまま残すため、
+    ツール呼び出しと結果の対応は崩れません。予算内であれば入力をそのまま返します。
+
+    Args:
+        messages: プロバイダー形式のチャット履歴（先頭のシステムメッセージを含んでよい）
+        budget: トークン予算（省略時は HISTORY_TOKEN_BUDGET）
+        keep_turns: そのまま残す直近のターン数（省略時は HISTORY_KEEP_TURNS）
+
+    Returns:
+        圧縮後の履歴（元の履歴は変更しない）
+    """
+    budget = budget or HISTORY_TOKEN_BUDGET
+    keep_turns = max(1, keep_turns or HISTORY_KEEP_TURNS)
+
+    if estimate_history_tokens(messages) <= budget:
+        return messages
+
+    head, summaries, turns = _split_turns(messages)
+    if len(turns) <= keep_turns:
+        return messages
+
+    old_turns, recent_turns = turns[:-keep_turns], turns[-keep_turns:]
+    recent = [message for turn in recent_turns for message in turn]
+
+    # 1. 古いツール結果を参照に置き換える
+    referenced = [[_with_references(message) for message in turn] for turn in old_turns]
+    compacted = head + summaries + [message for turn in referenced for message in turn] + recent
+    if estimate_history_tokens(compacted) <= budget:
+        return compacted
+
+    # 2. 古いターンを要約1件にまとめる
+    return head + [_summarize(summaries, old_turns)] + recent
@@ -0,0 +1,109 @@
+"""
+チャット処理の制限時間（デッドライン）モジュール
+
+1リクエストの制限時間をLLM呼び出しとツールループ全体で共有します。
+残り時間に応じて1回の応答の max_tokens を絞り、次のツール呼び出しの往復が収まらない場合は
+ツールなしで回答させます。時間切れになったモデルはそれまでの結果を timed_out として返します。
+"""
+import asyncio
+import math
+import os
+import time
+from typing import Awaitable, Optional, TypeVar
+
+from dotenv import load_dotenv
+
+# 環境変数の読み込み
+load_dotenv()
+
+# チャット1リクエストの既定の制限時間・リクエストで指定できる最大値（秒。0なら無制限）
+# 既定は無制限（従来どおり）。制限時間はリクエストの deadline か CHAT_DEADLINE で有効にする
+CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE", "0"))
+CHAT_MAX_DEADLINE = float(os.getenv("CHAT_MAX_DEADLINE", "300"))
+
+# max_tokens の調整に使う出力速度の目安（トークン/秒）と下限
+CHAT_OUTPUT_TOKENS_PER_SECOND = float(os.getenv("CHAT_OUTPUT_TOKENS_PER_SECOND", "40"))
+CHAT_MIN_MAX_TOKENS = int(os.getenv("CHAT_MIN_MAX_TOKENS", "512"))
+
+# 時間切れ・中断したモデルのエラーメッセージ
+TIMEOUT_MESSAGE = "制限時間内に応答が完了しませんでした"
+CANCELLED_MESSAGE = "先に完了したモデルの回答を返したため中断しました"
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    """
+    制限時間を超えた
+    """
+
+
+class Deadline:
+    """
+    リクエスト全体で共有する制限時間
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        """
+        Args:
+            seconds: 制限時間（秒。None または0以下なら無制限）
+        """
+        self.seconds = seconds if seconds and seconds > 0 else None
+        self.started_at = time.monotonic()
+
+    @classmethod
+    def for_request(cls, seconds: Optional[float] = None) -> "Deadline":
+        """
+        リクエストで指定された制限時間から作成します
+
+        省略時は CHAT_DEADLINE（既定は無制限）。指定された値は CHAT_MAX_DEADLINE で頭打ちにします
+        （0以下の指定はAPIで400として拒否するため、ここには正の値のみが渡される）。
+        """
+        if seconds is None:
+            return cls(CHAT_DEADLINE)
+        if CHAT_MAX_DEADLINE > 0:
+            seconds = min(seconds, CHAT_MAX_DEADLINE)
+        return cls(seconds)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def remaining(self) -> float:
+        """
+        残り秒数を返します（無制限なら inf）
+        """
+        if self.seconds is None:
+            return math.inf
+        return max(0.0, self.seconds - self.elapsed())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def affords(self, seconds: float) -> bool:
+        """
+        残り時間内に seconds 秒かかる処理（直前のツール呼び出しの往復など）がもう1回収まるか
+        """
+        return self.remaining() > seconds
+
+    def max_tokens(self, default: int) -> int:
+        """
+        残り時間内に生成し終えられる程度に max_tokens を調整します
+        """
+        if self.seconds is None:
+            return default
+        budget = int(self.remaining() * CHAT_OUTPUT_TOKENS_PER_SECOND)
+        return max(min(default, CHAT_MIN_MAX_TOKENS), min(default, budget))
+
+    async def run(self, awaitable: Awaitable[T]) -> T:
+        """
+        残り時間を上限として awaitable を待ちます
+
+        Raises:
+            DeadlineExceeded: 残り時間内に完了しなかった場合（awaitable はキャンセルされる）
+        """
+        if self.seconds is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, timeout=self.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(TIMEOUT_MESSAGE) from None
@@ -0,0 +1,208 @@
+"""
+補助金詳細レスポンスのストリーミングパーサーモジュール
+
+/subsidies/id/{id} のレスポンスは application_form_files に base64 のファイル本体を含むため、
+全体を response.json() で読み込むと1件あたり数MBをメモリに展開してしまいます。
+このパーサーはレスポンスをチャンク単位で受け取り、ファイル本体の文字列を読み飛ばしながら
+（件数・ファイル名・サイズのみ記録して）残りのJSONを組み立てます。
+"""
+import json
+import re
+from typing import Any, Dict, FrozenSet, List, Optional
+
+# 本体を読み飛ばすフィールド（ファイル名とサイズのみ記録する）
+BLOB_FIELDS: FrozenSet[str] = frozenset({"application_form_files"})
+
+# ファイル本体（base64）を持つキー（この値の長さだけからファイルサイズを概算する）
+BLOB_CONTENT_KEYS: FrozenSet[str] = frozenset({"data", "content"})
+
+# 文字列中で特別扱いが必要な文字（終端の引用符とエスケープ）
+_STRING_SPECIAL = re.compile(rb'["\\]')
+
+_QUOTE = 0x22
+_BACKSLASH = 0x5C
+_OPEN_OBJECT = 0x7B
+_CLOSE_OBJECT = 0x7D
+_OPEN_ARRAY = 0x5B
+_CLOSE_ARRAY = 0x5D
+_COMMA = 0x2C
+
+
+class _Frame:
+    """JSONのコンテナ（オブジェクト・配列）のパース状態"""
+    __slots__ = ("is_object", "key", "expecting_key")
+
+    def __init__(self, is_object: bool):
+        self.is_object = is_object
+        self.key: Optional[str] = None
+        self.expecting_key = is_object
+
+
+class DetailStreamParser:
+    """
+    BLOB_FIELDS の文字列値を読み飛ばすインクリメンタルJSONパーサー
+
+    使い方:
+        parser = DetailStreamParser()
+        async for chunk in response.aiter_bytes():
+            parser.feed(chunk)
+        data = parser.result()
+        files = parser.files["application_form_files"]  # [{"name": ..., "size": ...}]
+
+    読み飛ばした文字列は空文字列に置き換わるため、配列の要素数は元のまま保たれます。
+    """
+
+    def __init__(self, skip_fields: FrozenSet[str] = BLOB_FIELDS):
+        """
+        Args:
+            skip_fields: 本体を読み飛ばすフィールド名
+        """
+        self.skip_fields = skip_fields
+        self.files: Dict[str, List[Dict[str, Any]]] = {}
+        self.bytes_received = 0
+        self.bytes_skipped = 0
+        self._out = bytearray()
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._role = "value"
+        self._buf = bytearray()
+        self._skip_depth: Optional[int] = None
+        self._skip_field: Optional[str] = None
+        self._current_file: Optional[Dict[str, Any]] = None
+        self._skipped_len = 0
+
+    def feed(self, chunk: bytes) -> None:
+        """
+        レスポンスのチャンクを処理します
+        """
+        self.bytes_received += len(chunk)
+        i = 0
+        n = len(chunk)
+
+        while i < n:
+            if self._in_string:
+                i = self._consume_string(chunk, i, n)
+                continue
+
+            c = chunk[i]
+            if c == _QUOTE:
+                self._start_string()
+            elif c == _OPEN_OBJECT or c == _OPEN_ARRAY:
+                self._open(c == _OPEN_OBJECT)
+                self._out.append(c)
+            elif c == _CLOSE_OBJECT or c == _CLOSE_ARRAY:
+                self._out.append(c)
+                self._close()
+            else:
+                if c == _COMMA and self._stack and self._stack[-1].is_object:
+                    self._stack[-1].expecting_key = True
+                self._out.append(c)
+            i += 1
+
+    def result(self) -> Any:
+        """
+        読み飛ばし後のJSONをパースして返します
+        """
+        if self._in_string or self._stack:
+            raise ValueError("レスポンスのJSONが途中で終了しています")
+        return json.loads(bytes(self._out))
+
+    @property
+    def in_blob(self) -> bool:
+        return self._skip_depth is not None
+
+    def _start_string(self) -> None:
+        self._in_string = True
+        self._escape = False
+        self._buf.clear()
+        self._skipped_len = 0
+        top = self._stack[-1] if self._stack else None
+
+        if top is not None and top.is_object and top.expecting_key:
+            self._role = "key"
+        elif self.in_blob:
+            # ファイル名は残し、それ以外（base64本体）は読み飛ばす
+            in_file = self._current_file is not None and len(self._stack) == self._skip_depth + 2
+            self._role = "name" if in_file and top.key == "name" else "skip"
+        elif top is not None and top.is_object and top.key in self.skip_fields:
+            self._role = "skip"
+        else:
+            self._role = "value"
+
+        self._out.append(_QUOTE)
+
+    def _consume_string(self, chunk: bytes, i: int, n: int) -> int:
+        if self._escape:
+            self._escape = False
+            self._emit(chunk[i:i + 1])
+            return i + 1
+
+        match = _STRING_SPECIAL.search(chunk, i)
+        if match is None:
+            self._emit(chunk[i:n])
+            return n
+
+        j = match.start()
+        if j > i:
+            self._emit(chunk[i:j])
+
+        if chunk[j] == _BACKSLASH:
+            self._escape = True
+            self._emit(chunk[j:j + 1])
+            return j + 1
+
+        self._end_string()
+        return j + 1
+
+    def _emit(self, data: bytes) -> None:
+        if self._role == "skip":
+            self._skipped_len += len(data)
+            return
+        self._out += data
+        if self._role != "value":
+            self._buf += data
+
+    def _end_string(self) -> None:
+        self._in_string = False
+        self._out.append(_QUOTE)
+        top = self._stack[-1] if self._stack else None
+
+        if self._role == "key":
+            top.key = json.loads(b'"' + bytes(self._buf) + b'"')
+            top.expecting_key = False
+        elif self._role == "name":
+            self._current_file["name"] = json.loads(b'"' + bytes(self._buf) + b'"')
+        elif self._role == "skip":
+            self.bytes_skipped += self._skipped_len
+            in_file = self._current_file is not None and len(self._stack) == self._skip_depth + 2
+            if in_file and top.key in BLOB_CONTENT_KEYS:
+                # base64 の長さから元のファイルサイズを概算（MIMEタイプなど他の文字列は数えない）
+                self._current_file["size"] += self._skipped_len * 3 // 4
+
+        self._buf.clear()
+
+    def _open(self, is_object: bool) -> None:
+        top = self._stack[-1] if self._stack else None
+        if not self.in_blob and top is not None and top.is_object and top.key in self.skip_fields:
+            self._skip_depth = len(self._stack)
+            self._skip_field = top.key
+            self.files.setdefault(top.key, [])
+
+        self._stack.append(_Frame(is_object))
+
+        if self.in_blob and is_object and len(self._stack) == self._skip_depth + 2:
+            self._current_file = {"name": None, "size": 0}
+
+    def _close(self) -> None:
+        frame = self._stack.pop()
+
+        if not self.in_blob:
+            return
+
+        if frame.is_object and len(self._stack) == self._skip_depth + 1 and self._current_file is not None:
+            self.files[self._skip_field].append(self._current_file)
+            self._current_file = None
+        elif len(self._stack) == self._skip_depth:
+            self._skip_depth = None
+            self._skip_field = None
@@ -1,14 +1,149 @@
 """
 Jグランツ API連携モジュール
 """
-import requests
-from typing import Optional, Dict, Any, List
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import unicodedata
+import httpx
+from typing import Optional, Dict, Any, List, Tuple
+from dotenv import load_dotenv
+
+from .cache import SQLiteStore, TTLCache, cached_fetch, conditional_fetch
+from .singleflight import SingleFlight
+from .detail_parser import DetailStreamParser
+from .columnar import LOCAL_SORT_FIELDS, SubsidyFilters, column_views, filter_result
+from .similarity import SIMILAR_MAX_K, similarity_index
+from .upstream import UpstreamUnavailable, jgrants_upstream, unavailable_error
+from . import mirror
+
+# 環境変数の読み込み
+load_dotenv()
 
 # JグランツAPIのベースURL
-JGRANTS_API_BASE = "https://api.jgrants-portal.go.jp/exp/v1/public"
+JGRANTS_API_BASE = os.getenv("JGRANTS_API_BASE", "https://api.jgrants-portal.go.jp/exp/v1/public")
+
+# HTTPクライアント設定（コネクションプールのサイズとデフォルトタイムアウト秒数）
+JGRANTS_POOL_SIZE = int(os.getenv("JGRANTS_POOL_SIZE", "20"))
+JGRANTS_TIMEOUT = float(os.getenv("JGRANTS_TIMEOUT", "30"))
+JGRANTS_CONNECT_TIMEOUT = float(os.getenv("JGRANTS_CONNECT_TIMEOUT", "5"))
+
+# 検索結果キャッシュ設定（カタログの更新は数時間単位なので長めのTTL）
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "1800"))
+SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_TTL", "21600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+search_cache = TTLCache(
+    ttl=SEARCH_CACHE_TTL,
+    max_entries=SEARCH_CACHE_MAX_ENTRIES,
+    max_bytes=SEARCH_CACHE_MAX_BYTES,
+    stale_ttl=SEARCH_CACHE_STALE_TTL,
+    keep_expired=True,
+    name="search"
+)
+
+# 詳細キャッシュ設定（補助金IDごと。検索結果より長いTTL）
+DETAIL_CACHE_TTL = float(os.getenv("DETAIL_CACHE_TTL", "21600"))
+DETAIL_CACHE_STALE_TTL = float(os.getenv("DETAIL_CACHE_STALE_TTL", "86400"))
+DETAIL_CACHE_MAX_ENTRIES = int(os.getenv("DETAIL_CACHE_MAX_ENTRIES", "2048"))
+DETAIL_CACHE_MAX_BYTES = int(os.getenv("DETAIL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+detail_cache = TTLCache(
+    ttl=DETAIL_CACHE_TTL,
+    max_entries=DETAIL_CACHE_MAX_ENTRIES,
+    max_bytes=DETAIL_CACHE_MAX_BYTES,
+    stale_ttl=DETAIL_CACHE_STALE_TTL,
+    keep_expired=True,
+    name="detail"
+)
+
+# 一括詳細取得の最大ID数と上流への同時リクエスト数
+DETAILS_MAX_IDS = int(os.getenv("JGRANTS_DETAILS_MAX_IDS", "20"))
+DETAILS_CONCURRENCY = int(os.getenv("JGRANTS_DETAILS_CONCURRENCY", "5"))
+
+# 複数キーワード検索の最大クエリ数（キーワード数×地域数）・上流への同時リクエスト数・返す最大件数
+MULTI_SEARCH_MAX_QUERIES = int(os.getenv("JGRANTS_MULTI_SEARCH_MAX_QUERIES", "12"))
+MULTI_SEARCH_CONCURRENCY = int(os.getenv("JGRANTS_MULTI_SEARCH_CONCURRENCY", "4"))
+MULTI_SEARCH_MAX_RESULTS = int(os.getenv("JGRANTS_MULTI_SEARCH_MAX_RESULTS", "50"))
+
+# 検索結果のページサイズの上限（limit 指定時）
+SEARCH_PAGE_MAX_LIMIT = int(os.getenv("SEARCH_PAGE_MAX_LIMIT", "100"))
+
+# 同一キーの上流リクエストを1本に合流させる
+inflight = SingleFlight()
+
+# 全リクエストで共有する非同期HTTPクライアント（keep-alive接続を再利用）
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """
+    HTTP/2 が利用可能か（h2パッケージがインストールされているか）を返す
+    """
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    共有の非同期HTTPクライアントを取得します（未作成なら作成）
+
+    Returns:
+        JグランツAPI用の httpx.AsyncClient
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=JGRANTS_API_BASE,
+            limits=httpx.Limits(
+                max_connections=JGRANTS_POOL_SIZE,
+                max_keepalive_connections=JGRANTS_POOL_SIZE
+            ),
+            timeout=httpx.Timeout(JGRANTS_TIMEOUT, connect=JGRANTS_CONNECT_TIMEOUT),
+            http2=_http2_available()
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """
+    共有HTTPクライアントを閉じます（アプリケーション終了時に呼び出す）
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
 
 
-def search_subsidies(
+def persist_caches(path: str) -> SQLiteStore:
+    """
+    検索・詳細キャッシュをSQLiteファイルにも保存するようにします
+
+    保存済みのエントリを読み込み、詳細は類似検索の索引にも取り込むため、
+    プロセスを再起動しても同じ結果を上流から再取得しません（MCPサーバーが使用）。
+
+    Args:
+        path: SQLiteデータベースファイルのパス
+
+    Returns:
+        永続化先（終了時に close で書き込みを完了させる）
+    """
+    store = SQLiteStore(path)
+    search_cache.persist(store)
+    detail_cache.persist(store)
+    similarity_index.add_many(
+        result["subsidy"] for result in detail_cache.values() if result.get("success")
+    )
+    return store
+
+
+async def search_subsidies(
     keyword: str,
     sort: str = "created_date",
     order: str = "DESC",
@@ -16,20 +151,40 @@ def search_subsidies(
     target_area_search: Optional[str] = None,
     target_number_of_employees: Optional[str] = None,
     use_purpose: Optional[str] = None,
-    industry: Optional[str] = None
+    industry: Optional[str] = None,
+    timeout: Optional[float] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    subsidy_limit_min: Optional[float] = None,
+    subsidy_limit_max: Optional[float] = None,
+    deadline_within_days: Optional[float] = None,
+    employees: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     Jグランツで補助金を検索します
 
+    limit または cursor を指定するとページ単位で返します（次ページがあれば next_cursor を含む）。
+    上流APIはページングに対応していないため、全件はキャッシュに1つだけ保持し、ページはそこから切り出します。
+
+    補助上限額・締切までの日数・従業員数の条件と sort="subsidy_max_limit" は上流APIが対応していないため、
+    キャッシュ済みの全件を列指向ストア（columnar）に展開してローカルで適用します。
+
     Args:
         keyword: 検索キーワード（2～255文字）
-        sort: ソート項目（created_date, acceptance_start_datetime, acceptance_end_datetime）
+        sort: ソート項目（created_date, acceptance_start_datetime, acceptance_end_datetime, subsidy_max_limit）
         order: ソート順（ASC: 昇順, DESC: 降順）
         acceptance: 募集期間内フィルタ（1: 募集中のみ, 0 or None: 全て）
         target_area_search: 対象地域（都道府県名など）
         target_number_of_employees: 従業員数要件
         use_purpose: 利用目的（複数の場合は「 / 」で区切る）
         industry: 業種（複数の場合は「 / 」で区切る）
+        timeout: このリクエストのタイムアウト秒数（省略時はJGRANTS_TIMEOUT）
+        limit: 1ページの件数（1～SEARCH_PAGE_MAX_LIMIT）
+        cursor: 前のページの next_cursor
+        subsidy_limit_min: 補助上限額の下限（円。上限額が不明な補助金は除外）
+        subsidy_limit_max: 補助上限額の上限（円。上限額が不明な補助金は除外）
+        deadline_within_days: 申請締切が今から指定日数以内のもののみ
+        employees: 自社の従業員数（従業員数要件を満たすもののみ）
 
     Returns:
         補助金情報のリスト（JSON形式）
@@ -42,9 +197,9 @@ def search_subsidies(
             "success": False
         }
 
-    if sort not in ["created_date", "acceptance_start_datetime", "acceptance_end_datetime"]:
+    if sort not in ["created_date", "acceptance_start_datetime", "acceptance_end_datetime", *LOCAL_SORT_FIELDS]:
         return {
-            "error": "sortはcreated_date, acceptance_start_datetime, acceptance_end_datetimeのいずれかを指定してください",
+            "error": "sortはcreated_date, acceptance_start_datetime, acceptance_end_datetime, subsidy_max_limitのいずれかを指定してください",
             "success": False
         }
 
@@ -54,10 +209,32 @@ def search_subsidies(
             "success": False
         }
 
+    if limit is not None and not 1 <= limit <= SEARCH_PAGE_MAX_LIMIT:
+        return {
+            "error": f"limitは1～{SEARCH_PAGE_MAX_LIMIT}で指定してください",
+            "success": False
+        }
+
+    filters = SubsidyFilters(
+        subsidy_limit_min=subsidy_limit_min,
+        subsidy_limit_max=subsidy_limit_max,
+        deadline_within_days=deadline_within_days,
+        employees=employees
+    )
+    error = filters.validate()
+    if error:
+        return {
+            "error": error,
+            "success": False
+        }
+
+    # ローカルで並べ替える項目の場合、上流には作成日順で問い合わせる
+    local_sort = sort if sort in LOCAL_SORT_FIELDS else None
+
     # APIリクエストパラメータの構築
     params = {
         "keyword": keyword,
-        "sort": sort,
+        "sort": "created_date" if local_sort else sort,
         "order": order
     }
 
@@ -73,13 +250,124 @@ def search_subsidies(
     if industry:
         params["industry"] = industry
 
+    key = search_cache_key(params)
+
+    async def fetch() -> Dict[str, Any]:
+        # ミラーモードではローカル索引を優先し、古い・該当なしの場合のみライブAPIへ
+        mirrored = await mirror.search_mirror(params)
+        if mirrored is not None:
+            return mirrored
+        return await inflight.do(key, lambda: _fetch_subsidies(params, timeout))
+
+    # ページのカーソルはローカルの絞り込み・並べ替え条件も含めて検索条件に結び付ける
+    page_key = key + (local_sort, filters.key()) if local_sort or filters.active() else key
+
+    # カーソルが別の検索条件のものでないかを先に検証する
+    offset = decode_cursor(page_key, cursor) if cursor else 0
+    if offset is None:
+        return {
+            "error": "cursorが不正です（検索条件が変わった場合は最初のページから取得してください）",
+            "success": False
+        }
+
+    result = filter_result(key, await cached_fetch(search_cache, key, fetch), filters, sort=local_sort, order=order)
+    if limit is None and cursor is None:
+        return result
+
+    return paginate_result(result, page_key, offset, limit or SEARCH_PAGE_MAX_LIMIT)
+
+
+def _cursor_tag(key: Tuple[Any, ...]) -> str:
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:12]
+
+
+def encode_cursor(key: Tuple[Any, ...], offset: int) -> str:
+    """
+    検索条件と開始位置から次ページ用のカーソル文字列を作成します
+    """
+    payload = json.dumps({"k": _cursor_tag(key), "o": offset}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(key: Tuple[Any, ...], cursor: str) -> Optional[int]:
+    """
+    カーソル文字列から開始位置を取り出します（不正・別の検索条件のカーソルならNone）
+    """
     try:
-        # JグランツAPIへのリクエスト
-        url = f"{JGRANTS_API_BASE}/subsidies"
-        response = requests.get(url, params=params, timeout=30)
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        offset = int(payload["o"])
+    except (ValueError, KeyError, TypeError):
+        return None
+    if payload.get("k") != _cursor_tag(key) or offset < 0:
+        return None
+    return offset
+
+
+def paginate_result(
+    result: Dict[str, Any],
+    key: Tuple[Any, ...],
+    offset: int,
+    limit: int
+) -> Dict[str, Any]:
+    """
+    検索結果から1ページ分を切り出します（キャッシュ済みの結果は変更しない）
+    """
+    if not result.get("success"):
+        return result
+
+    subsidies = result["subsidies"]
+    end = offset + limit
+    page = {field: value for field, value in result.items() if field != "subsidies"}
+    page["subsidies"] = subsidies[offset:end]
+    page["next_cursor"] = encode_cursor(key, end) if end < len(subsidies) else None
+    return page
+
+
+def search_cache_key(params: Dict[str, Any]) -> Tuple[Any, ...]:
+    """
+    検索パラメータを正規化してキャッシュキーを作成します
+
+    JグランツAPIは大文字・小文字や全角・半角の表記ゆれを許容するため、
+    キーワード等はNFKC正規化・小文字化した上でキーにします。
+    """
+    def normalize(value: Optional[str]) -> Optional[str]:
+        if not value:
+            return None
+        return unicodedata.normalize("NFKC", value).strip().lower()
+
+    return (
+        "search",
+        normalize(params["keyword"]),
+        params["sort"],
+        params["order"],
+        params.get("acceptance") or None,
+        normalize(params.get("target_area_search")),
+        normalize(params.get("target_number_of_employees")),
+        normalize(params.get("use_purpose")),
+        normalize(params.get("industry"))
+    )
+
+
+async def _fetch_subsidies(params: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    JグランツAPIから補助金一覧を取得して整形します（キャッシュなし）
+
+    一時的なエラーは jgrants_upstream で再試行し、上流が利用できない場合は
+    "unavailable" 付きのエラーを返します（呼び出し元のキャッシュが古い値で代替する）。
+    """
+    async def send() -> Dict[str, Any]:
+        response = await get_client().get(
+            "/subsidies",
+            params=params,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        )
         response.raise_for_status()
+        return response.json()
 
-        data = response.json()
+    try:
+        # JグランツAPIへのリクエスト
+        data = await jgrants_upstream.call(send, attributes={"keyword": params.get("keyword")})
 
         # 結果の整形
         result = {
@@ -103,7 +391,9 @@ def search_subsidies(
 
         return result
 
-    except requests.exceptions.RequestException as e:
+    except UpstreamUnavailable as e:
+        return unavailable_error(e)
+    except httpx.HTTPError as e:
         return {
             "error": f"API通信エラー: {str(e)}",
             "success": False
@@ -115,12 +405,18 @@ def search_subsidies(
         }
 
 
-def get_subsidy_detail(subsidy_id: str) -> Dict[str, Any]:
+async def get_subsidy_detail(
+    subsidy_id: str,
+    timeout: Optional[float] = None,
+    refresh: bool = False
+) -> Dict[str, Any]:
     """
     補助金の詳細情報を取得します
 
     Args:
         subsidy_id: 補助金ID（search_subsidiesで取得したID）
+        timeout: このリクエストのタイムアウト秒数（省略時はJGRANTS_TIMEOUT）
+        refresh: True ならキャッシュ済みの詳細を使わずに上流で再検証する（ミラー同期で変更を検知した場合）
 
     Returns:
         補助金の詳細情報（JSON形式）
@@ -132,23 +428,91 @@ def get_subsidy_detail(subsidy_id: str) -> Dict[str, Any]:
             "success": False
         }
 
+    result = await conditional_fetch(
+        detail_cache,
+        subsidy_id,
+        lambda validators: inflight.do(
+            ("detail", subsidy_id, tuple(sorted((validators or {}).items()))),
+            lambda: _fetch_subsidy_detail(subsidy_id, validators, timeout)
+        ),
+        refresh=refresh
+    )
+
+    # 取得した本文を類似検索の索引に反映（本文が変わっていなければ何もしない）
+    if result.get("success"):
+        similarity_index.add(result["subsidy"])
+
+    return result
+
+
+async def _fetch_subsidy_detail(
+    subsidy_id: str,
+    validators: Optional[Dict[str, str]] = None,
+    timeout: Optional[float] = None
+) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, str]]]:
+    """
+    JグランツAPIから補助金詳細を取得して整形します（キャッシュなし）
+
+    Args:
+        subsidy_id: 補助金ID
+        validators: 前回レスポンスの検証子（ETag / Last-Modified）。指定時は条件付きリクエスト
+        timeout: このリクエストのタイムアウト秒数
+
+    Returns:
+        (整形済みの詳細情報, 新しい検証子)。304 Not Modified の場合は (None, 検証子)
+    """
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    async def send() -> Tuple[Optional[DetailStreamParser], Optional[Dict[str, str]]]:
+        # JグランツAPIへのリクエスト（base64のファイル本体を展開しないようストリーミングで解析）
+        async with get_client().stream(
+            "GET",
+            f"/subsidies/id/{subsidy_id}",
+            headers=headers,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        ) as response:
+            if response.status_code == 304:
+                return None, validators
+
+            response.raise_for_status()
+
+            new_validators = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified")
+            }
+
+            parser = DetailStreamParser()
+            async for chunk in response.aiter_bytes():
+                parser.feed(chunk)
+
+        return parser, new_validators if any(new_validators.values()) else None
+
     try:
-        # JグランツAPIへのリクエスト
-        url = f"{JGRANTS_API_BASE}/subsidies/id/{subsidy_id}"
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
+        parser, new_validators = await jgrants_upstream.call(
+            send,
+            endpoint="subsidies/id",
+            attributes={"subsidy_id": subsidy_id}
+        )
+        if parser is None:
+            return None, validators
 
-        data = response.json()
+        data = parser.result()
 
         if not data.get("result"):
             return {
                 "error": "指定されたIDの補助金が見つかりませんでした",
                 "success": False
-            }
+            }, None
 
         subsidy = data["result"][0] if isinstance(data["result"], list) else data["result"]
 
-        # 詳細情報を整形（ファイルのbase64データは除外して見やすくする）
+        # 詳細情報を整形（ファイルのbase64データは除外し、ファイル名とサイズのみ返す）
+        files = parser.files.get("application_form_files", [])
         result = {
             "success": True,
             "subsidy": {
@@ -165,27 +529,90 @@ def get_subsidy_detail(subsidy_id: str) -> Dict[str, Any]:
                 "outline": subsidy.get("outline"),
                 "note": subsidy.get("note"),
                 "grant_guideline_url": subsidy.get("grant_guideline_url"),
-                "application_form_files": len(subsidy.get("application_form_files", [])) if subsidy.get("application_form_files") else 0
+                "application_form_files": len(subsidy.get("application_form_files", [])) if subsidy.get("application_form_files") else 0,
+                "application_form_file_info": files
             }
         }
 
-        return result
+        return result, new_validators
 
-    except requests.exceptions.RequestException as e:
+    except UpstreamUnavailable as e:
+        return unavailable_error(e), None
+    except httpx.HTTPError as e:
         return {
             "error": f"API通信エラー: {str(e)}",
             "success": False
-        }
+        }, None
     except Exception as e:
         return {
             "error": f"予期しないエラー: {str(e)}",
             "success": False
+        }, None
+
+
+async def get_subsidy_details(
+    subsidy_ids: List[str],
+    timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    複数の補助金の詳細情報をまとめて取得します
+
+    キャッシュにないIDは DETAILS_CONCURRENCY 件ずつ並行して取得します。
+    IDごとの失敗は全体を失敗にせず、該当する要素に error を設定して返します。
+
+    Args:
+        subsidy_ids: 補助金IDのリスト（最大 DETAILS_MAX_IDS 件）
+        timeout: 1件あたりのタイムアウト秒数（省略時はJGRANTS_TIMEOUT）
+
+    Returns:
+        指定順の詳細情報のリスト（JSON形式）
+    """
+
+    if not subsidy_ids:
+        return {
+            "error": "subsidy_idsを1件以上指定してください",
+            "success": False
         }
 
+    if len(subsidy_ids) > DETAILS_MAX_IDS:
+        return {
+            "error": f"subsidy_idsは{DETAILS_MAX_IDS}件以内で指定してください",
+            "success": False
+        }
 
-def search_active_subsidies(
+    semaphore = asyncio.Semaphore(DETAILS_CONCURRENCY)
+
+    async def fetch(subsidy_id: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                result = await get_subsidy_detail(subsidy_id, timeout)
+            except Exception as e:
+                result = {"error": f"予期しないエラー: {str(e)}", "success": False}
+        return {"id": subsidy_id, **result}
+
+    # 重複したIDは1回だけ取得する
+    unique_ids = list(dict.fromkeys(subsidy_ids))
+    fetched = dict(zip(unique_ids, await asyncio.gather(*[fetch(subsidy_id) for subsidy_id in unique_ids])))
+    results = [fetched[subsidy_id] for subsidy_id in subsidy_ids]
+
+    return {
+        "success": True,
+        "count": len(results),
+        "succeeded": sum(1 for result in results if result.get("success")),
+        "results": results
+    }
+
+
+async def search_active_subsidies(
     keyword: str,
-    target_area: Optional[str] = None
+    target_area: Optional[str] = None,
+    timeout: Optional[float] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    subsidy_limit_min: Optional[float] = None,
+    subsidy_limit_max: Optional[float] = None,
+    deadline_within_days: Optional[float] = None,
+    employees: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     現在募集中の補助金を検索します（便利関数）
@@ -194,14 +621,226 @@ def search_active_subsidies(
     Args:
         keyword: 検索キーワード
         target_area: 対象地域
+        timeout: このリクエストのタイムアウト秒数
+        limit: 1ページの件数
+        cursor: 前のページの next_cursor
+        subsidy_limit_min / subsidy_limit_max: 補助上限額の範囲（円）
+        deadline_within_days: 申請締切が今から指定日数以内のもののみ
+        employees: 自社の従業員数
 
     Returns:
         募集中の補助金情報（申請期限が近い順）
     """
-    return search_subsidies(
+    return await search_subsidies(
         keyword=keyword,
         acceptance=1,
         target_area_search=target_area,
         sort="acceptance_end_datetime",
-        order="ASC"
+        order="ASC",
+        timeout=timeout,
+        limit=limit,
+        cursor=cursor,
+        subsidy_limit_min=subsidy_limit_min,
+        subsidy_limit_max=subsidy_limit_max,
+        deadline_within_days=deadline_within_days,
+        employees=employees
+    )
+
+
+async def search_subsidies_multi(
+    keywords: List[str],
+    target_areas: Optional[List[str]] = None,
+    acceptance: Optional[int] = 1,
+    timeout: Optional[float] = None,
+    limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    複数のキーワード（・地域）で補助金を並行して検索し、1つのリストにまとめます
+
+    キーワードと地域のすべての組み合わせを MULTI_SEARCH_CONCURRENCY 件ずつ並行して検索し、
+    補助金IDで重複を除きます。一致したクエリ数が多い順、同数なら申請期限が近い順に並べます。
+    一部のクエリの失敗は全体を失敗にせず failed_queries に記録します。
+
+    Args:
+        keywords: 検索キーワードのリスト（各2～255文字）
+        target_areas: 対象地域のリスト（省略時は地域を指定しない）
+        acceptance: 募集期間内フィルタ（1: 募集中のみ, 0 or None: 全て）
+        timeout: 1クエリあたりのタイムアウト秒数（省略時はJGRANTS_TIMEOUT）
+        limit: 返す最大件数（省略時は MULTI_SEARCH_MAX_RESULTS）
+
+    Returns:
+        まとめた補助金情報のリスト（各補助金に match_count と matched_keywords を付与）
+    """
+
+    # 重複・空文字を除く
+    keywords = list(dict.fromkeys(keyword.strip() for keyword in keywords or [] if keyword and keyword.strip()))
+    areas: List[Optional[str]] = list(dict.fromkeys(
+        area.strip() for area in target_areas or [] if area and area.strip()
+    )) or [None]
+
+    if not keywords:
+        return {
+            "error": "keywordsを1件以上指定してください",
+            "success": False
+        }
+
+    invalid = [keyword for keyword in keywords if len(keyword) < 2 or len(keyword) > 255]
+    if invalid:
+        return {
+            "error": f"keywordsは各2～255文字で指定してください: {', '.join(invalid)}",
+            "success": False
+        }
+
+    if len(keywords) * len(areas) > MULTI_SEARCH_MAX_QUERIES:
+        return {
+            "error": f"キーワード数×地域数は{MULTI_SEARCH_MAX_QUERIES}以内で指定してください",
+            "success": False
+        }
+
+    limit = limit or MULTI_SEARCH_MAX_RESULTS
+    if not 1 <= limit <= SEARCH_PAGE_MAX_LIMIT:
+        return {
+            "error": f"limitは1～{SEARCH_PAGE_MAX_LIMIT}で指定してください",
+            "success": False
+        }
+
+    queries = [(keyword, area) for keyword in keywords for area in areas]
+    semaphore = asyncio.Semaphore(MULTI_SEARCH_CONCURRENCY)
+
+    async def run(keyword: str, area: Optional[str]) -> Dict[str, Any]:
+        # 募集中の検索（search_active_subsidies）とキャッシュキーを共有するよう期限の昇順で取得
+        async with semaphore:
+            try:
+                return await search_subsidies(
+                    keyword=keyword,
+                    sort="acceptance_end_datetime",
+                    order="ASC",
+                    acceptance=acceptance,
+                    target_area_search=area,
+                    timeout=timeout
+                )
+            except Exception as e:
+                return {"error": f"予期しないエラー: {str(e)}", "success": False}
+
+    results = await asyncio.gather(*[run(keyword, area) for keyword, area in queries])
+
+    merged: Dict[str, Dict[str, Any]] = {}
+    failed_queries = []
+    for (keyword, area), result in zip(queries, results):
+        if not result.get("success"):
+            failed_queries.append({"keyword": keyword, "target_area": area, "error": result.get("error")})
+            continue
+        # 同じ補助金が同一クエリ内で重複していても1回と数える
+        for subsidy in {record["id"]: record for record in result["subsidies"] if record.get("id")}.values():
+            entry = merged.get(subsidy["id"])
+            if entry is None:
+                entry = merged[subsidy["id"]] = {**subsidy, "match_count": 0, "matched_keywords": []}
+            entry["match_count"] += 1
+            if keyword not in entry["matched_keywords"]:
+                entry["matched_keywords"].append(keyword)
+
+    if len(failed_queries) == len(queries):
+        return {
+            "error": failed_queries[0]["error"],
+            "success": False,
+            "failed_queries": failed_queries
+        }
+
+    # 一致数の降順 → 申請期限の昇順（期限なしは最後）
+    ranked = sorted(
+        merged.values(),
+        key=lambda record: (-record["match_count"], record.get("acceptance_end") is None, record.get("acceptance_end") or "")
     )
+
+    return {
+        "success": True,
+        "count": len(ranked),
+        "queries": len(queries),
+        "failed_queries": failed_queries,
+        "subsidies": ranked[:limit]
+    }
+
+
+# 類似検索の索引にミラーの詳細を取り込んだ時点のミラー同期時刻
+_similarity_seeded_at: Optional[float] = None
+
+
+async def _seed_similarity_index() -> None:
+    """
+    ミラーモードの場合、前回以降に同期された詳細を類似検索の索引に取り込みます
+    """
+    global _similarity_seeded_at
+    if mirror.mirror is None:
+        return
+    synced_at = await asyncio.to_thread(mirror.mirror.last_synced_at)
+    if synced_at is None or synced_at == _similarity_seeded_at:
+        return
+    _similarity_seeded_at = synced_at
+    similarity_index.add_many(await asyncio.to_thread(mirror.mirror.detailed_records))
+
+
+async def find_similar_subsidies(
+    subsidy_id: str,
+    k: int = 5,
+    timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    指定した補助金に内容が似ている補助金を探します
+
+    get_subsidy_detail で取得済みの詳細（とミラーの詳細）から作ったローカル索引を
+    BM25で検索するため、上流APIは呼び出しません。基準の補助金が未索引の場合のみ、
+    その詳細を1回取得します。
+
+    Args:
+        subsidy_id: 基準とする補助金ID
+        k: 返す件数（1～SIMILAR_MAX_K）
+        timeout: 基準の補助金の詳細を取得する場合のタイムアウト秒数
+
+    Returns:
+        類似度（score）の高い順の補助金情報のリスト（JSON形式）
+    """
+
+    if not subsidy_id:
+        return {
+            "error": "subsidy_idを指定してください",
+            "success": False
+        }
+
+    if not 1 <= k <= SIMILAR_MAX_K:
+        return {
+            "error": f"kは1～{SIMILAR_MAX_K}で指定してください",
+            "success": False
+        }
+
+    await _seed_similarity_index()
+
+    if subsidy_id not in similarity_index:
+        detail = await get_subsidy_detail(subsidy_id, timeout)
+        if not detail.get("success"):
+            return detail
+
+    subsidies = similarity_index.similar(subsidy_id, k)
+    return {
+        "success": True,
+        "subsidy_id": subsidy_id,
+        "count": len(subsidies),
+        "indexed": len(similarity_index),
+        "subsidies": subsidies
+    }
+
+
+async def get_cache_stats() -> Dict[str, Any]:
+    """
+    キャッシュの統計情報（ヒット・ミス・破棄件数など）を返します
+
+    ミラーの統計（件数・同期状態）はSQLiteを読むため、イベントループを止めないよう別スレッドで取得します。
+    """
+    return {
+        "search": search_cache.stats(),
+        "detail": detail_cache.stats(),
+        "inflight": inflight.stats(),
+        "columns": column_views.stats(),
+        "similarity": similarity_index.stats(),
+        "upstream": jgrants_upstream.stats(),
+        "mirror": await asyncio.to_thread(mirror.mirror.stats) if mirror.mirror is not None else None
+    }
@@ -0,0 +1,304 @@
+"""
+Prometheus形式のメトリクス収集モジュール
+
+外部ライブラリを使わずにカウンターとヒストグラムを実装し、/metrics でテキスト形式（0.0.4）で出力します。
+記録はラベル値のタプルをキーとする辞書の更新だけで、ロックやI/Oを伴わないため本番環境で常時有効にできます。
+キャッシュのヒット率など既存の統計情報は、出力時にコレクター（コールバック）で収集します。
+"""
+import math
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+# 環境変数の読み込み
+load_dotenv()
+
+# メトリクスの記録を無効にする場合は false
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() != "false"
+
+# ヒストグラムのバケット（秒・回）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LLM_LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+ITERATION_BUCKETS = (0, 1, 2, 3, 4, 5, 8)
+
+# Starlette が charset=utf-8 を付与する
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# コレクターが返すメトリクス: (名前, 型, 説明, [(ラベル, 値)])
+Sample = Tuple[Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """
+    ラベルごとの単調増加カウンター
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """
+        ラベル値（定義順）のカウンターを amount 増やします
+        """
+        if METRICS_ENABLED:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Histogram:
+    """
+    ラベルごとの累積バケット付きヒストグラム
+    """
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # ラベル値 → [バケットごとの件数（非累積、末尾は +Inf）, 合計, 件数]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """
+        ラベル値（定義順）の観測値を記録します
+        """
+        if not METRICS_ENABLED:
+            return
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def observe_since(self, started_at: float, *labels: str) -> None:
+        """
+        time.perf_counter() の値 started_at からの経過秒数を記録します
+        """
+        self.observe(time.perf_counter() - started_at, *labels)
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[2] if series is not None else 0
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    メトリクスとコレクターの登録先
+    """
+
+    def __init__(self):
+        self.metrics: List[Any] = []
+        self.collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, description, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(name, description, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """
+        出力時に呼び出すコレクターを登録します（既存の統計情報をメトリクスに変換する関数）
+        """
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Prometheusのテキスト形式で出力します
+        """
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+
+        for collector in self.collectors:
+            for name, kind, description, samples in collector():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(
+                    f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}"
+                    for labels, value in samples
+                )
+        return "\n".join(lines) + "\n"
+
+
+# 共有のレジストリ
+registry = Registry()
+
+# FastAPIのルート
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds",
+    "FastAPIルートの処理時間（ストリーミングはレスポンス開始まで）",
+    ["method", "route", "status"]
+)
+
+# JグランツAPI（再試行は1回ずつ記録）
+UPSTREAM_REQUEST_DURATION = registry.histogram(
+    "jgrants_upstream_request_duration_seconds",
+    "JグランツAPIへの1回のリクエストの所要時間",
+    ["endpoint", "outcome"]
+)
+
+# LLM API
+LLM_REQUEST_DURATION = registry.histogram(
+    "llm_request_duration_seconds",
+    "LLM APIの1回の呼び出しの所要時間（ストリーミングは生成完了まで）",
+    ["provider", "model", "outcome"],
+    LLM_LATENCY_BUCKETS
+)
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total",
+    "LLMのトークン使用量（type: input, output, cache_read, cache_creation）",
+    ["provider", "model", "type"]
+)
+
+# ツールループ
+TOOL_CALLS = registry.counter(
+    "chat_tool_calls_total",
+    "ツール呼び出し回数",
+    ["tool", "outcome"]
+)
+TOOL_DURATION = registry.histogram(
+    "chat_tool_duration_seconds",
+    "ツール1回の実行時間",
+    ["tool"]
+)
+CHAT_ITERATIONS = registry.histogram(
+    "chat_iterations",
+    "1回のチャットでのツールループの反復回数",
+    ["model", "outcome"],
+    ITERATION_BUCKETS
+)
+
+
+def outcome_of(result: Optional[Dict[str, Any]]) -> str:
+    """
+    結果辞書を success / timeout / error に分類します
+    """
+    if result is None:
+        return "error"
+    if result.get("success"):
+        return "success"
+    return "timeout" if result.get("timed_out") else "error"
+
+
+def cache_families(stats: Dict[str, Optional[Dict[str, Any]]]) -> List[Family]:
+    """
+    TTLCache の統計情報（キャッシュ名 → stats()）をメトリクスに変換します
+    """
+    caches = {name: value for name, value in stats.items() if value and "misses" in value and "hits" in value}
+    return [
+        ("cache_hits_total", "counter", "キャッシュのヒット数（kind: fresh, stale）", [
+            sample for name, value in caches.items() for sample in (
+                ({"cache": name, "kind": "fresh"}, value["hits"]),
+                ({"cache": name, "kind": "stale"}, value.get("stale_hits", 0))
+            )
+        ]),
+        ("cache_misses_total", "counter", "キャッシュのミス数", [
+            ({"cache": name}, value["misses"]) for name, value in caches.items()
+        ]),
+        ("cache_evictions_total", "counter", "容量超過によるキャッシュの破棄数", [
+            ({"cache": name}, value.get("evictions", 0)) for name, value in caches.items()
+        ]),
+        ("cache_hit_ratio", "gauge", "キャッシュのヒット率（古い値の返却を含む）", [
+            ({"cache": name}, value.get("hit_ratio", 0.0)) for name, value in caches.items()
+        ]),
+        ("cache_entries", "gauge", "キャッシュのエントリ数", [
+            ({"cache": name}, value.get("entries", 0)) for name, value in caches.items()
+        ]),
+        ("cache_bytes", "gauge", "キャッシュの推定サイズ（バイト）", [
+            ({"cache": name}, value.get("bytes", 0)) for name, value in caches.items()
+        ])
+    ]
+
+
+def upstream_families(stats: Dict[str, Any]) -> List[Family]:
+    """
+    UpstreamGuard の統計情報をメトリクスに変換します
+    """
+    circuit = stats["circuit"]
+    rate_limit = stats["rate_limit"]
+    return [
+        ("jgrants_upstream_retries_total", "counter", "JグランツAPIへのリクエストの再試行回数", [
+            ({}, stats["retried"])
+        ]),
+        ("jgrants_upstream_circuit_state", "gauge", "サーキットブレーカーの状態（現在の state が1）", [
+            ({"state": state}, 1 if circuit["state"] == state else 0) for state in ("closed", "open", "half_open")
+        ]),
+        ("jgrants_upstream_circuit_opens_total", "counter", "サーキットブレーカーが開いた回数", [
+            ({}, circuit["opens"])
+        ]),
+        ("jgrants_upstream_rejections_total", "counter", "上流を呼ばずに失敗させた回数（reason: circuit, rate_limit）", [
+            ({"reason": "circuit"}, circuit["rejections"]),
+            ({"reason": "rate_limit"}, rate_limit["rejections"])
+        ]),
+        ("jgrants_upstream_rate_limit_waits_total", "counter", "レート制限でトークンを待った回数", [
+            ({}, rate_limit["waits"])
+        ])
+    ]
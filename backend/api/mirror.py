@@ -0,0 +1,669 @@
+"""
+Jグランツ カタログのローカルミラーモジュール（SQLite + FTS5 trigram索引）
+
+JGRANTS_MIRROR_DB を設定するとミラーモードが有効になり、search_subsidies は
+ローカル索引から回答します。ミラーが古い場合や該当なしの場合のみライブAPIを使用します。
+ミラーにはシードキーワードの検索で取得できた補助金しか含まれないため、ミラーからの結果には
+"source": "mirror" と同期時刻（"synced_at"）を付け、ライブAPIの結果と区別できるようにします。
+
+使い方:
+    python -m api.mirror sync [--full]         # 上流からカタログを同期
+    python -m api.mirror load-fixture FILE     # 記録済みフィクスチャを読み込む
+    python -m api.mirror dump FILE             # ミラーの内容をフィクスチャとして書き出す
+    python -m api.mirror search KEYWORD        # ミラーのみで検索
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+# 環境変数の読み込み
+load_dotenv()
+
+# ミラー設定（DBパス未設定ならミラーモード無効）
+MIRROR_DB_PATH = os.getenv("JGRANTS_MIRROR_DB", "")
+MIRROR_MAX_AGE = float(os.getenv("JGRANTS_MIRROR_MAX_AGE", "10800"))
+MIRROR_SYNC_INTERVAL = float(os.getenv("JGRANTS_MIRROR_SYNC_INTERVAL", "3600"))
+MIRROR_FULL_SYNC_INTERVAL = float(os.getenv("JGRANTS_MIRROR_FULL_SYNC_INTERVAL", "86400"))
+MIRROR_DETAIL_CONCURRENCY = int(os.getenv("JGRANTS_MIRROR_DETAIL_CONCURRENCY", "5"))
+MIRROR_SEED_KEYWORDS = [
+    keyword.strip()
+    for keyword in os.getenv("JGRANTS_MIRROR_SEED_KEYWORDS", "補助金,助成金,事業,支援,中小企業").split(",")
+    if keyword.strip()
+]
+
+# ソート項目とカラムの対応
+SORT_COLUMNS = {
+    "created_date": "created_date",
+    "acceptance_start_datetime": "acceptance_start_ts",
+    "acceptance_end_datetime": "acceptance_end_ts"
+}
+
+# 一覧APIのレコードに含まれる項目（フィンガープリントの対象）
+LIST_FIELDS = [
+    "id", "name", "title", "target_area_search", "subsidy_max_limit",
+    "acceptance_start_datetime", "acceptance_end_datetime", "target_number_of_employees", "created_date"
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subsidies (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    title TEXT,
+    target_area TEXT,
+    subsidy_max_limit INTEGER,
+    acceptance_start TEXT,
+    acceptance_end TEXT,
+    acceptance_start_ts REAL,
+    acceptance_end_ts REAL,
+    target_employees TEXT,
+    created_date TEXT,
+    subsidy_rate TEXT,
+    purpose TEXT,
+    outline TEXT,
+    note TEXT,
+    grant_guideline_url TEXT,
+    application_form_files INTEGER,
+    fingerprint TEXT,
+    detail_synced_at REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS subsidies_fts USING fts5(
+    name, title, outline, purpose, tokenize='trigram'
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """
+    索引・検索用に文字列を正規化します（NFKC + 小文字化）
+    """
+    if not value:
+        return ""
+    return unicodedata.normalize("NFKC", str(value)).strip().lower()
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    """
+    JグランツのISO8601日時文字列をエポック秒に変換します
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def fingerprint(record: Dict[str, Any]) -> str:
+    """
+    一覧レコードの変更検知用ハッシュを返します
+    """
+    payload = json.dumps([record.get(field) for field in LIST_FIELDS], ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def is_expired(synced_at: Optional[float]) -> bool:
+    """
+    最終同期時刻から見てミラーが古い（未同期・MIRROR_MAX_AGE 秒以上経過）かどうか
+    """
+    return synced_at is None or time.time() - synced_at > MIRROR_MAX_AGE
+
+
+class CatalogMirror:
+    """
+    補助金カタログのSQLiteミラー
+
+    接続は操作ごとに開くため、スレッドをまたいで安全に利用できます。
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLiteデータベースファイルのパス
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.synced_at: Optional[float] = None
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        self.last_synced_at()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def upsert_records(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        上流APIのレコード（一覧・詳細どちらの形式も可）を登録・更新します
+
+        Args:
+            records: JグランツAPIのレコード（キー名は上流APIのまま）
+
+        Returns:
+            登録・更新した件数
+        """
+        count = 0
+        with self._connect() as conn:
+            for record in records:
+                if not record.get("id"):
+                    continue
+                files = record.get("application_form_files")
+                row = {
+                    "id": record.get("id"),
+                    "name": record.get("name"),
+                    "title": record.get("title"),
+                    "target_area": record.get("target_area_search"),
+                    "subsidy_max_limit": record.get("subsidy_max_limit"),
+                    "acceptance_start": record.get("acceptance_start_datetime"),
+                    "acceptance_end": record.get("acceptance_end_datetime"),
+                    "acceptance_start_ts": parse_timestamp(record.get("acceptance_start_datetime")),
+                    "acceptance_end_ts": parse_timestamp(record.get("acceptance_end_datetime")),
+                    "target_employees": record.get("target_number_of_employees"),
+                    "created_date": record.get("created_date"),
+                    "fingerprint": fingerprint(record)
+                }
+                conn.execute(
+                    """
+                    INSERT INTO subsidies (
+                        id, name, title, target_area, subsidy_max_limit, acceptance_start, acceptance_end,
+                        acceptance_start_ts, acceptance_end_ts, target_employees, created_date, fingerprint
+                    ) VALUES (
+                        :id, :name, :title, :target_area, :subsidy_max_limit, :acceptance_start, :acceptance_end,
+                        :acceptance_start_ts, :acceptance_end_ts, :target_employees, :created_date, :fingerprint
+                    )
+                    ON CONFLICT(id) DO UPDATE SET
+                        name = excluded.name,
+                        title = excluded.title,
+                        target_area = excluded.target_area,
+                        subsidy_max_limit = excluded.subsidy_max_limit,
+                        acceptance_start = excluded.acceptance_start,
+                        acceptance_end = excluded.acceptance_end,
+                        acceptance_start_ts = excluded.acceptance_start_ts,
+                        acceptance_end_ts = excluded.acceptance_end_ts,
+                        target_employees = excluded.target_employees,
+                        created_date = COALESCE(excluded.created_date, subsidies.created_date),
+                        fingerprint = excluded.fingerprint
+                    """,
+                    row
+                )
+                if any(key in record for key in ("purpose", "outline", "note", "subsidy_rate")):
+                    self._update_detail(conn, record["id"], {
+                        "subsidy_rate": record.get("subsidy_rate"),
+                        "purpose": record.get("purpose"),
+                        "outline": record.get("outline"),
+                        "note": record.get("note"),
+                        "grant_guideline_url": record.get("grant_guideline_url"),
+                        "application_form_files": len(files) if isinstance(files, list) else (files or 0)
+                    })
+                else:
+                    self._reindex(conn, record["id"])
+                count += 1
+        return count
+
+    def update_detail(self, subsidy_id: str, detail: Dict[str, Any]) -> None:
+        """
+        get_subsidy_detail の整形済み詳細情報をミラーに反映します
+
+        Args:
+            subsidy_id: 補助金ID
+            detail: get_subsidy_detail の "subsidy" 部分
+        """
+        with self._connect() as conn:
+            self._update_detail(conn, subsidy_id, detail)
+
+    def _update_detail(self, conn: sqlite3.Connection, subsidy_id: str, detail: Dict[str, Any]) -> None:
+        conn.execute(
+            """
+            UPDATE subsidies SET
+                subsidy_rate = :subsidy_rate,
+                purpose = :purpose,
+                outline = :outline,
+                note = :note,
+                grant_guideline_url = :grant_guideline_url,
+                application_form_files = :application_form_files,
+                detail_synced_at = :detail_synced_at
+            WHERE id = :id
+            """,
+            {
+                "id": subsidy_id,
+                "subsidy_rate": detail.get("subsidy_rate"),
+                "purpose": detail.get("purpose"),
+                "outline": detail.get("outline"),
+                "note": detail.get("note"),
+                "grant_guideline_url": detail.get("grant_guideline_url"),
+                "application_form_files": detail.get("application_form_files") or 0,
+                "detail_synced_at": time.time()
+            }
+        )
+        self._reindex(conn, subsidy_id)
+
+    def _reindex(self, conn: sqlite3.Connection, subsidy_id: str) -> None:
+        row = conn.execute(
+            "SELECT rowid, name, title, outline, purpose FROM subsidies WHERE id = ?", (subsidy_id,)
+        ).fetchone()
+        if row is None:
+            return
+        conn.execute("DELETE FROM subsidies_fts WHERE rowid = ?", (row["rowid"],))
+        conn.execute(
+            "INSERT INTO subsidies_fts (rowid, name, title, outline, purpose) VALUES (?, ?, ?, ?, ?)",
+            (
+                row["rowid"],
+                normalize_text(row["name"]),
+                normalize_text(row["title"]),
+                normalize_text(row["outline"]),
+                normalize_text(row["purpose"])
+            )
+        )
+
+    def fingerprints(self) -> Dict[str, str]:
+        """
+        登録済みの補助金IDとフィンガープリントの対応を返します
+        """
+        with self._connect() as conn:
+            return {row["id"]: row["fingerprint"] for row in conn.execute("SELECT id, fingerprint FROM subsidies")}
+
+    def ids_without_detail(self) -> List[str]:
+        """
+        詳細情報が未取得の補助金IDを返します
+        """
+        with self._connect() as conn:
+            return [row["id"] for row in conn.execute("SELECT id FROM subsidies WHERE detail_synced_at IS NULL")]
+
+    def get_state(self, key: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+            return row["value"] if row else None
+
+    def set_state(self, key: str, value: Any) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO sync_state (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, str(value))
+            )
+        if key == "last_sync_at":
+            self.synced_at = float(value)
+
+    def last_synced_at(self) -> Optional[float]:
+        """
+        最後に同期が完了した時刻（エポック秒）を返します
+
+        読み出した値は synced_at にも保持し、イベントループ上ではI/Oなしで参照できるようにします。
+        """
+        value = self.get_state("last_sync_at")
+        self.synced_at = float(value) if value else None
+        return self.synced_at
+
+    def is_stale(self) -> bool:
+        """
+        ミラーが古い（未同期・最終同期から MIRROR_MAX_AGE 秒以上経過）かどうか
+        """
+        return is_expired(self.last_synced_at())
+
+    def search(
+        self,
+        keyword: str,
+        sort: str = "created_date",
+        order: str = "DESC",
+        acceptance: Optional[int] = None,
+        target_area_search: Optional[str] = None,
+        target_number_of_employees: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        ミラーから補助金を検索します（search_subsidies と同じ形式で返す）
+
+        キーワードは空白区切りで全て含むものを対象とし、3文字以上はFTS5 trigram索引、
+        2文字以下は部分一致で検索します。
+        """
+        conditions = []
+        args: List[Any] = []
+
+        for term in normalize_text(keyword).split():
+            if len(term) >= 3:
+                conditions.append("s.rowid IN (SELECT rowid FROM subsidies_fts WHERE subsidies_fts MATCH ?)")
+                args.append('"' + term.replace('"', '""') + '"')
+            else:
+                conditions.append(
+                    "s.rowid IN (SELECT rowid FROM subsidies_fts WHERE "
+                    "name LIKE ? OR title LIKE ? OR outline LIKE ? OR purpose LIKE ?)"
+                )
+                args.extend([f"%{term}%"] * 4)
+
+        if acceptance == 1:
+            now = time.time()
+            conditions.append("s.acceptance_start_ts <= ? AND s.acceptance_end_ts >= ?")
+            args.extend([now, now])
+        if target_area_search:
+            conditions.append("s.target_area LIKE ?")
+            args.append(f"%{target_area_search.strip()}%")
+        if target_number_of_employees:
+            conditions.append("s.target_employees = ?")
+            args.append(target_number_of_employees)
+
+        column = SORT_COLUMNS.get(sort, "created_date")
+        direction = "ASC" if order == "ASC" else "DESC"
+        where = " AND ".join(conditions) if conditions else "1 = 1"
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT s.* FROM subsidies s WHERE {where} "
+                f"ORDER BY s.{column} IS NULL, s.{column} {direction}",
+                args
+            ).fetchall()
+
+        return {
+            "success": True,
+            "count": len(rows),
+            "subsidies": [
+                {
+                    "id": row["id"],
+                    "name": row["name"],
+                    "title": row["title"],
+                    "target_area": row["target_area"],
+                    "subsidy_max_limit": row["subsidy_max_limit"],
+                    "acceptance_start": row["acceptance_start"],
+                    "acceptance_end": row["acceptance_end"],
+                    "target_employees": row["target_employees"]
+                }
+                for row in rows
+            ]
+        }
+
+    def dump(self) -> List[Dict[str, Any]]:
+        """
+        ミラーの全レコードを上流APIと同じキー名で書き出します（フィクスチャ作成用）
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM subsidies ORDER BY created_date DESC").fetchall()
+        return [
+            {
+                "id": row["id"],
+                "name": row["name"],
+                "title": row["title"],
+                "target_area_search": row["target_area"],
+                "subsidy_max_limit": row["subsidy_max_limit"],
+                "acceptance_start_datetime": row["acceptance_start"],
+                "acceptance_end_datetime": row["acceptance_end"],
+                "target_number_of_employees": row["target_employees"],
+                "created_date": row["created_date"],
+                "subsidy_rate": row["subsidy_rate"],
+                "purpose": row["purpose"],
+                "outline": row["outline"],
+                "note": row["note"],
+                "grant_guideline_url": row["grant_guideline_url"],
+                "application_form_files": row["application_form_files"] or 0
+            }
+            for row in rows
+        ]
+
+    def detailed_records(self) -> List[Dict[str, Any]]:
+        """
+        詳細取得済みの補助金を get_subsidy_detail の "subsidy" と同じキー名で返します（類似検索の索引用）
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM subsidies WHERE detail_synced_at IS NOT NULL").fetchall()
+        return [
+            {
+                "id": row["id"],
+                "name": row["name"],
+                "title": row["title"],
+                "target_area": row["target_area"],
+                "subsidy_max_limit": row["subsidy_max_limit"],
+                "acceptance_start": row["acceptance_start"],
+                "acceptance_end": row["acceptance_end"],
+                "target_employees": row["target_employees"],
+                "purpose": row["purpose"],
+                "outline": row["outline"],
+                "note": row["note"]
+            }
+            for row in rows
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        ミラーの統計情報を返します
+        """
+        with self._connect() as conn:
+            records = conn.execute("SELECT COUNT(*) FROM subsidies").fetchone()[0]
+        return {
+            "path": self.path,
+            "records": records,
+            "last_sync_at": self.last_synced_at(),
+            "stale": self.is_stale(),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# ミラーモードが有効な場合の共有インスタンス
+mirror: Optional[CatalogMirror] = CatalogMirror(MIRROR_DB_PATH) if MIRROR_DB_PATH else None
+
+
+async def search_mirror(params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    ミラーで回答できる検索であれば結果を返します
+
+    ミラー無効・ミラーが古い・ミラーが扱えない条件（利用目的・業種）・該当なしの場合は
+    None を返し、呼び出し元はライブAPIにフォールバックします。
+    ミラーはシードキーワード（MIRROR_SEED_KEYWORDS）で同期した範囲しか含まず、ライブAPIより
+    件数が少ない場合があるため、結果には "source": "mirror" と "synced_at"（最終同期時刻）を付けます。
+
+    Args:
+        params: search_subsidies が上流に送るリクエストパラメータ
+
+    Returns:
+        search_subsidies と同じ形式の結果、または None
+    """
+    if mirror is None or params.get("use_purpose") or params.get("industry"):
+        return None
+
+    def search_if_fresh() -> Optional[Dict[str, Any]]:
+        # 鮮度の確認もSQLiteの読み出しなので、検索と同じスレッドで行いイベントループを止めない
+        synced_at = mirror.last_synced_at()
+        if is_expired(synced_at):
+            return None
+        result = mirror.search(
+            keyword=params["keyword"],
+            sort=params["sort"],
+            order=params["order"],
+            acceptance=params.get("acceptance"),
+            target_area_search=params.get("target_area_search"),
+            target_number_of_employees=params.get("target_number_of_employees")
+        )
+        return {**result, "source": "mirror", "synced_at": synced_at}
+
+    result = await asyncio.to_thread(search_if_fresh)
+
+    if result is None or not result["subsidies"]:
+        mirror.misses += 1
+        return None
+
+    mirror.hits += 1
+    return result
+
+
+async def sync_catalog(
+    target: Optional[CatalogMirror] = None,
+    keywords: Optional[List[str]] = None,
+    full: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    上流APIからカタログを同期します
+
+    フル同期ではシードキーワードで全期間の一覧を取得し、差分同期では募集期間中の一覧のみを
+    取得します。一覧の内容が変化したレコード（新規作成・募集期間の変更など）と詳細未取得の
+    レコードだけ詳細を取得します。
+
+    Args:
+        target: 同期先のミラー（省略時は共有インスタンス）
+        keywords: シードキーワード（省略時は MIRROR_SEED_KEYWORDS）
+        full: フル同期するか（省略時は未同期・前回フル同期から一定時間経過で自動判定）
+
+    Returns:
+        同期結果の統計
+    """
+    from .jgrants import get_client, get_subsidy_detail
+    from .upstream import jgrants_upstream
+
+    target = target or mirror
+    if target is None:
+        return {"success": False, "error": "ミラーが設定されていません（JGRANTS_MIRROR_DB）"}
+
+    if full is None:
+        last_full = target.get_state("last_full_sync_at")
+        full = last_full is None or time.time() - float(last_full) > MIRROR_FULL_SYNC_INTERVAL
+
+    started_at = time.time()
+    client = get_client()
+
+    async def fetch_list(keyword: str) -> List[Dict[str, Any]]:
+        params: Dict[str, Any] = {"keyword": keyword, "sort": "created_date", "order": "DESC"}
+        if not full:
+            params["acceptance"] = 1
+        async def send() -> List[Dict[str, Any]]:
+            response = await client.get("/subsidies", params=params)
+            response.raise_for_status()
+            return response.json().get("result", [])
+
+        # 同期もレート制限・再試行・サーキットブレーカーの対象にする
+        return await jgrants_upstream.call(send)
+
+    try:
+        lists = await asyncio.gather(*[fetch_list(keyword) for keyword in (keywords or MIRROR_SEED_KEYWORDS)])
+    except Exception as e:
+        return {"success": False, "error": f"同期エラー: {str(e)}"}
+
+    records: Dict[str, Dict[str, Any]] = {}
+    for result in lists:
+        for record in result:
+            if record.get("id"):
+                records[record["id"]] = record
+
+    known = await asyncio.to_thread(target.fingerprints)
+    changed = [record for record in records.values() if known.get(record["id"]) != fingerprint(record)]
+    await asyncio.to_thread(target.upsert_records, changed)
+
+    # 変更のあったレコードと詳細未取得のレコードの詳細を並列取得
+    # （変更を検知した詳細は、TTL内のキャッシュではなく上流で再検証した内容を保存する）
+    changed_ids = {record["id"] for record in changed}
+    detail_ids = changed_ids | set(await asyncio.to_thread(target.ids_without_detail))
+    semaphore = asyncio.Semaphore(MIRROR_DETAIL_CONCURRENCY)
+
+    async def sync_detail(subsidy_id: str) -> bool:
+        async with semaphore:
+            detail = await get_subsidy_detail(subsidy_id, refresh=subsidy_id in changed_ids)
+        if not detail.get("success"):
+            return False
+        await asyncio.to_thread(target.update_detail, subsidy_id, detail["subsidy"])
+        return True
+
+    detail_results = await asyncio.gather(*[sync_detail(subsidy_id) for subsidy_id in detail_ids])
+
+    target.set_state("last_sync_at", started_at)
+    if full:
+        target.set_state("last_full_sync_at", started_at)
+
+    return {
+        "success": True,
+        "full": full,
+        "fetched": len(records),
+        "updated": len(changed),
+        "details": sum(detail_results),
+        "detail_errors": len(detail_results) - sum(detail_results),
+        "elapsed": time.time() - started_at
+    }
+
+
+def load_fixture(path: str, target: Optional[CatalogMirror] = None) -> int:
+    """
+    記録済みのフィクスチャ（JSON）をミラーに読み込みます
+
+    フィクスチャは上流APIのレコードの配列、または {"result": [...]} 形式のJSONです。
+    読み込み後はミラーを同期済みとして扱います。
+
+    Args:
+        path: フィクスチャファイルのパス
+        target: 読み込み先のミラー（省略時は共有インスタンス）
+
+    Returns:
+        読み込んだ件数
+    """
+    target = target or mirror
+    if target is None:
+        raise ValueError("ミラーが設定されていません（JGRANTS_MIRROR_DB）")
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    records = data.get("result", []) if isinstance(data, dict) else data
+
+    count = target.upsert_records(records)
+    target.set_state("last_sync_at", time.time())
+    return count
+
+
+async def run_sync_loop() -> None:
+    """
+    MIRROR_SYNC_INTERVAL 秒ごとにカタログを同期し続けます（アプリ起動時にタスクとして開始）
+    """
+    while True:
+        try:
+            await sync_catalog()
+        except Exception as e:
+            print(f"ミラー同期エラー: {str(e)}", file=sys.stderr)
+        await asyncio.sleep(MIRROR_SYNC_INTERVAL)
+
+
+def main(argv: List[str]) -> int:
+    """
+    コマンドラインエントリポイント
+    """
+    if mirror is None:
+        print("JGRANTS_MIRROR_DB を設定してください", file=sys.stderr)
+        return 1
+
+    if len(argv) >= 1 and argv[0] == "sync":
+        result = asyncio.run(sync_catalog(full=True if "--full" in argv else None))
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 0 if result.get("success") else 1
+
+    if len(argv) == 2 and argv[0] == "load-fixture":
+        print(f"{load_fixture(argv[1])}件を読み込みました")
+        return 0
+
+    if len(argv) == 2 and argv[0] == "dump":
+        records = mirror.dump()
+        with open(argv[1], "w", encoding="utf-8") as f:
+            json.dump({"result": records}, f, ensure_ascii=False, indent=2)
+        print(f"{len(records)}件を書き出しました")
+        return 0
+
+    if len(argv) == 2 and argv[0] == "search":
+        print(json.dumps(mirror.search(argv[1]), ensure_ascii=False, indent=2))
+        return 0
+
+    print(__doc__, file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
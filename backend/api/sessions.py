@@ -0,0 +1,217 @@
+"""
+会話セッションストアモジュール（インメモリ + 任意でSQLite永続化）
+
+セッションにはモデルごとのプロバイダー形式の履歴（ツール呼び出し・ツール結果を含む）を保存します。
+クライアントはセッションIDと新しいユーザーメッセージだけを送信すればよく、
+モデルは前のターンで取得済みの検索結果を履歴から参照できます。
+"""
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from .cache import TTLCache
+from .compaction import compact_history, is_summary, is_user_turn
+
+# 環境変数の読み込み
+load_dotenv()
+
+# セッション設定（SESSION_DB 未設定ならインメモリのみ）
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "200"))
+SESSION_DB_PATH = os.getenv("SESSION_DB", "")
+
+# リクエストの model パラメータと対象モデルの対応
+SESSION_MODELS: Dict[str, List[str]] = {
+    "claude": ["claude"],
+    "openai": ["openai"],
+    "both": ["claude", "openai"]
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    histories TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions(updated_at);
+"""
+
+# モデル名 → プロバイダー形式のチャット履歴
+Histories = Dict[str, List[Dict[str, Any]]]
+
+
+def new_session_id() -> str:
+    """
+    推測されにくいセッションIDを生成します
+    """
+    return secrets.token_urlsafe(16)
+
+
+def trim_history(history: List[Dict[str, Any]], max_messages: int) -> List[Dict[str, Any]]:
+    """
+    履歴が上限を超えた場合に古いターンから破棄します
+
+    ツール呼び出しと結果の対応が崩れないよう、残す履歴は必ずユーザーの発言から始めます。
+    先頭の要約メッセージ（履歴の圧縮で作成されたもの）は残します。
+    """
+    if len(history) <= max_messages:
+        return history
+
+    head = [history[0]] if is_summary(history[0]) else []
+    start = len(history) - max_messages + len(head)
+    while start < len(history) and not is_user_turn(history[start]):
+        start += 1
+    return head + history[start:]
+
+
+def start_turn(histories: Histories, models: List[str], message: str) -> Histories:
+    """
+    各モデルの履歴に新しいユーザーメッセージを加えたリクエスト用の履歴を作成します（元の履歴は変更しない）
+    """
+    user_message = {"role": "user", "content": message}
+    return {name: histories.get(name, []) + [user_message] for name in models}
+
+
+def finish_turn(
+    histories: Histories,
+    turn: Histories,
+    transcripts: Histories,
+    results: Dict[str, Dict[str, Any]]
+) -> Histories:
+    """
+    成功したモデルの履歴にこのターンのメッセージ（ツール呼び出し・結果・応答）を反映します
+
+    失敗したモデルの履歴はユーザーメッセージも含めて元のまま残すため、再送すればやり直せます。
+
+    Returns:
+        更新後の履歴
+    """
+    updated = dict(histories)
+    for name, result in results.items():
+        if result.get("success"):
+            updated[name] = turn[name] + transcripts.get(name, [])
+    return updated
+
+
+class SessionStore:
+    """
+    TTL・件数・サイズ上限付きのセッションストア
+
+    メモリ上のLRUキャッシュを一次ストアとし、path を指定した場合は SQLite にも書き込んで
+    再起動後やメモリから追い出された後も復元できるようにします。
+    """
+
+    def __init__(
+        self,
+        ttl: float = SESSION_TTL,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        max_bytes: int = SESSION_MAX_BYTES,
+        max_messages: int = SESSION_MAX_MESSAGES,
+        path: str = ""
+    ):
+        """
+        Args:
+            ttl: 最終更新からセッションを保持する秒数
+            max_sessions: 保持する最大セッション数
+            max_bytes: メモリ上のセッションの最大合計バイト数
+            max_messages: モデルごとの履歴の最大メッセージ数
+            path: SQLiteデータベースファイルのパス（空ならインメモリのみ）
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.path = path
+        self.memory = TTLCache(ttl=ttl, max_entries=max_sessions, max_bytes=max_bytes, name="sessions")
+        if path:
+            with self._connect() as conn:
+                conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    async def load(self, session_id: str) -> Optional[Histories]:
+        """
+        セッションの履歴を返します（未登録・期限切れの場合はNone）
+        """
+        histories = self.memory.get(session_id)
+        if histories is None and self.path:
+            histories = await asyncio.to_thread(self._load, session_id)
+            if histories is not None:
+                self.memory.set(session_id, histories)
+        return histories
+
+    async def save(self, session_id: str, histories: Histories) -> None:
+        """
+        セッションの履歴を保存します（有効期限は保存時点から延長される）
+
+        トークン予算を超えた履歴は圧縮してから保存するため、次のターンでは圧縮済みの履歴が使われる
+        """
+        histories = {
+            name: trim_history(compact_history(history), self.max_messages)
+            for name, history in histories.items()
+        }
+        self.memory.set(session_id, histories)
+        if self.path:
+            await asyncio.to_thread(self._store, session_id, histories)
+
+    async def delete(self, session_id: str) -> None:
+        """
+        セッションを削除します
+        """
+        self.memory.delete(session_id)
+        if self.path:
+            await asyncio.to_thread(self._delete, session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        セッションストアの統計情報を返します
+        """
+        stats = self.memory.stats()
+        stats["persistent"] = bool(self.path)
+        return stats
+
+    def _load(self, session_id: str) -> Optional[Histories]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT histories FROM sessions WHERE id = ? AND updated_at >= ?",
+                (session_id, time.time() - self.ttl)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store(self, session_id: str, histories: Histories) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, histories, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(histories, ensure_ascii=False), now)
+            )
+            # 期限切れと件数超過分（古い順）を削除
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM sessions WHERE id NOT IN "
+                "(SELECT id FROM sessions ORDER BY updated_at DESC LIMIT ?)",
+                (self.max_sessions,)
+            )
+
+    def _delete(self, session_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+
+# 共有セッションストア
+session_store = SessionStore(path=SESSION_DB_PATH)
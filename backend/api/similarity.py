@@ -0,0 +1,209 @@
+"""
+類似補助金の検索モジュール（文字n-gramの転置索引 + BM25）
+
+get_subsidy_detail で取得した補助金の名称・目的・概要・注意事項を文字n-gramに分割して
+ローカルの転置索引に追加していき、指定した補助金の本文をクエリとしてBM25で類似度を計算します。
+索引は詳細の取得（キャッシュへの保存）のたびに差分で更新されるため、検索時に上流APIは呼び出しません。
+"""
+import hashlib
+import heapq
+import math
+import os
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+# n-gramの文字数
+SIMILAR_NGRAM = int(os.getenv("SIMILAR_NGRAM", "2"))
+
+# BM25のパラメータ
+BM25_K1 = float(os.getenv("SIMILAR_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("SIMILAR_BM25_B", "0.75"))
+
+# クエリに使う特徴的なn-gramの最大数・索引に保持する最大件数・返す最大件数
+SIMILAR_QUERY_TERMS = int(os.getenv("SIMILAR_QUERY_TERMS", "64"))
+SIMILAR_MAX_DOCS = int(os.getenv("SIMILAR_MAX_DOCS", "20000"))
+SIMILAR_MAX_K = int(os.getenv("SIMILAR_MAX_K", "20"))
+
+# 索引する項目と重み（名称の一致を本文より重視する）
+FIELD_WEIGHTS = {"title": 3, "name": 1, "purpose": 2, "outline": 1, "note": 1}
+
+# 結果に含める項目（検索結果と同じ形式）
+RESULT_FIELDS = [
+    "id", "name", "title", "target_area", "subsidy_max_limit",
+    "acceptance_start", "acceptance_end", "target_employees"
+]
+
+
+def tokenize(text: Optional[str], n: int = SIMILAR_NGRAM) -> List[str]:
+    """
+    文字列を文字n-gramに分割します（NFKC・小文字化し、空白・記号をまたがない）
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+
+    grams: List[str] = []
+    segment: List[str] = []
+    for c in text + " ":
+        if c.isalnum():
+            segment.append(c)
+            continue
+        if segment:
+            if len(segment) < n:
+                grams.append("".join(segment))
+            else:
+                grams.extend("".join(segment[i:i + n]) for i in range(len(segment) - n + 1))
+            segment = []
+    return grams
+
+
+@dataclass
+class IndexedDoc:
+    """索引済みの補助金"""
+    terms: Counter
+    length: int
+    fingerprint: str
+    record: Dict[str, Any]
+
+
+class SimilarityIndex:
+    """
+    補助金本文のインメモリ転置索引
+
+    postings は n-gram → {補助金ID: 重み付き出現数}。追加・更新は該当する補助金の
+    ポスティングだけを差し替えるため、詳細を1件取得するたびに呼び出せます。
+    """
+
+    def __init__(self, max_docs: int = SIMILAR_MAX_DOCS):
+        """
+        Args:
+            max_docs: 保持する最大件数（超えた場合は古く追加されたものから削除）
+        """
+        self.max_docs = max_docs
+        self.docs: Dict[str, IndexedDoc] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_length = 0
+        self.queries = 0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def __contains__(self, subsidy_id: str) -> bool:
+        return subsidy_id in self.docs
+
+    def add(self, subsidy: Dict[str, Any]) -> bool:
+        """
+        補助金の詳細を索引に追加します（本文が変わっていなければ何もしない）
+
+        Args:
+            subsidy: get_subsidy_detail の "subsidy" 部分
+
+        Returns:
+            索引を更新した場合 True
+        """
+        subsidy_id = subsidy.get("id")
+        if not subsidy_id:
+            return False
+
+        texts = [subsidy.get(field) or "" for field in FIELD_WEIGHTS]
+        digest = hashlib.sha1("\x1f".join(texts).encode("utf-8")).hexdigest()
+        current = self.docs.get(subsidy_id)
+        if current is not None and current.fingerprint == digest:
+            # 本文以外（締切など）の更新は結果の表示用に反映する
+            current.record = {field: subsidy.get(field) for field in RESULT_FIELDS}
+            return False
+
+        terms: Counter = Counter()
+        for text, weight in zip(texts, FIELD_WEIGHTS.values()):
+            for gram in tokenize(text):
+                terms[gram] += weight
+        if not terms:
+            return False
+
+        self.remove(subsidy_id)
+        for gram, count in terms.items():
+            self.postings.setdefault(gram, {})[subsidy_id] = count
+        length = sum(terms.values())
+        self.docs[subsidy_id] = IndexedDoc(
+            terms=terms,
+            length=length,
+            fingerprint=digest,
+            record={field: subsidy.get(field) for field in RESULT_FIELDS}
+        )
+        self.total_length += length
+
+        while len(self.docs) > self.max_docs:
+            self.remove(next(iter(self.docs)))
+        return True
+
+    def add_many(self, subsidies: Iterable[Dict[str, Any]]) -> int:
+        """
+        複数の補助金を索引に追加し、更新した件数を返します
+        """
+        return sum(1 for subsidy in subsidies if self.add(subsidy))
+
+    def remove(self, subsidy_id: str) -> None:
+        """
+        補助金を索引から削除します
+        """
+        doc = self.docs.pop(subsidy_id, None)
+        if doc is None:
+            return
+        for gram in doc.terms:
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.pop(subsidy_id, None)
+                if not posting:
+                    del self.postings[gram]
+        self.total_length -= doc.length
+
+    def _idf(self, gram: str) -> float:
+        # BM25のIDF（負にならない形）
+        df = len(self.postings.get(gram, ()))
+        return math.log(1 + (len(self.docs) - df + 0.5) / (df + 0.5))
+
+    def similar(self, subsidy_id: str, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        指定した補助金の本文をクエリとして、類似する補助金を BM25 のスコア順に返します
+
+        クエリには出現数 × IDF の大きい n-gram を SIMILAR_QUERY_TERMS 個まで使います。
+
+        Args:
+            subsidy_id: 基準とする補助金ID（索引済みであること）
+            k: 返す件数
+
+        Returns:
+            検索結果と同じ形式のレコードに score を付けたリスト（基準の補助金自身は含まない）
+        """
+        doc = self.docs.get(subsidy_id)
+        if doc is None or len(self.docs) < 2:
+            return []
+        self.queries += 1
+
+        idf = {gram: self._idf(gram) for gram in doc.terms}
+        query = heapq.nlargest(SIMILAR_QUERY_TERMS, doc.terms, key=lambda gram: doc.terms[gram] * idf[gram])
+
+        average_length = self.total_length / len(self.docs)
+        scores: Dict[str, float] = {}
+        for gram in query:
+            weight = idf[gram]
+            for other_id, count in self.postings[gram].items():
+                if other_id == subsidy_id:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.docs[other_id].length / average_length)
+                scores[other_id] = scores.get(other_id, 0.0) + weight * count * (BM25_K1 + 1) / (count + norm)
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [{**self.docs[other_id].record, "score": round(score, 3)} for other_id, score in best]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        索引の統計情報を返します
+        """
+        return {"docs": len(self.docs), "terms": len(self.postings), "queries": self.queries}
+
+
+# 共有の類似検索索引
+similarity_index = SimilarityIndex()
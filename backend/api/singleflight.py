@@ -0,0 +1,79 @@
+"""
+同一リクエストの合流モジュール（single-flight）
+
+同じキーの上流リクエストが実行中であれば、後から来た呼び出しは新たにリクエストを送らず、
+実行中のリクエストの結果を待ち合わせます。
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    キーごとに実行中のリクエストを1つに制限する合流レイヤー
+
+    - 例外は待ち合わせている全ての呼び出し元に伝播します
+    - 呼び出し元の1つがキャンセルされても共有リクエストは継続し、
+      待ち合わせている呼び出し元が全員キャンセルされた場合のみ中断します
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, "asyncio.Task[Any]"] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        キーに対応するリクエストを実行（または実行中のものに合流）します
+
+        Args:
+            key: 正規化済みのリクエストキー
+            fn: 実際に上流へリクエストするコルーチン関数
+
+        Returns:
+            fn の戻り値
+        """
+        task = self._inflight.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda _: self._forget(key, task))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._inflight.get(key) is task and self._waiters[key] == 1:
+                # 最後の待ち合わせ元がキャンセルされたら共有リクエストも中断する
+                task.cancel()
+            raise
+        finally:
+            if self._inflight.get(key) is task:
+                self._waiters[key] -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        合流の統計情報を返します
+        """
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced
+        }
+
+    def _forget(self, key: Hashable, task: "asyncio.Task[Any]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            del self._waiters[key]
+        if not task.cancelled():
+            # 待ち合わせ元がいない場合でも例外を回収して警告を防ぐ
+            task.exception()
@@ -0,0 +1,133 @@
+"""
+LLMに渡すツール実行結果のコンパクトなエンコードモジュール
+
+ツール結果はツールループの反復ごとに履歴として再送されるため、
+モデルに渡す文字列は最小化JSON・件数制限・項目の絞り込み・長文の切り詰めで
+ツールごとのトークン予算内に収めます。REST呼び出し元には元の結果をそのまま返します。
+"""
+import json
+import os
+from typing import Any, Dict, List
+
+# モデルに渡す検索結果の最大件数
+TOOL_RESULT_MAX_RECORDS = int(os.getenv("TOOL_RESULT_MAX_RECORDS", "10"))
+
+# ツールごとのトークン予算（未定義のツールは TOOL_RESULT_TOKEN_BUDGET）
+TOOL_RESULT_TOKEN_BUDGET = int(os.getenv("TOOL_RESULT_TOKEN_BUDGET", "1500"))
+TOOL_TOKEN_BUDGETS: Dict[str, int] = {
+    "search_subsidies": TOOL_RESULT_TOKEN_BUDGET,
+    "search_active_subsidies": TOOL_RESULT_TOKEN_BUDGET,
+    "search_subsidies_multi": int(os.getenv("MULTI_SEARCH_RESULT_TOKEN_BUDGET", "2500")),
+    "find_similar_subsidies": TOOL_RESULT_TOKEN_BUDGET,
+    "get_subsidy_detail": int(os.getenv("DETAIL_RESULT_TOKEN_BUDGET", "2000")),
+    "get_subsidy_details": int(os.getenv("DETAILS_RESULT_TOKEN_BUDGET", "5000"))
+}
+
+# モデルに渡す項目（検索結果の各レコード・詳細）
+SEARCH_FIELDS = [
+    "id", "name", "title", "target_area", "subsidy_max_limit",
+    "acceptance_start", "acceptance_end", "target_employees",
+    "match_count", "matched_keywords", "score"
+]
+DETAIL_FIELDS = [
+    "id", "name", "title", "target_area", "subsidy_max_limit", "subsidy_rate",
+    "acceptance_start", "acceptance_end", "target_employees",
+    "purpose", "outline", "note", "grant_guideline_url", "application_form_files"
+]
+
+# 予算超過時に段階的に適用する文字列の最大長（IDやURLは切り詰めない）
+TRUNCATE_STEPS = [400, 200, 100, 50]
+TRUNCATE_EXEMPT_FIELDS = {"id", "grant_guideline_url"}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数を概算します（日本語などの非ASCII文字は1文字1トークン、ASCIIは4文字1トークン）
+    """
+    ascii_chars = sum(1 for c in text if c < "\x80")
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def dumps_compact(value: Any) -> str:
+    """
+    空白なしのJSON文字列に変換します
+    """
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _project(record: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    return {field: record[field] for field in fields if record.get(field) not in (None, "")}
+
+
+def _truncate(record: Dict[str, Any], limit: int) -> Dict[str, Any]:
+    return {
+        key: value[:limit] + "…"
+        if isinstance(value, str) and len(value) > limit and key not in TRUNCATE_EXEMPT_FIELDS
+        else value
+        for key, value in record.items()
+    }
+
+
+def encode_tool_result(tool_name: str, result: Dict[str, Any], budget: int = 0) -> str:
+    """
+    ツール実行結果をモデル向けのコンパクトな文字列にエンコードします
+
+    Args:
+        tool_name: ツール名
+        result: ツールの実行結果（REST APIと同じ形式）
+        budget: トークン予算（省略時はツールごとの既定値）
+
+    Returns:
+        最小化JSON文字列
+    """
+    if not result.get("success"):
+        return dumps_compact(result)
+
+    budget = budget or TOOL_TOKEN_BUDGETS.get(tool_name, TOOL_RESULT_TOKEN_BUDGET)
+
+    if isinstance(result.get("subsidies"), list):
+        records = [_project(record, SEARCH_FIELDS) for record in result["subsidies"][:TOOL_RESULT_MAX_RECORDS]]
+
+        def build(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+            payload = {key: value for key, value in result.items() if key != "subsidies"}
+            payload["shown"] = len(items)
+            payload["subsidies"] = items
+            return payload
+
+    elif isinstance(result.get("results"), list):
+        # 一括詳細取得: 失敗したIDはIDとエラーのみ残す
+        records = [
+            _project(item["subsidy"], DETAIL_FIELDS) if item.get("success")
+            else {"id": item.get("id"), "error": item.get("error")}
+            for item in result["results"]
+        ]
+
+        def build(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+            return {"success": True, "count": result.get("count"), "shown": len(items), "subsidies": items}
+
+    elif isinstance(result.get("subsidy"), dict):
+        records = [_project(result["subsidy"], DETAIL_FIELDS)]
+
+        def build(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+            return {"success": True, "subsidy": items[0]}
+
+    else:
+        return dumps_compact(result)
+
+    text = dumps_compact(build(records))
+    if estimate_tokens(text) <= budget:
+        return text
+
+    # 長い文字列項目を段階的に切り詰める
+    for limit in TRUNCATE_STEPS:
+        records = [_truncate(record, limit) for record in records]
+        text = dumps_compact(build(records))
+        if estimate_tokens(text) <= budget:
+            return text
+
+    # それでも超える場合は末尾のレコードから省く（最低1件は残す）
+    while len(records) > 1 and estimate_tokens(text) > budget:
+        records = records[:-1]
+        text = dumps_compact(build(records))
+
+    return text
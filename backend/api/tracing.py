@@ -0,0 +1,384 @@
+"""
+リクエスト単位のトレーシングモジュール（contextvars によるスパンの伝播）
+
+1リクエストを1つのトレース（ルートスパン）とし、LLM呼び出し・ツール実行・JグランツAPIへのリクエスト・
+キャッシュ参照を子スパンとして記録します。現在のスパンは contextvars で保持するため、
+asyncio.gather や create_task で起動した処理にも親子関係がそのまま引き継がれます。
+
+トレースはエクスポーター（JSON Lines ファイル・OTLP/HTTP）に非同期で書き出すほか、
+?profile=1 を付けたリクエストではレスポンスに処理時間の内訳として埋め込みます。
+エクスポーターが未設定でプロファイルも要求されていないリクエストではスパンを作らず、
+span() は何もしないオブジェクトを返すだけなので、計装したコードのオーバーヘッドはほぼありません。
+"""
+import asyncio
+import json
+import os
+import random
+import secrets
+import time
+from contextvars import ContextVar, Token
+from typing import Any, Dict, List, Optional, Set
+
+import httpx
+from dotenv import load_dotenv
+
+# 環境変数の読み込み
+load_dotenv()
+
+# 使用するエクスポーター（カンマ区切り: jsonl, otlp。空なら ?profile=1 の場合のみ記録）
+TRACE_EXPORTERS = [name.strip() for name in os.getenv("TRACE_EXPORTERS", "").split(",") if name.strip()]
+
+# JSON Lines の出力先
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "traces.jsonl")
+
+# OTLP/HTTP の送信先（/v1/traces を付けて送信）とサービス名
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318").rstrip("/")
+OTLP_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "jgrants-chat-api")
+
+# エクスポートするリクエストの割合（0～1。?profile=1 のリクエストは常に記録）
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+
+
+class Trace:
+    """
+    1リクエスト分のスパンの集まり
+    """
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List["Span"] = []
+        self.root: Optional["Span"] = None
+        self.finished = False
+
+
+class Span:
+    """
+    処理区間（開始・終了時刻と属性）
+    """
+
+    def __init__(self, name: str, trace: Trace, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._started = time.perf_counter()
+        self.duration = 0.0
+        self._token: Optional[Token] = None
+
+    def set(self, **attributes: Any) -> None:
+        """
+        属性を追加します（値が None のものは無視）
+        """
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def end(self, status: Optional[str] = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        self.end_ns = self.start_ns + int(self.duration * 1e9)
+        if status is not None:
+            self.status = status
+        if not self.trace.finished:
+            self.trace.spans.append(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class _NoopSpan:
+    """
+    トレース中でない場合に返す何もしないスパン
+    """
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+# 現在のスパン（タスクごとにコピーされるため、並列処理でも親子関係が保たれる）
+_current_span: ContextVar[Optional[Span]] = ContextVar("jgrants_current_span", default=None)
+
+
+class _SpanScope:
+    """
+    with 文でスパンを開始・終了し、その間は現在のスパンとして設定します
+    """
+
+    def __init__(self, span: Span):
+        self.span = span
+        self._token: Optional[Token] = None
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        _current_span.reset(self._token)
+        if exc_type is None:
+            self.span.end()
+        elif issubclass(exc_type, asyncio.CancelledError):
+            self.span.end("cancelled")
+        else:
+            self.span.set(error=f"{exc_type.__name__}: {exc}")
+            self.span.end("error")
+
+
+def span(name: str, **attributes: Any) -> Any:
+    """
+    現在のスパンの子スパンを開始します（トレース中でなければ何もしない）
+
+    使い方:
+        with span("tool.execute", tool=name) as current:
+            ...
+            current.set(success=True)
+    """
+    parent = _current_span.get()
+    if parent is None or parent.trace.finished:
+        return NOOP_SPAN
+    return _SpanScope(Span(
+        name,
+        parent.trace,
+        parent.span_id,
+        {key: value for key, value in attributes.items() if value is not None}
+    ))
+
+
+def current_span() -> Optional[Span]:
+    """
+    現在のスパンを返します（トレース中でなければNone）
+    """
+    current = _current_span.get()
+    return current if current is not None and not current.trace.finished else None
+
+
+def current_root() -> Optional[Span]:
+    """
+    現在のトレースのルートスパンを返します（トレース中でなければNone）
+    """
+    current = current_span()
+    return current.trace.root if current is not None else None
+
+
+def start_trace(name: str, force: bool = False, **attributes: Any) -> Optional[Span]:
+    """
+    新しいトレースのルートスパンを開始し、現在のスパンに設定します
+
+    Args:
+        name: ルートスパン名
+        force: True ならエクスポーターの設定・サンプリングに関係なく記録する（?profile=1）
+        attributes: ルートスパンの属性
+
+    Returns:
+        ルートスパン（記録しない場合はNone）
+    """
+    if not force and (not exporters or random.random() >= TRACE_SAMPLE_RATE):
+        return None
+    root = Span(name, Trace(), None, attributes)
+    root.trace.root = root
+    root._token = _current_span.set(root)
+    return root
+
+
+def detach(root: Optional[Span]) -> None:
+    """
+    start_trace で設定した現在のスパンを元に戻します（同じコンテキストで呼び出すこと）
+    """
+    if root is not None and root._token is not None:
+        _current_span.reset(root._token)
+        root._token = None
+
+
+def finish_trace(root: Optional[Span], export: bool = True) -> None:
+    """
+    ルートスパンを終了し、トレースをエクスポーターに非同期で書き出します
+    """
+    if root is None or root.trace.finished:
+        return
+    root.end()
+    root.trace.finished = True
+    if export and exporters:
+        spans = list(root.trace.spans)
+        for exporter in exporters:
+            _spawn(exporter.export(spans))
+
+
+def breakdown(root: Optional[Span]) -> Optional[Dict[str, Any]]:
+    """
+    トレースの処理時間の内訳を返します（?profile=1 のレスポンスに埋め込む）
+
+    Returns:
+        合計時間・スパン名ごとの件数と合計時間・各スパン（開始位置と所要時間、ミリ秒）
+    """
+    if root is None:
+        return None
+    elapsed = root.duration if root.end_ns is not None else time.perf_counter() - root._started
+    by_name: Dict[str, Dict[str, Any]] = {}
+    spans = []
+    for item in sorted(root.trace.spans, key=lambda s: s.start_ns):
+        if item is root:
+            continue
+        summary = by_name.setdefault(item.name, {"count": 0, "total_ms": 0.0})
+        summary["count"] += 1
+        summary["total_ms"] = round(summary["total_ms"] + item.duration * 1000, 3)
+        spans.append({
+            "name": item.name,
+            "span_id": item.span_id,
+            "parent_id": item.parent_id,
+            "start_ms": round((item.start_ns - root.start_ns) / 1e6, 3),
+            "duration_ms": round(item.duration * 1000, 3),
+            "status": item.status,
+            "attributes": item.attributes
+        })
+    return {
+        "trace_id": root.trace.trace_id,
+        "total_ms": round(elapsed * 1000, 3),
+        "by_name": by_name,
+        "spans": spans
+    }
+
+
+class JsonLinesExporter:
+    """
+    スパンを1行1スパンのJSONとしてファイルに追記するエクスポーター
+    """
+
+    def __init__(self, path: str = TRACE_JSONL_PATH):
+        self.path = path
+
+    def _write(self, lines: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    async def export(self, spans: List[Span]) -> None:
+        lines = "".join(json.dumps(item.to_dict(), ensure_ascii=False, default=str) + "\n" for item in spans)
+        await asyncio.to_thread(self._write, lines)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+class OtlpExporter:
+    """
+    OTLP/HTTP（JSONエンコーディング）でコレクターに送信するエクスポーター
+    """
+
+    def __init__(self, endpoint: str = OTLP_ENDPOINT, service_name: str = OTLP_SERVICE_NAME):
+        self.url = f"{endpoint}/v1/traces"
+        self.service_name = service_name
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "jgrants"},
+                    "spans": [
+                        {
+                            "traceId": item.trace.trace_id,
+                            "spanId": item.span_id,
+                            **({"parentSpanId": item.parent_id} if item.parent_id else {}),
+                            "name": item.name,
+                            # ルートはサーバースパン、それ以外は内部スパン
+                            "kind": 1 if item.parent_id else 2,
+                            "startTimeUnixNano": str(item.start_ns),
+                            "endTimeUnixNano": str(item.end_ns),
+                            "attributes": [
+                                {"key": key, "value": _otlp_value(value)} for key, value in item.attributes.items()
+                            ],
+                            "status": {"code": 2 if item.status == "error" else 1}
+                        }
+                        for item in spans
+                    ]
+                }]
+            }]
+        }
+
+    async def export(self, spans: List[Span]) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=5.0)
+        response = await self._client.post(self.url, json=self.payload(spans))
+        response.raise_for_status()
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# 実行中のエクスポートタスク（GCで破棄されないよう参照を保持）
+_export_tasks: Set["asyncio.Task[Any]"] = set()
+
+
+def _spawn(coro: Any) -> None:
+    async def run() -> None:
+        try:
+            await coro
+        except Exception:
+            # エクスポートの失敗でリクエスト処理を妨げない
+            pass
+
+    task = asyncio.create_task(run())
+    _export_tasks.add(task)
+    task.add_done_callback(_export_tasks.discard)
+
+
+def build_exporters(names: List[str]) -> List[Any]:
+    """
+    エクスポーター名のリストからエクスポーターを作成します
+    """
+    factories = {"jsonl": JsonLinesExporter, "otlp": OtlpExporter}
+    return [factories[name]() for name in names if name in factories]
+
+
+# 有効なエクスポーター（add_exporter で独自のエクスポーターを追加できる）
+exporters: List[Any] = build_exporters(TRACE_EXPORTERS)
+
+
+def add_exporter(exporter: Any) -> None:
+    """
+    エクスポーターを追加します（async def export(spans) を持つオブジェクト）
+    """
+    exporters.append(exporter)
+
+
+async def close_exporters() -> None:
+    """
+    エクスポーターの接続を閉じます（アプリケーション終了時に呼び出す）
+    """
+    if _export_tasks:
+        await asyncio.gather(*_export_tasks, return_exceptions=True)
+    for exporter in exporters:
+        close = getattr(exporter, "close", None)
+        if close is not None:
+            await close()
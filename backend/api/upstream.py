@@ -0,0 +1,353 @@
+"""
+上流API（Jグランツ）へのアクセス保護モジュール
+
+JグランツAPIへのリクエストはすべて UpstreamGuard を経由させ、次の3つで保護します。
+
+1. トークンバケットによるレート制限（トラフィック急増時も公開APIに一定以上の負荷をかけない）
+2. 5xx・429・タイムアウト・接続エラーに対する、上限付きの指数バックオフ（ジッター付き）再試行
+3. 連続失敗で開くサーキットブレーカー（開いている間は上流を呼ばずに即座に失敗し、
+   呼び出し元はキャッシュ済みの古い値で応答する）
+
+一時的なエラーはここで吸収するため、LLMがツールを呼び直して反復を浪費することがなくなります。
+"""
+import asyncio
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+from dotenv import load_dotenv
+
+from .metrics import UPSTREAM_REQUEST_DURATION
+from .tracing import span
+
+# 環境変数の読み込み
+load_dotenv()
+
+# レート制限（1秒あたりのリクエスト数・バースト・トークン待ちの最大秒数）
+UPSTREAM_RATE_LIMIT = float(os.getenv("JGRANTS_RATE_LIMIT", "10"))
+UPSTREAM_RATE_BURST = float(os.getenv("JGRANTS_RATE_BURST", "20"))
+UPSTREAM_RATE_MAX_WAIT = float(os.getenv("JGRANTS_RATE_MAX_WAIT", "5"))
+
+# 再試行（最大再試行回数・バックオフの初期値と上限秒数）
+UPSTREAM_RETRIES = int(os.getenv("JGRANTS_RETRIES", "2"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("JGRANTS_BACKOFF_BASE", "0.2"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("JGRANTS_BACKOFF_MAX", "2"))
+
+# サーキットブレーカー（開くまでの連続失敗回数・開いている秒数）。失敗は再試行を使い切った呼び出し単位で数える
+UPSTREAM_CIRCUIT_FAILURES = int(os.getenv("JGRANTS_CIRCUIT_FAILURES", "5"))
+UPSTREAM_CIRCUIT_RESET = float(os.getenv("JGRANTS_CIRCUIT_RESET", "30"))
+
+# 再試行する HTTP ステータス
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# LLMに渡すエラーメッセージ（ツールの再呼び出しを促さない）
+UNAVAILABLE_MESSAGE = "JグランツAPIが一時的に利用できません（再試行済み）。同じツールを再度呼び出さず、その旨を回答してください"
+
+T = TypeVar("T")
+
+
+class UpstreamUnavailable(Exception):
+    """
+    上流が利用できない（サーキットが開いている・レート制限の待ち時間超過・再試行の上限到達）
+    """
+
+
+class TokenBucket:
+    """
+    トークンバケットによるレート制限
+
+    rate 個/秒でトークンが補充され、最大 burst 個まで貯まります。
+    """
+
+    def __init__(self, rate: float, burst: float):
+        """
+        Args:
+            rate: 1秒あたりのトークン補充数（0以下なら無制限）
+            burst: バケットの容量
+        """
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.waits = 0
+        self.rejections = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, max_wait: float) -> None:
+        """
+        トークンを1つ取得します（足りなければ補充まで待つ）
+
+        Args:
+            max_wait: 待つ最大秒数
+
+        Raises:
+            UpstreamUnavailable: max_wait 以内にトークンを取得できない場合
+        """
+        if self.rate <= 0:
+            return
+
+        # 待ち行列の順序を保つため、待ち時間の計算と予約はロック内で行う
+        async with self._lock:
+            self._refill()
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+            if wait > max_wait:
+                self.rejections += 1
+                raise UpstreamUnavailable("レート制限の待ち時間が上限を超えました")
+            self.tokens -= 1
+
+        if wait > 0:
+            self.waits += 1
+            await asyncio.sleep(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tokens": round(self.tokens, 2),
+            "waits": self.waits,
+            "rejections": self.rejections
+        }
+
+
+class CircuitBreaker:
+    """
+    連続失敗回数で開くサーキットブレーカー
+
+    失敗は UpstreamGuard の呼び出し単位で数えます（再試行の各回ではなく、再試行を使い切った呼び出しで1回）。
+
+    closed → (failure_threshold 回連続失敗) → open → (reset_timeout 秒経過) → half_open
+    half_open では1件だけ試行を通し、成功すれば closed、失敗すれば再び open に戻ります。
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        """
+        Args:
+            failure_threshold: 開くまでの連続失敗回数（失敗した呼び出しの数）
+            reset_timeout: 開いてから試行を再開するまでの秒数
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejections = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """
+        リクエストを上流に送ってよいかを返します
+        """
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probing = False
+
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+
+        self.rejections += 1
+        return False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def release(self) -> None:
+        """
+        half_open の試行が結果を記録せずに終わった（レート制限で拒否された・キャンセルされた）場合に
+        次の試行を許可します
+        """
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opens += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opens": self.opens,
+            "rejections": self.rejections
+        }
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    再試行すべき一時的なエラー（タイムアウト・接続エラー・5xx・429）かどうか
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUS_CODES
+    return isinstance(error, httpx.TransportError)
+
+
+def outcome_label(error: Exception) -> str:
+    """
+    メトリクスに記録する失敗の種類（HTTPステータス・timeout・transport_error・error）
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return str(error.response.status_code)
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.TransportError):
+        return "transport_error"
+    return "error"
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """
+    Retry-After ヘッダーで指定された待ち秒数を返します（なければNone）
+    """
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    value = error.response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class UpstreamGuard:
+    """
+    レート制限・再試行・サーキットブレーカーをまとめた上流アクセス層
+    """
+
+    def __init__(
+        self,
+        rate: float = UPSTREAM_RATE_LIMIT,
+        burst: float = UPSTREAM_RATE_BURST,
+        max_wait: float = UPSTREAM_RATE_MAX_WAIT,
+        retries: int = UPSTREAM_RETRIES,
+        backoff_base: float = UPSTREAM_BACKOFF_BASE,
+        backoff_max: float = UPSTREAM_BACKOFF_MAX,
+        failure_threshold: int = UPSTREAM_CIRCUIT_FAILURES,
+        reset_timeout: float = UPSTREAM_CIRCUIT_RESET
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_wait = max_wait
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.attempts = 0
+        self.retried = 0
+
+    def backoff(self, attempt: int) -> float:
+        """
+        attempt 回目の再試行までの待ち秒数（指数バックオフ + フルジッター）
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def call(
+        self,
+        send: Callable[[], Awaitable[T]],
+        endpoint: str = "subsidies",
+        attributes: Optional[Dict[str, Any]] = None
+    ) -> T:
+        """
+        上流へのリクエストを保護付きで実行します
+
+        send は1回分のリクエストを行い、失敗時は httpx の例外を送出するコルーチン関数です
+        （HTTPエラーは raise_for_status で例外にすること）。4xx など再試行しても変わらない
+        エラーはそのまま送出し、サーキットブレーカーの失敗にも数えません。
+
+        Args:
+            send: 1回分のリクエストを行うコルーチン関数
+            endpoint: メトリクスに記録するエンドポイント名（"subsidies", "subsidies/id"）
+            attributes: トレースのスパンに付ける属性（補助金IDなど）
+
+        Raises:
+            UpstreamUnavailable: サーキットが開いている・レート制限の待ち時間超過・一時的なエラーが続いた場合
+        """
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise UpstreamUnavailable("サーキットブレーカーが開いています")
+            try:
+                await self.bucket.acquire(self.max_wait)
+            except BaseException:
+                # 上流を呼ばずに終わった（レート制限で拒否・キャンセル）ので half_open の試行枠を返す
+                self.breaker.release()
+                raise
+
+            self.attempts += 1
+            started_at = time.perf_counter()
+            try:
+                with span("jgrants.request", endpoint=endpoint, attempt=attempt, **(attributes or {})):
+                    result = await send()
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                UPSTREAM_REQUEST_DURATION.observe_since(started_at, endpoint, outcome_label(e))
+                if not is_retryable(e):
+                    # 上流は応答している（4xx・解析エラーなど）
+                    self.breaker.record_success()
+                    raise
+                if self.breaker.state == "half_open":
+                    # 試行が失敗したらサーキットを開き直す（再試行しても開いているため通らない）
+                    self.breaker.record_failure()
+                    raise UpstreamUnavailable(f"サーキットブレーカーの試行が失敗しました: {str(e)}") from e
+                if attempt >= self.retries:
+                    # 失敗は再試行を使い切った呼び出し1回につき1回だけ数える
+                    self.breaker.record_failure()
+                    raise UpstreamUnavailable(f"再試行の上限に達しました: {str(e)}") from e
+                self.retried += 1
+                delay = retry_after(e)
+                await asyncio.sleep(min(self.backoff_max, delay) if delay is not None else self.backoff(attempt))
+                continue
+
+            UPSTREAM_REQUEST_DURATION.observe_since(started_at, endpoint, "success")
+            self.breaker.record_success()
+            return result
+
+        raise UpstreamUnavailable("再試行の上限に達しました")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        上流アクセス層の統計情報を返します
+        """
+        return {
+            "attempts": self.attempts,
+            "retried": self.retried,
+            "rate_limit": self.bucket.stats(),
+            "circuit": self.breaker.stats()
+        }
+
+
+def unavailable_error(error: UpstreamUnavailable) -> Dict[str, Any]:
+    """
+    上流が利用できない場合のエラー結果を作成します（呼び出し元は古いキャッシュがあればそちらを返す）
+    """
+    return {
+        "error": f"{UNAVAILABLE_MESSAGE}（{str(error)}）",
+        "success": False,
+        "unavailable": True
+    }
+
+
+# JグランツAPIへのアクセスで共有する保護層
+jgrants_upstream = UpstreamGuard()
@@ -1,15 +1,32 @@
 """
 Jグランツ補助金検索チャットシステム - FastAPI バックエンド
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import os
+import json
+import time
+import asyncio
 from dotenv import load_dotenv
 
-from api.chat import chat_with_claude, chat_with_openai, chat_with_both
-from api.jgrants import search_subsidies, get_subsidy_detail, search_active_subsidies
+from api.chat import close_llm_clients, stream_chat, run_chat
+from api.deadline import Deadline
+from api.jgrants import (
+    search_subsidies, get_subsidy_detail, get_subsidy_details, search_active_subsidies, search_subsidies_multi,
+    find_similar_subsidies, close_client, get_cache_stats, search_cache, detail_cache
+)
+from api import mirror
+from api.sessions import session_store, new_session_id, start_turn, finish_turn, SESSION_MODELS
+from api.answer_cache import (
+    answer_cache, answer_cache_key, conversation_questions, fetch_answer, store_answer,
+    replay_events, get_answer_cache_stats
+)
+from api.metrics import registry, HTTP_REQUEST_DURATION, CONTENT_TYPE, cache_families, upstream_families
+from api.upstream import jgrants_upstream
+from api.tracing import start_trace, detach, finish_trace, breakdown, current_root, close_exporters
 
 # 環境変数の読み込み
 load_dotenv()
@@ -37,9 +54,108 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # NDJSONモードの検索結果の件数・次ページカーソル
+    expose_headers=["X-Total-Count", "X-Next-Cursor"],
 )
 
 
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """
+    ルートごとの処理時間をメトリクスに記録し（ラベルはパスではなくルートのテンプレート）、
+    リクエストのトレースを記録する
+
+    トレースはレスポンスの送信完了（ストリーミングなら最後のイベント）で終了する。
+    ?profile=1 の場合はJSONレスポンスに処理時間の内訳を profile として追加する
+    """
+    started_at = time.perf_counter()
+    profiling = request.query_params.get("profile") == "1"
+    root = start_trace("http.request", force=profiling, method=request.method, path=request.url.path)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    except BaseException:
+        if root is not None:
+            root.end("error")
+        finish_trace(root)
+        raise
+    finally:
+        detach(root)
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        HTTP_REQUEST_DURATION.observe_since(started_at, request.method, route_path, str(status))
+        if root is not None:
+            root.set(route=route_path, status=status)
+
+    if root is None:
+        return response
+
+    if profiling and response.headers.get("content-type", "").startswith("application/json"):
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        content = json.loads(body)
+        if isinstance(content, dict):
+            content["profile"] = breakdown(root)
+        finish_trace(root)
+        headers = {
+            key: value for key, value in response.headers.items()
+            if key.lower() not in ("content-length", "content-type")
+        }
+        return JSONResponse(content, status_code=status, headers=headers)
+
+    body_iterator = response.body_iterator
+
+    async def traced_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            finish_trace(root)
+
+    response.body_iterator = traced_body()
+    return response
+
+
+def collect_cache_metrics():
+    """
+    キャッシュ・上流アクセス層の統計情報をメトリクスに変換する（/metrics の出力時に呼ばれる）
+    """
+    return cache_families({
+        "search": search_cache.stats(),
+        "detail": detail_cache.stats(),
+        "answers": answer_cache.stats(),
+        "sessions": session_store.stats()
+    }) + upstream_families(jgrants_upstream.stats())
+
+
+registry.add_collector(collect_cache_metrics)
+
+
+# バックグラウンドタスク（ミラー同期など）
+background_tasks: List[asyncio.Task] = []
+
+
+@app.on_event("startup")
+async def startup_event():
+    """
+    アプリケーション起動時の処理（ミラーモードなら定期同期を開始）
+    """
+    if mirror.mirror is not None:
+        background_tasks.append(asyncio.create_task(mirror.run_sync_loop()))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    アプリケーション終了時にバックグラウンドタスクを止め、共有HTTPクライアントを閉じる
+    """
+    for task in background_tasks:
+        task.cancel()
+    await close_client()
+    await close_llm_clients()
+    await close_exporters()
+
+
 # リクエストモデル定義
 class ChatMessage(BaseModel):
     role: str
@@ -47,8 +163,13 @@ class ChatMessage(BaseModel):
 
 
 class ChatRequest(BaseModel):
-    messages: List[ChatMessage]
+    messages: Optional[List[ChatMessage]] = None  # 履歴全体（セッションを使わない場合）
+    message: Optional[str] = None  # 新しいユーザーメッセージのみ（セッションを使う場合）
+    session_id: Optional[str] = None  # 省略時・期限切れ時は新しいセッションを発行
     model: str = "both"  # "claude", "openai", "both"
+    bypass_cache: bool = False  # True なら回答キャッシュを使わずに再生成する
+    deadline: Optional[float] = None  # 制限時間（秒）。省略時は CHAT_DEADLINE（既定は無制限）
+    first_finished: bool = False  # True なら最初に完了したモデルの回答で返し、残りは中断する
 
 
 class SubsidySearchRequest(BaseModel):
@@ -57,12 +178,81 @@ class SubsidySearchRequest(BaseModel):
     target_area: Optional[str] = None
     sort: str = "created_date"
     order: str = "DESC"
+    limit: Optional[int] = None  # 指定時はページ単位で返す（next_cursor で次ページ）
+    cursor: Optional[str] = None
+    # 上流APIにない絞り込み条件（ローカルで適用）
+    subsidy_limit_min: Optional[float] = None
+    subsidy_limit_max: Optional[float] = None
+    deadline_within_days: Optional[float] = None
+    employees: Optional[int] = None
+
+
+class SubsidyMultiSearchRequest(BaseModel):
+    keywords: List[str]
+    target_areas: Optional[List[str]] = None
+    acceptance: Optional[int] = 1
+    limit: Optional[int] = None
 
 
 class SubsidyDetailRequest(BaseModel):
     subsidy_id: str
 
 
+class SubsidyDetailsRequest(BaseModel):
+    subsidy_ids: List[str]
+
+
+class SimilarSubsidiesRequest(BaseModel):
+    subsidy_id: str
+    k: int = 5
+
+
+async def open_session(request: ChatRequest) -> Tuple[str, Dict[str, List[Dict[str, Any]]]]:
+    """
+    リクエストのセッションを読み込む（存在しない場合は新しいセッションを発行）
+
+    Returns:
+        (セッションID, モデルごとの履歴)
+    """
+    if request.session_id:
+        histories = await session_store.load(request.session_id)
+        if histories is not None:
+            return request.session_id, histories
+    return new_session_id(), {}
+
+
+async def prepare_turn(request: ChatRequest):
+    """
+    チャットリクエストからモデルごとの履歴と回答キャッシュのキーを組み立てる
+
+    Returns:
+        (セッションID（セッションを使わない場合はNone）, セッションの履歴, モデルごとのリクエスト用履歴, 回答キャッシュのキー)
+    """
+    if request.model not in SESSION_MODELS:
+        raise HTTPException(status_code=400, detail="Invalid model parameter")
+    if request.deadline is not None and request.deadline <= 0:
+        raise HTTPException(status_code=400, detail="deadline must be positive")
+    models = SESSION_MODELS[request.model]
+
+    if request.message is not None:
+        session_id, histories = await open_session(request)
+        turn = start_turn(histories, models, request.message)
+        key = answer_cache_key(request.model, conversation_questions(histories, models, request.message))
+        return session_id, histories, turn, key
+
+    if request.messages is None:
+        raise HTTPException(status_code=400, detail="messages or message is required")
+
+    # メッセージを辞書形式に変換
+    messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+    turn = {name: messages for name in models}
+
+    # 履歴を含むリクエストは回答を再利用できないため、単発の質問のみキャッシュする
+    single_question = len(messages) == 1 and messages[0]["role"] == "user"
+    key = answer_cache_key(request.model, [messages[0]["content"]]) if single_question else None
+    return None, {}, turn, key
+
+
 # ルート定義
 @app.get("/")
 async def root():
@@ -81,45 +271,149 @@ async def chat(request: ChatRequest) -> Dict[str, Any]:
     """
     チャット処理エンドポイント
 
-    Claude、OpenAI、または両方のモデルでチャット処理を実行
+    Claude、OpenAI、または両方のモデルでチャット処理を実行。
+    message を指定した場合はサーバー側のセッション履歴（ツール結果を含む）に続けて会話する。
+    同じ質問への回答は回答キャッシュから返す（bypass_cache で再生成）
+    制限時間（deadline）を過ぎたモデルは timed_out として返し、first_finished なら先に完了したモデルの回答で返す
     """
-    # メッセージを辞書形式に変換
-    messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+    deadline = Deadline.for_request(request.deadline)
+    session_id, histories, turn, key = await prepare_turn(request)
+
+    async def generate() -> Dict[str, Any]:
+        transcripts = {name: [] for name in turn}
+        results = await run_chat(turn, transcripts, deadline=deadline, first_finished=request.first_finished)
+        return {"responses": results, "transcripts": transcripts}
 
     try:
-        if request.model == "claude":
-            result = await chat_with_claude(messages)
-            return {"responses": {"claude": result}}
+        answer, cached = await fetch_answer(key, generate, bypass=request.bypass_cache)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Chat processing error: {str(e)}")
 
-        elif request.model == "openai":
-            result = await chat_with_openai(messages)
-            return {"responses": {"openai": result}}
+    if session_id is None:
+        return {"responses": answer["responses"], "cached": cached}
 
-        elif request.model == "both":
-            results = await chat_with_both(messages)
-            return {"responses": results}
+    await session_store.save(
+        session_id,
+        finish_turn(histories, turn, answer["transcripts"], answer["responses"])
+    )
+    return {"session_id": session_id, "responses": answer["responses"], "cached": cached}
 
-        else:
-            raise HTTPException(status_code=400, detail="Invalid model parameter")
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Chat processing error: {str(e)}")
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest, profile: bool = False) -> StreamingResponse:
+    """
+    チャット処理エンドポイント（Server-Sent Events）
+
+    モデルの生成トークン、ツール呼び出しの開始・完了、モデルごとの完了をイベントとして順次送信する。
+    "both" の場合は2モデルのイベントを1本の接続に多重化する。
+    message を指定した場合は最初に session イベントでセッションIDを送信し、完了後に履歴を保存する。
+    回答キャッシュにヒットした場合は回答全文を1イベントで送信する
+    制限時間（deadline）を過ぎたモデルは生成済みのテキストとともに timed_out の done イベントで終了する
+    ?profile=1 の場合は end の直前に処理時間の内訳を profile イベントで送信する
+    """
+    deadline = Deadline.for_request(request.deadline)
+    session_id, histories, turn, key = await prepare_turn(request)
+    cached = None if request.bypass_cache or key is None else answer_cache.get(key)
+
+    def sse(event: Dict[str, Any]) -> str:
+        return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    async def event_stream():
+        try:
+            if session_id is not None:
+                yield sse({"type": "session", "session_id": session_id})
+
+            if cached is not None:
+                answer = cached
+                for event in replay_events(answer):
+                    yield sse(event)
+            else:
+                answer = {"responses": {}, "transcripts": {name: [] for name in turn}}
+                events = stream_chat(
+                    [],
+                    request.model,
+                    histories=turn,
+                    transcripts=answer["transcripts"],
+                    deadline=deadline,
+                    first_finished=request.first_finished
+                )
+                async for event in events:
+                    if event["type"] == "done":
+                        answer["responses"][event["model"]] = event["result"]
+                    yield sse(event)
+                store_answer(key, answer)
+
+            if session_id is not None:
+                await session_store.save(
+                    session_id,
+                    finish_turn(histories, turn, answer["transcripts"], answer["responses"])
+                )
+        except Exception as e:
+            error = {"type": "error", "error": f"Chat processing error: {str(e)}"}
+            yield f"event: error\ndata: {json.dumps(error, ensure_ascii=False)}\n\n"
+        if profile:
+            yield sse({"type": "profile", "profile": breakdown(current_root())})
+        yield "event: end\ndata: {}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def search_response(result: Dict[str, Any], accept: Optional[str]) -> Any:
+    """
+    検索結果を返す（Accept: application/x-ndjson の場合は1行1件のNDJSON形式）
+
+    NDJSONモードでは件数と次ページのカーソルを X-Total-Count / X-Next-Cursor ヘッダーで返す。
+    エラーの場合は通常のJSONで返す。
+
+    NDJSONは応答の形式を変えるだけで、上流からの逐次取得やメモリ使用量の削減にはならない。
+    上流APIは一覧を1回の応答で返し、キャッシュ・列ストア・カーソルも全件を前提とするため、
+    result は取得済みの全件（またはそのページ）であり、ここではその各件を1行ずつ書き出す。
+    """
+    if not accept or NDJSON_MEDIA_TYPE not in accept or not result.get("success"):
+        return result
+
+    async def lines():
+        for subsidy in result["subsidies"]:
+            yield json.dumps(subsidy, ensure_ascii=False) + "\n"
+
+    headers = {"X-Total-Count": str(result.get("count", 0))}
+    if result.get("next_cursor"):
+        headers["X-Next-Cursor"] = result["next_cursor"]
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE, headers=headers)
 
 
 @app.post("/api/subsidies/search")
-async def search_subsidies_endpoint(request: SubsidySearchRequest) -> Dict[str, Any]:
+async def search_subsidies_endpoint(
+    request: SubsidySearchRequest,
+    accept: Optional[str] = Header(None)
+) -> Any:
     """
     補助金検索エンドポイント（直接検索）
+
+    limit / cursor でページ単位の取得、Accept: application/x-ndjson でNDJSON形式
     """
     try:
-        result = search_subsidies(
+        result = await search_subsidies(
             keyword=request.keyword,
             acceptance=request.acceptance,
             target_area_search=request.target_area,
             sort=request.sort,
-            order=request.order
+            order=request.order,
+            limit=request.limit,
+            cursor=request.cursor,
+            subsidy_limit_min=request.subsidy_limit_min,
+            subsidy_limit_max=request.subsidy_limit_max,
+            deadline_within_days=request.deadline_within_days,
+            employees=request.employees
         )
-        return result
+        return search_response(result, accept)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
 
@@ -127,14 +421,55 @@ async def search_subsidies_endpoint(request: SubsidySearchRequest) -> Dict[str,
 @app.get("/api/subsidies/active")
 async def search_active_subsidies_endpoint(
     keyword: str,
-    target_area: Optional[str] = None
-) -> Dict[str, Any]:
+    target_area: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    subsidy_limit_min: Optional[float] = None,
+    subsidy_limit_max: Optional[float] = None,
+    deadline_within_days: Optional[float] = None,
+    employees: Optional[int] = None,
+    accept: Optional[str] = Header(None)
+) -> Any:
     """
     募集中の補助金検索エンドポイント
+
+    limit / cursor でページ単位の取得、Accept: application/x-ndjson でNDJSON形式。
+    補助上限額・締切までの日数・従業員数はローカルで絞り込む
     """
     try:
-        result = search_active_subsidies(keyword, target_area)
-        return result
+        result = await search_active_subsidies(
+            keyword,
+            target_area,
+            limit=limit,
+            cursor=cursor,
+            subsidy_limit_min=subsidy_limit_min,
+            subsidy_limit_max=subsidy_limit_max,
+            deadline_within_days=deadline_within_days,
+            employees=employees
+        )
+        return search_response(result, accept)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
+
+
+@app.post("/api/subsidies/search/multi")
+async def search_subsidies_multi_endpoint(
+    request: SubsidyMultiSearchRequest,
+    accept: Optional[str] = Header(None)
+) -> Any:
+    """
+    複数キーワード検索エンドポイント（並行検索・重複除去・一致数と申請期限で並べ替え）
+
+    Accept: application/x-ndjson でNDJSON形式
+    """
+    try:
+        result = await search_subsidies_multi(
+            keywords=request.keywords,
+            target_areas=request.target_areas,
+            acceptance=request.acceptance,
+            limit=request.limit
+        )
+        return search_response(result, accept)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
 
@@ -145,12 +480,64 @@ async def get_subsidy_detail_endpoint(request: SubsidyDetailRequest) -> Dict[str
     補助金詳細取得エンドポイント
     """
     try:
-        result = get_subsidy_detail(request.subsidy_id)
+        result = await get_subsidy_detail(request.subsidy_id)
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Detail fetch error: {str(e)}")
+
+
+@app.post("/api/subsidies/details")
+async def get_subsidy_details_endpoint(request: SubsidyDetailsRequest) -> Dict[str, Any]:
+    """
+    補助金詳細一括取得エンドポイント（指定順に返し、IDごとの失敗は各要素の error で返す）
+    """
+    try:
+        result = await get_subsidy_details(request.subsidy_ids)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Detail fetch error: {str(e)}")
 
 
+@app.post("/api/subsidies/similar")
+async def find_similar_subsidies_endpoint(request: SimilarSubsidiesRequest) -> Dict[str, Any]:
+    """
+    類似補助金検索エンドポイント（取得済みの詳細から作ったローカル索引をBM25で検索）
+    """
+    try:
+        result = await find_similar_subsidies(request.subsidy_id, k=request.k)
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Similar search error: {str(e)}")
+
+
+@app.get("/api/cache/stats")
+async def cache_stats_endpoint() -> Dict[str, Any]:
+    """
+    キャッシュ統計エンドポイント（ヒット・ミス・破棄件数）
+    """
+    stats = await get_cache_stats()
+    stats["sessions"] = session_store.stats()
+    stats["answers"] = get_answer_cache_stats()
+    return stats
+
+
+@app.delete("/api/chat/sessions/{session_id}")
+async def delete_session_endpoint(session_id: str) -> Dict[str, Any]:
+    """
+    セッション削除エンドポイント（会話のリセット）
+    """
+    await session_store.delete(session_id)
+    return {"success": True}
+
+
+@app.get("/metrics")
+async def metrics_endpoint() -> Response:
+    """
+    メトリクスエンドポイント（Prometheusのテキスト形式）
+    """
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+
 @app.get("/api/health")
 async def health_check():
     """
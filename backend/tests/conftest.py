@@ -0,0 +1,11 @@
+"""
+テスト共通設定（backend/ を import パスに追加し、api パッケージを読み込めるようにする）
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# api.chat のLLMクライアントの初期化にはAPIキーが必要（テストでは偽のクライアントに差し替えて呼び出さない）
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
@@ -0,0 +1,50 @@
+"""
+チャット回答キャッシュ（answer_cache）のテスト
+"""
+import asyncio
+
+from api import answer_cache, jgrants
+
+
+def test_catalog_version_changes_when_upstream_data_changes_without_mirror(monkeypatch):
+    monkeypatch.setattr(answer_cache.mirror, "mirror", None)
+    key = ("search", "it", "created_date", "DESC", None, None, None, None, None)
+    jgrants.search_cache.set(key, {"success": True, "subsidies": [{"id": "a1"}]})
+    before = answer_cache.answer_cache_key("claude", ["IT導入補助金は？"])
+
+    # 同じ内容の再取得ではキーは変わらない
+    jgrants.search_cache.set(key, {"success": True, "subsidies": [{"id": "a1"}]})
+    assert answer_cache.answer_cache_key("claude", ["IT導入補助金は？"]) == before
+
+    # 再取得した内容が変わればカタログのバージョンが変わり、以前の回答は使われない
+    jgrants.search_cache.set(key, {"success": True, "subsidies": [{"id": "a1"}, {"id": "a2"}]})
+    assert answer_cache.answer_cache_key("claude", ["IT導入補助金は？"]) != before
+
+    jgrants.search_cache.delete(key)
+
+
+def test_answer_generated_across_a_catalog_update_is_not_stored(monkeypatch):
+    """
+    生成中にカタログが更新された回答は、生成前のバージョンのキーで保存しないこと
+    """
+    monkeypatch.setattr(answer_cache.mirror, "mirror", None)
+    search_key = ("search", "dx", "created_date", "DESC", None, None, None, None, None)
+    jgrants.search_cache.set(search_key, {"success": True, "subsidies": [{"id": "a1"}]})
+    answer = {"responses": {"claude": {"success": True, "response": "a1 があります"}}, "transcripts": {"claude": []}}
+
+    key = answer_cache.answer_cache_key("claude", ["DXの補助金は？"])
+    answer_cache.store_answer(key, answer)
+    assert answer_cache.answer_cache.get(key) == answer
+
+    async def generate():
+        # ツール呼び出しで上流の変更を検知した
+        jgrants.search_cache.set(search_key, {"success": True, "subsidies": [{"id": "a2"}]})
+        return answer
+
+    key = answer_cache.answer_cache_key("claude", ["DXの補助金は？（再）"])
+    result, cached = asyncio.run(answer_cache.fetch_answer(key, generate))
+
+    assert (result, cached) == (answer, False)
+    assert answer_cache.answer_cache.get(key) is None
+
+    jgrants.search_cache.delete(search_key)
@@ -0,0 +1,166 @@
+"""
+結果キャッシュ（TTLCache）のテスト
+"""
+import asyncio
+
+from api.cache import SQLiteStore, TTLCache, cached_fetch, conditional_fetch
+
+
+def test_lru_evicts_least_recently_used_entries():
+    """
+    エントリ数・バイト数の上限を超えたら、最も古く使われたものから破棄すること
+    """
+    cache = TTLCache(ttl=60, max_entries=2)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}
+    cache.set("c", {"v": 3})
+
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    assert cache.evictions == 1
+
+    small = TTLCache(ttl=60, max_bytes=600)
+    small.set("a", {"text": "x" * 200})
+    small.set("b", {"text": "y" * 200})
+    small.set("c", {"text": "z" * 200})
+    assert "a" not in small
+    assert small.stats()["bytes"] <= 600
+
+    # 上限より大きい値は登録しない
+    small.set("huge", {"text": "x" * 1000})
+    assert "huge" not in small
+
+
+def test_stale_value_is_served_while_refreshing_in_background():
+    """
+    TTL切れ（stale_ttl 内）の値は即座に返し、裏で再取得した値で置き換えること
+    """
+    async def scenario():
+        cache = TTLCache(ttl=60, stale_ttl=60)
+        cache.set("k", {"success": True, "n": 1}, ttl=-1)
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"success": True, "n": 2}
+
+        assert await cached_fetch(cache, "k", fetch) == {"success": True, "n": 1}
+        # 再取得中の同じキーの参照では再取得を重ねて起動しない
+        assert await cached_fetch(cache, "k", fetch) == {"success": True, "n": 1}
+        await asyncio.sleep(0.05)
+
+        assert calls == [1]
+        assert await cached_fetch(cache, "k", fetch) == {"success": True, "n": 2}
+        assert cache.stale_hits == 2 and cache.refreshes == 1
+
+    asyncio.run(scenario())
+
+
+def test_failed_results_are_not_cached():
+    async def scenario():
+        cache = TTLCache(ttl=60)
+        results = [{"success": False, "error": "503"}, {"success": True, "n": 1}]
+
+        async def fetch():
+            return results.pop(0)
+
+        assert (await cached_fetch(cache, "k", fetch))["success"] is False
+        assert "k" not in cache
+        assert await cached_fetch(cache, "k", fetch) == {"success": True, "n": 1}
+        assert cache.get("k") == {"success": True, "n": 1}
+
+    asyncio.run(scenario())
+
+
+def test_persisted_entries_survive_restart(tmp_path):
+    """
+    永続化したエントリ（タプルのキー・検証子・有効期限）が別のキャッシュに読み込まれること
+    """
+    path = str(tmp_path / "cache.sqlite3")
+    store = SQLiteStore(path)
+    cache = TTLCache(ttl=60, stale_ttl=60, name="search")
+    cache.persist(store)
+    cache.set(("search", "dx", None), {"success": True, "subsidies": []}, validators={"etag": "\"v1\""})
+    cache.set(("search", "old", None), {"success": True, "subsidies": []}, ttl=-120)
+    store.close()
+
+    restored = TTLCache(ttl=60, stale_ttl=60, name="search")
+    assert restored.persist(SQLiteStore(path)) == 1
+    assert restored.get(("search", "dx", None)) == {"success": True, "subsidies": []}
+    assert restored.validators(("search", "dx", None)) == {"etag": "\"v1\""}
+    # 提供期限を過ぎたエントリは読み込まない
+    assert ("search", "old", None) not in restored
+
+
+def test_caches_with_different_names_do_not_mix(tmp_path):
+    """
+    同じファイルに保存しても、キャッシュ名が違えば互いのエントリを読み込まないこと
+    """
+    path = str(tmp_path / "cache.sqlite3")
+    store = SQLiteStore(path)
+    search = TTLCache(ttl=60, name="search")
+    search.persist(store)
+    search.set("a1", {"success": True})
+    store.close()
+
+    detail = TTLCache(ttl=60, name="detail")
+    assert detail.persist(SQLiteStore(path)) == 0
+    assert "a1" not in detail
+
+
+def test_generation_counts_only_changed_values():
+    """
+    世代は既存エントリの内容が変わった場合のみ進むこと（新規登録・同じ内容での再登録では進まない）
+    """
+    cache = TTLCache(ttl=60)
+    cache.set("k", {"subsidies": [1]})
+    cache.set("k", {"subsidies": [1]})
+    cache.set("other", {"subsidies": []})
+    assert cache.generation == 0
+
+    cache.set("k", {"subsidies": [1, 2]})
+    assert cache.generation == 1
+
+
+def test_expired_entry_is_revalidated_with_its_validators():
+    """
+    提供期限を過ぎた（keep_expired で保持している）エントリも、保存した検証子で条件付き取得すること
+    """
+    cache = TTLCache(ttl=60, stale_ttl=0, keep_expired=True)
+    cache.set("a1", {"success": True, "subsidy": {"id": "a1"}}, ttl=-1, validators={"etag": "\"v1\""})
+    sent = []
+
+    async def fetch(validators):
+        sent.append(validators)
+        return None, validators
+
+    result = asyncio.run(conditional_fetch(cache, "a1", fetch))
+
+    assert sent == [{"etag": "\"v1\""}]
+    assert result == {"success": True, "subsidy": {"id": "a1"}}
+    assert cache.get("a1") == result
+
+
+def test_refresh_revalidates_a_fresh_entry():
+    """
+    refresh=True なら有効期限内のエントリでも上流で再検証し、変更があれば置き換えること（ミラー同期用）
+    """
+    cache = TTLCache(ttl=60, stale_ttl=60)
+    cache.set("a1", {"success": True, "subsidy": {"id": "a1", "title": "旧"}}, validators={"etag": "\"v1\""})
+    sent = []
+
+    async def fetch(validators):
+        sent.append(validators)
+        return {"success": True, "subsidy": {"id": "a1", "title": "新"}}, {"etag": "\"v2\""}
+
+    assert asyncio.run(conditional_fetch(cache, "a1", fetch))["subsidy"]["title"] == "旧"
+    assert sent == []
+
+    result = asyncio.run(conditional_fetch(cache, "a1", fetch, refresh=True))
+
+    assert sent == [{"etag": "\"v1\""}]
+    assert result["subsidy"]["title"] == "新"
+    assert cache.get("a1")["subsidy"]["title"] == "新"
+    assert cache.validators("a1") == {"etag": "\"v2\""}
@@ -0,0 +1,264 @@
+"""
+チャット処理（api.chat）のツールループのテスト（LLMクライアントは偽物に差し替える）
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from api import chat
+from api.deadline import Deadline
+
+
+def claude_text(text):
+    return SimpleNamespace(type="text", text=text)
+
+
+def claude_tool_use(name, arguments):
+    return SimpleNamespace(type="tool_use", id="toolu_1", name=name, input=arguments)
+
+
+def openai_message(content, tool_calls=None):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+
+def openai_tool_call(name, arguments):
+    return SimpleNamespace(id="call_1", function=SimpleNamespace(name=name, arguments=arguments))
+
+
+class FakeCreate:
+    """
+    呼び出しごとに responses の要素を返す（"hang" なら応答しない）
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def __call__(self, **options):
+        self.calls.append(options)
+        response = self.responses.pop(0)
+
+        async def respond():
+            if response == "hang":
+                await asyncio.sleep(3600)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return respond()
+
+
+@pytest.fixture
+def fake_tools(monkeypatch):
+    async def execute_tools(calls, iteration=0, on_result=None):
+        return [{"success": True, "count": 0, "subsidies": []} for _ in calls]
+    monkeypatch.setattr(chat, "execute_tools", execute_tools)
+
+
+def fake_claude(monkeypatch, responses):
+    monkeypatch.setattr(chat, "anthropic_client", SimpleNamespace(messages=SimpleNamespace(create=FakeCreate(responses))))
+
+
+def fake_openai(monkeypatch, responses):
+    completions = SimpleNamespace(create=FakeCreate(responses))
+    monkeypatch.setattr(chat, "openai_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+
+
+def test_claude_timeout_keeps_text_generated_so_far(monkeypatch, fake_tools):
+    fake_claude(monkeypatch, [
+        SimpleNamespace(
+            stop_reason="tool_use",
+            content=[claude_text("IT導入補助金を検索します。"), claude_tool_use("search_subsidies", {"keyword": "IT導入"})],
+            usage=None
+        ),
+        "hang"
+    ])
+
+    result = asyncio.run(chat.chat_with_claude([{"role": "user", "content": "IT"}], deadline=Deadline(0.2)))
+
+    assert result["timed_out"] is True
+    assert result["response"] == "IT導入補助金を検索します。"
+    assert [call["name"] for call in result["tool_calls"]] == ["search_subsidies"]
+
+
+def test_openai_timeout_keeps_text_generated_so_far(monkeypatch, fake_tools):
+    fake_openai(monkeypatch, [
+        openai_message("IT導入補助金を検索します。", [openai_tool_call("search_subsidies", '{"keyword": "IT導入"}')]),
+        "hang"
+    ])
+
+    result = asyncio.run(chat.chat_with_openai([{"role": "user", "content": "IT"}], deadline=Deadline(0.2)))
+
+    assert result["timed_out"] is True
+    assert result["response"] == "IT導入補助金を検索します。"
+    assert [call["name"] for call in result["tool_calls"]] == ["search_subsidies"]
+
+
+def test_claude_error_result_includes_usage_so_far(monkeypatch, fake_tools):
+    fake_claude(monkeypatch, [
+        SimpleNamespace(
+            stop_reason="tool_use",
+            content=[claude_tool_use("search_subsidies", {"keyword": "IT導入"})],
+            usage=SimpleNamespace(input_tokens=100, output_tokens=20)
+        ),
+        RuntimeError("overloaded")
+    ])
+
+    result = asyncio.run(chat.chat_with_claude([{"role": "user", "content": "IT"}]))
+
+    assert result["success"] is False
+    assert result["usage"]["input_tokens"] == 100
+    assert result["usage"]["output_tokens"] == 20
+
+
+def test_openai_error_result_includes_zero_usage(monkeypatch, fake_tools):
+    fake_openai(monkeypatch, [RuntimeError("rate limited")])
+
+    result = asyncio.run(chat.chat_with_openai([{"role": "user", "content": "IT"}]))
+
+    assert result["success"] is False
+    assert result["usage"] == chat.empty_usage()
+
+
+async def openai_stream(content, tool_call=None):
+    for piece in content:
+        yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=piece, tool_calls=None))])
+    if tool_call is not None:
+        delta = SimpleNamespace(content=None, tool_calls=[SimpleNamespace(index=0, **vars(tool_call))])
+        yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=delta)])
+
+
+def test_streamed_answer_matches_non_streaming_answer(monkeypatch, fake_tools):
+    """
+    ストリーミングでも回答（保存・キャッシュされる response）はツール呼び出し前の説明を含まない最後のターンのみ
+    """
+    tool_call = openai_tool_call("search_subsidies", '{"keyword": "IT導入"}')
+    fake_openai(monkeypatch, [
+        openai_stream(["検索", "します。"], tool_call),
+        openai_stream(["IT導入補助金", "があります。"])
+    ])
+    events = []
+
+    async def emit(event):
+        events.append(event)
+
+    result = asyncio.run(chat.stream_with_openai([{"role": "user", "content": "IT"}], emit))
+
+    assert result["response"] == "IT導入補助金があります。"
+    # 説明も含めてトークンは逐次送信される
+    assert "".join(event["text"] for event in events if event["type"] == "token") == "検索します。IT導入補助金があります。"
+
+
+def test_first_finished_keeps_progress_of_cancelled_model(monkeypatch, fake_tools):
+    """
+    先着モードで中断したモデルも、それまでのテキスト・ツール呼び出し・使用量を返すこと
+    """
+    fake_claude(monkeypatch, [
+        SimpleNamespace(stop_reason="end_turn", content=[claude_text("IT導入補助金があります。")], usage=None)
+    ])
+    first = openai_message("IT導入補助金を検索します。", [openai_tool_call("search_subsidies", '{"keyword": "IT導入"}')])
+    first.usage = SimpleNamespace(prompt_tokens=120, completion_tokens=30, prompt_tokens_details=None)
+    fake_openai(monkeypatch, [first, "hang"])
+
+    async def scenario():
+        # Claude の完了を OpenAI のツール呼び出しの後まで遅らせる
+        create = chat.anthropic_client.messages.create
+
+        async def delayed(**options):
+            await asyncio.sleep(0.1)
+            return await create(**options)
+        chat.anthropic_client.messages.create = delayed
+
+        history = [{"role": "user", "content": "IT"}]
+        return await chat.run_chat({"claude": history, "openai": history}, first_finished=True)
+
+    results = asyncio.run(scenario())
+
+    assert results["claude"]["success"] is True
+    cancelled = results["openai"]
+    assert cancelled["timed_out"] is True
+    assert cancelled["error"] == chat.CANCELLED_MESSAGE
+    assert cancelled["response"] == "IT導入補助金を検索します。"
+    assert [call["name"] for call in cancelled["tool_calls"]] == ["search_subsidies"]
+    assert cancelled["usage"]["input_tokens"] == 120
+    assert cancelled["usage"]["output_tokens"] == 30
+
+
+class FakeClaudeStream:
+    """
+    messages.stream() の偽物（delay 秒待ってから text を1トークンで返す）
+    """
+
+    def __init__(self, text, delay):
+        self.text = text
+        self.delay = delay
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    @property
+    async def text_stream(self):
+        await asyncio.sleep(self.delay)
+        yield self.text
+
+    async def get_final_message(self):
+        return SimpleNamespace(stop_reason="end_turn", content=[claude_text(self.text)], usage=None)
+
+
+def test_first_finished_stream_keeps_progress_of_cancelled_model(monkeypatch, fake_tools):
+    stream = FakeClaudeStream("IT導入補助金があります。", delay=0.1)
+    monkeypatch.setattr(chat, "anthropic_client", SimpleNamespace(messages=SimpleNamespace(stream=lambda **options: stream)))
+    tool_call = openai_tool_call("search_subsidies", '{"keyword": "IT導入"}')
+
+    async def with_usage():
+        async for chunk in openai_stream(["検索", "します。"], tool_call):
+            yield chunk
+        yield SimpleNamespace(usage=SimpleNamespace(prompt_tokens=120, completion_tokens=30, prompt_tokens_details=None), choices=[])
+
+    async def hanging_stream():
+        yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content="比較", tool_calls=None))])
+        await asyncio.sleep(3600)
+
+    fake_openai(monkeypatch, [with_usage(), hanging_stream()])
+
+    async def scenario():
+        return [event async for event in chat.stream_chat([{"role": "user", "content": "IT"}], first_finished=True)]
+
+    done = {event["model"]: event["result"] for event in asyncio.run(scenario()) if event["type"] == "done"}
+
+    assert done["claude"]["success"] is True
+    cancelled = done["openai"]
+    assert cancelled["error"] == chat.CANCELLED_MESSAGE
+    assert cancelled["response"] == "比較"
+    assert [call["name"] for call in cancelled["tool_calls"]] == ["search_subsidies"]
+    assert cancelled["usage"]["input_tokens"] == 120
+
+
+def test_claude_requests_reuse_cached_prefix(monkeypatch, fake_tools):
+    """
+    システムプロンプト・ツール定義は起動時に作ったものを毎回送り、履歴の末尾にキャッシュブレークポイントを置くこと
+    """
+    fake_claude(monkeypatch, [
+        SimpleNamespace(stop_reason="tool_use", content=[claude_tool_use("search_subsidies", {"keyword": "IT導入"})], usage=None),
+        SimpleNamespace(stop_reason="end_turn", content=[claude_text("あります。")], usage=None)
+    ])
+    history = [{"role": "user", "content": "IT"}]
+
+    asyncio.run(chat.chat_with_claude(history))
+
+    first, second = chat.anthropic_client.messages.create.calls
+    assert first["system"] is second["system"] is chat.CLAUDE_SYSTEM
+    assert first["tools"] is second["tools"] is chat.CLAUDE_TOOLS
+    assert chat.CLAUDE_SYSTEM[-1]["cache_control"] == chat.CACHE_CONTROL
+    assert chat.CLAUDE_TOOLS[-1]["cache_control"] == chat.CACHE_CONTROL
+    assert all("cache_control" not in tool for tool in chat.CLAUDE_TOOLS[:-1])
+
+    assert first["messages"] == [{"role": "user", "content": [{"type": "text", "text": "IT", "cache_control": chat.CACHE_CONTROL}]}]
+    assert second["messages"][-1]["content"][-1]["type"] == "tool_result"
+    assert second["messages"][-1]["content"][-1]["cache_control"] == chat.CACHE_CONTROL
+    # 前の反復で付けたブレークポイントは残らず、呼び出し元の履歴も変更しない
+    assert second["messages"][0] == {"role": "user", "content": "IT"}
+    assert history == [{"role": "user", "content": "IT"}]
@@ -0,0 +1,129 @@
+"""
+列指向ストア（columnar）のテスト（絞り込み・並べ替えを素朴なPython実装と比較する）
+"""
+import math
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+from api.columnar import (
+    DAY_SECONDS, ColumnViews, SubsidyColumns, SubsidyFilters, filter_result, parse_amount, parse_employees
+)
+
+NOW = datetime(2025, 6, 1, tzinfo=timezone.utc).timestamp()
+
+AMOUNTS = [None, "", "不明", 500000, 4500000.0, "1,000,000", "３０００万円", 10000000, 10000000, 0]
+EMPLOYEES = [None, "従業員数の制約なし", "20名以下", "300人以下", "50名未満", "901名以上", "100名超", "中小企業"]
+
+
+def make_records(count, seed):
+    rng = random.Random(seed)
+    records = []
+    for index in range(count):
+        days = rng.choice([None, -10, 0.5, 3, 14, 30, 90, 400])
+        end = None if days is None else datetime.fromtimestamp(NOW + days * DAY_SECONDS, timezone.utc).isoformat()
+        records.append({
+            "id": f"r{index}",
+            "subsidy_max_limit": rng.choice(AMOUNTS),
+            "acceptance_end": end.replace("+00:00", "Z") if end else rng.choice([None, "未定"]),
+            "target_employees": rng.choice(EMPLOYEES)
+        })
+    return records
+
+
+def reference_select(records, filters, sort=None, order="DESC"):
+    """
+    1件ずつ条件を評価する素朴な実装
+    """
+    def deadline(record):
+        try:
+            return datetime.fromisoformat(record["acceptance_end"].replace("Z", "+00:00")).timestamp()
+        except (AttributeError, ValueError):
+            return math.nan
+
+    selected = []
+    for record in records:
+        amount = parse_amount(record["subsidy_max_limit"])
+        low, high = parse_employees(record["target_employees"])
+        if filters.subsidy_limit_min is not None and not amount >= filters.subsidy_limit_min:
+            continue
+        if filters.subsidy_limit_max is not None and not amount <= filters.subsidy_limit_max:
+            continue
+        if filters.deadline_within_days is not None:
+            end = deadline(record)
+            if not NOW <= end <= NOW + filters.deadline_within_days * DAY_SECONDS:
+                continue
+        if filters.employees is not None and not low <= filters.employees <= high:
+            continue
+        selected.append(record)
+
+    if sort == "subsidy_max_limit":
+        known = [r for r in selected if not math.isnan(parse_amount(r["subsidy_max_limit"]))]
+        unknown = [r for r in selected if math.isnan(parse_amount(r["subsidy_max_limit"]))]
+        known.sort(key=lambda r: parse_amount(r["subsidy_max_limit"]), reverse=order == "DESC")
+        selected = known + unknown
+    return selected
+
+
+FILTERS = [
+    SubsidyFilters(),
+    SubsidyFilters(subsidy_limit_min=1000000),
+    SubsidyFilters(subsidy_limit_max=4500000),
+    SubsidyFilters(subsidy_limit_min=1000000, subsidy_limit_max=10000000),
+    SubsidyFilters(deadline_within_days=14),
+    SubsidyFilters(deadline_within_days=0),
+    SubsidyFilters(employees=20),
+    SubsidyFilters(employees=1000),
+    SubsidyFilters(subsidy_limit_min=0, deadline_within_days=90, employees=50)
+]
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+@pytest.mark.parametrize("filters", FILTERS)
+def test_vectorized_select_matches_plain_python(seed, filters):
+    records = make_records(300, seed)
+    columns = SubsidyColumns(records)
+
+    for sort, order in [(None, "DESC"), ("subsidy_max_limit", "DESC"), ("subsidy_max_limit", "ASC")]:
+        expected = reference_select(records, filters, sort, order)
+        actual = columns.select(filters, sort=sort, order=order, now=NOW)
+        assert [r["id"] for r in actual] == [r["id"] for r in expected]
+
+
+def test_parsers():
+    assert parse_amount("1,000,000円") == 1000000
+    assert parse_amount("４５０００００") == 4500000
+    # 解析できない表記・真偽値は不明（NaN）
+    assert math.isnan(parse_amount("３０００万円"))
+    assert math.isnan(parse_amount(True))
+    assert parse_employees("20名以下") == (0, 20)
+    assert parse_employees("50名未満") == (0, 49)
+    assert parse_employees("901名以上") == (901, math.inf)
+    assert parse_employees("100名超") == (101, math.inf)
+    assert parse_employees("中小企業") == (0, math.inf)
+
+
+def test_empty_result_and_view_reuse():
+    views = ColumnViews(max_entries=1)
+    result = {"success": True, "count": 0, "subsidies": []}
+    assert views.get("k", result).select(SubsidyFilters(employees=5), sort="subsidy_max_limit") == []
+
+    # 同じ結果オブジェクトなら列を再利用し、差し替わったら作り直す
+    views.get("k", result)
+    assert views.stats() == {"entries": 1, "builds": 1, "hits": 1}
+    views.get("k", {"success": True, "count": 0, "subsidies": []})
+    views.get("other", result)
+    assert views.stats() == {"entries": 1, "builds": 3, "hits": 1}
+
+
+def test_filter_result_reports_counts_without_touching_the_cached_result():
+    records = make_records(50, 7)
+    result = {"success": True, "count": 50, "subsidies": records}
+
+    filtered = filter_result(("search", "t"), result, SubsidyFilters(subsidy_limit_min=1000000), sort="subsidy_max_limit")
+
+    assert filtered["total_before_filter"] == 50
+    assert filtered["count"] == len(filtered["subsidies"]) < 50
+    assert result["subsidies"] is records and len(records) == 50
+    assert filter_result(("search", "t"), result, SubsidyFilters()) is result
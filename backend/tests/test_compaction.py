@@ -0,0 +1,110 @@
+"""
+チャット履歴の圧縮（compaction）のテスト
+"""
+import json
+
+from api.compaction import SUMMARY_PREFIX, compact_history, estimate_history_tokens, is_summary
+
+BIG_RESULT = json.dumps({
+    "success": True,
+    "count": 40,
+    "subsidies": [{"id": f"a{i}", "title": f"補助金{i}", "outline": "設備投資を支援します。" * 20} for i in range(40)]
+}, ensure_ascii=False)
+
+
+def claude_turn(index):
+    """
+    Claude 形式の1ターン（質問・ツール呼び出し・ツール結果・回答）
+    """
+    return [
+        {"role": "user", "content": f"質問{index}"},
+        {"role": "assistant", "content": [{"type": "tool_use", "id": f"toolu_{index}", "name": "search_subsidies", "input": {"keyword": f"k{index}"}}]},
+        {"role": "user", "content": [{"type": "tool_result", "tool_use_id": f"toolu_{index}", "content": BIG_RESULT}]},
+        {"role": "assistant", "content": [{"type": "text", "text": f"回答{index}"}]}
+    ]
+
+
+def openai_turn(index):
+    return [
+        {"role": "user", "content": f"質問{index}"},
+        {"role": "assistant", "content": None, "tool_calls": [
+            {"id": f"call_{index}", "type": "function", "function": {"name": "search_subsidies", "arguments": "{}"}}
+        ]},
+        {"role": "tool", "tool_call_id": f"call_{index}", "content": BIG_RESULT},
+        {"role": "assistant", "content": f"回答{index}"}
+    ]
+
+
+def assert_tool_pairs_intact(messages):
+    """
+    全ての tool_result（role=tool）が直前のアシスタントの呼び出しと対になっていること
+    """
+    pending = set()
+    for message in messages:
+        if message["role"] == "assistant":
+            content = message.get("content")
+            pending = {block["id"] for block in content if block.get("type") == "tool_use"} if isinstance(content, list) else set()
+            pending |= {call["id"] for call in message.get("tool_calls") or []}
+        elif message["role"] == "tool":
+            pending.remove(message["tool_call_id"])
+        elif isinstance(message["content"], list):
+            for block in message["content"]:
+                pending.remove(block["tool_use_id"])
+    assert not pending
+
+
+def test_history_within_budget_is_returned_as_is():
+    history = claude_turn(1)
+    assert compact_history(history, budget=10 ** 6) is history
+
+
+def test_old_tool_results_become_references_first():
+    history = [message for index in range(4) for message in claude_turn(index)]
+    budget = estimate_history_tokens(history) - 1
+
+    compacted = compact_history(history, budget=budget, keep_turns=2)
+
+    assert compacted[8:] == history[8:]
+    reference = json.loads(compacted[2]["content"][0]["content"])
+    assert reference["compacted"] is True
+    assert reference["count"] == 40
+    assert reference["subsidies"][0] == {"id": "a0", "title": "補助金0"}
+    assert compacted[1] == history[1]
+    assert_tool_pairs_intact(compacted)
+
+
+def test_old_turns_are_summarized_when_references_are_not_enough():
+    history = [message for index in range(4) for message in openai_turn(index)]
+    system = {"role": "system", "content": "system prompt"}
+    messages = [system] + history
+
+    compacted = compact_history(messages, budget=1, keep_turns=1)
+
+    assert compacted[0] == system
+    assert is_summary(compacted[1])
+    assert compacted[2:] == history[-4:]
+    assert_tool_pairs_intact(compacted)
+    summary = json.loads(compacted[1]["content"][len(SUMMARY_PREFIX):])
+    assert [turn["q"] for turn in summary["turns"]] == ["質問0", "質問1", "質問2"]
+    assert summary["turns"][0]["a"] == "回答0"
+    assert len(summary["subsidies"]) == 30
+
+    # 圧縮結果は入力だけで決まり、次のターンでは以前の要約に追記される
+    assert compact_history(messages, budget=1, keep_turns=1) == compacted
+    again = compact_history(compacted + openai_turn(4), budget=1, keep_turns=1)
+    assert [turn["q"] for turn in json.loads(again[1]["content"][len(SUMMARY_PREFIX):])["turns"]] == [
+        "質問0", "質問1", "質問2", "質問3"
+    ]
+    assert_tool_pairs_intact(again)
+
+
+def test_in_progress_tool_loop_is_never_compacted():
+    """
+    進行中のツールループ（最後のユーザー発言以降）は予算を超えていてもそのまま残すこと
+    """
+    history = claude_turn(0) + claude_turn(1)[:3] + claude_turn(2)[1:3]
+
+    compacted = compact_history(history, budget=1, keep_turns=1)
+
+    assert compacted[1:] == history[4:]
+    assert_tool_pairs_intact(compacted)
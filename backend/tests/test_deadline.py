@@ -0,0 +1,24 @@
+"""
+チャットの制限時間（Deadline）のテスト
+"""
+import math
+
+from api import deadline as deadline_module
+from api.deadline import Deadline
+
+
+def test_default_deadline_is_unlimited(monkeypatch):
+    monkeypatch.setattr(deadline_module, "CHAT_DEADLINE", 0.0)
+
+    deadline = Deadline.for_request(None)
+
+    assert deadline.seconds is None
+    assert deadline.remaining() == math.inf
+    assert deadline.max_tokens(4096) == 4096
+
+
+def test_requested_deadline_is_capped(monkeypatch):
+    monkeypatch.setattr(deadline_module, "CHAT_MAX_DEADLINE", 300.0)
+
+    assert Deadline.for_request(30).seconds == 30
+    assert Deadline.for_request(1000).seconds == 300
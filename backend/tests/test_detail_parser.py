@@ -0,0 +1,75 @@
+"""
+補助金詳細のストリーミングパーサー（DetailStreamParser）のテスト
+"""
+import base64
+import json
+
+import pytest
+
+from api.detail_parser import DetailStreamParser
+
+PDF = bytes(range(256)) * 12
+XLSX = b"PK\x03\x04" + b"\x00" * 600
+
+DETAIL = {
+    "result": [
+        {
+            "id": "a1",
+            "title": "ものづくり補助金 \"一般型\" \\ 第18次",
+            "subsidy_max_limit": 12500000,
+            "application_form_files": [
+                {"name": "01_公募要領.pdf", "data": base64.b64encode(PDF).decode()},
+                {"name": "02_様式\\\"1\".xlsx", "mime_type": "application/vnd.ms-excel", "data": base64.b64encode(XLSX).decode()}
+            ],
+            "outline": "設備投資を支援します",
+            "tags": [{"name": "製造業"}, [1, 2, {"k": "v"}]]
+        }
+    ]
+}
+
+
+def parse(raw: bytes, size: int) -> DetailStreamParser:
+    parser = DetailStreamParser()
+    for start in range(0, len(raw), size):
+        parser.feed(raw[start:start + size])
+    return parser
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 1 << 20])
+def test_split_chunks_skip_file_bodies(size):
+    """
+    どこでチャンクが分割されても（エスケープや引用符の途中を含む）同じ結果になること
+    """
+    raw = json.dumps(DETAIL, ensure_ascii=False).encode("utf-8")
+    parser = parse(raw, size)
+
+    record = parser.result()["result"][0]
+    expected = json.loads(raw)["result"][0]
+    assert record["application_form_files"] == [
+        {"name": "01_公募要領.pdf", "data": ""},
+        {"name": "02_様式\\\"1\".xlsx", "mime_type": "", "data": ""}
+    ]
+    for key in ("id", "title", "subsidy_max_limit", "outline", "tags"):
+        assert record[key] == expected[key]
+
+    assert parser.bytes_received == len(raw)
+    assert [f["name"] for f in parser.files["application_form_files"]] == ["01_公募要領.pdf", "02_様式\\\"1\".xlsx"]
+
+
+def test_file_size_counts_only_the_file_body():
+    """
+    サイズはファイル本体（base64）の長さだけから概算し、MIMEタイプなどは数えないこと
+    """
+    raw = json.dumps(DETAIL, ensure_ascii=False).encode("utf-8")
+    files = parse(raw, 5).files["application_form_files"]
+
+    assert files[0]["size"] == len(PDF)
+    assert abs(files[1]["size"] - len(XLSX)) <= 2
+
+
+def test_truncated_response_is_rejected():
+    raw = json.dumps(DETAIL, ensure_ascii=False).encode("utf-8")
+    parser = parse(raw[:len(raw) // 2], 16)
+
+    with pytest.raises(ValueError):
+        parser.result()
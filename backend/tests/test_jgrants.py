@@ -0,0 +1,223 @@
+"""
+JグランツAPIクライアント（api.jgrants）のテスト（上流は httpx.MockTransport の偽物に差し替える）
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from api import jgrants, mirror
+from api.upstream import UpstreamGuard
+
+
+def search_record(index, title="IT導入補助金"):
+    return {
+        "id": f"s{index:03d}",
+        "title": f"{title}{index}",
+        "subsidy_max_limit": 1000000 * (index % 7 + 1),
+        "acceptance_end_datetime": "2099-12-31T00:00:00Z"
+    }
+
+
+def detail_body(subsidy_id, title):
+    return {"result": [{"id": subsidy_id, "title": title, "application_form_files": [{"name": "01.pdf", "data": "QUJD"}]}]}
+
+
+class FakeJgrants:
+    """
+    記録した詳細を返す偽のJグランツAPI（受け取ったリクエストを requests に記録する）
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.details = {}
+        self.etags = {}
+        self.subsidies = []
+        self.failing_keywords = set()
+        # 応答までの待ち時間と、同時に処理中のリクエスト数の最大値
+        self.delay = 0.0
+        self.active = 0
+        self.max_active = 0
+
+    async def handler(self, request):
+        self.requests.append(request)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        if request.url.path.endswith("/subsidies"):
+            keyword = request.url.params["keyword"]
+            if keyword in self.failing_keywords:
+                return httpx.Response(500)
+            found = [record for record in self.subsidies if keyword in record["title"]]
+            return httpx.Response(200, json={"metadata": {"resultset": {"count": len(found)}}, "result": found})
+        subsidy_id = request.url.path.rsplit("/", 1)[-1]
+        if subsidy_id not in self.details:
+            return httpx.Response(200, json={"result": []})
+        etag = self.etags.get(subsidy_id)
+        if etag is not None and request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304)
+        headers = {"ETag": etag} if etag else {}
+        return httpx.Response(200, headers=headers, content=json.dumps(self.details[subsidy_id]).encode("utf-8"))
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """
+    偽のJグランツAPIにつないだクライアントと空のキャッシュ
+    """
+    fake = FakeJgrants()
+    client = httpx.AsyncClient(base_url=jgrants.JGRANTS_API_BASE, transport=httpx.MockTransport(fake.handler))
+    monkeypatch.setattr(jgrants, "_client", client)
+    monkeypatch.setattr(mirror, "mirror", None)
+    # テスト間でレート制限のトークン・サーキットの状態を持ち越さない
+    monkeypatch.setattr(jgrants, "jgrants_upstream", UpstreamGuard(rate=0, retries=0))
+    jgrants.search_cache.clear()
+    jgrants.detail_cache.clear()
+    yield fake
+    jgrants.search_cache.clear()
+    jgrants.detail_cache.clear()
+
+
+def test_detail_cache_revalidates_with_etag(upstream):
+    """
+    詳細は新鮮な間は上流に問い合わせず、期限切れ後は ETag で条件付き取得すること
+    """
+    upstream.details["a1"] = detail_body("a1", "IT導入補助金")
+    upstream.etags["a1"] = "\"v1\""
+
+    async def scenario():
+        first = await jgrants.get_subsidy_detail("a1")
+        assert first["subsidy"]["title"] == "IT導入補助金"
+        assert first["subsidy"]["application_form_file_info"] == [{"name": "01.pdf", "size": 3}]
+        assert await jgrants.get_subsidy_detail("a1") == first
+        assert len(upstream.requests) == 1
+
+        # 期限切れ（提供期限内）: 古い値を返しつつ裏で再検証し、304 なら有効期限を延ばす
+        jgrants.detail_cache.touch("a1", ttl=-1)
+        assert await jgrants.get_subsidy_detail("a1") == first
+        await asyncio.sleep(0.05)
+        assert upstream.requests[-1].headers["If-None-Match"] == "\"v1\""
+        assert jgrants.detail_cache.get("a1") == first
+
+        # 上流で内容が変わった場合は新しい本文と検証子で置き換える
+        upstream.details["a1"] = detail_body("a1", "IT導入補助金2025")
+        upstream.etags["a1"] = "\"v2\""
+        jgrants.detail_cache.touch("a1", ttl=-1)
+        await jgrants.get_subsidy_detail("a1")
+        await asyncio.sleep(0.05)
+        assert jgrants.detail_cache.get("a1")["subsidy"]["title"] == "IT導入補助金2025"
+        assert jgrants.detail_cache.validators("a1")["etag"] == "\"v2\""
+        assert len(upstream.requests) == 3
+
+    asyncio.run(scenario())
+
+
+def test_missing_detail_is_not_cached(upstream):
+    async def scenario():
+        result = await jgrants.get_subsidy_detail("missing")
+        assert result["success"] is False
+        assert "missing" not in jgrants.detail_cache
+
+    asyncio.run(scenario())
+
+
+def test_details_are_fetched_concurrently_in_request_order(upstream):
+    """
+    一括取得は同時実行数を DETAILS_CONCURRENCY に抑えて並行取得し、指定順に返すこと（重複IDは1回だけ取得）
+    """
+    ids = [f"b{i}" for i in range(12)]
+    for subsidy_id in ids:
+        upstream.details[subsidy_id] = detail_body(subsidy_id, f"補助金{subsidy_id}")
+    upstream.delay = 0.02
+    requested = ids[:6] + ["missing", "b0"] + ids[6:]
+
+    result = asyncio.run(jgrants.get_subsidy_details(requested))
+
+    assert result["success"] is True
+    assert [item["id"] for item in result["results"]] == requested
+    assert (result["count"], result["succeeded"]) == (14, 13)
+    assert result["results"][6]["success"] is False
+    assert result["results"][7]["subsidy"]["title"] == "補助金b0"
+    assert len(upstream.requests) == 13
+    assert 1 < upstream.max_active <= jgrants.DETAILS_CONCURRENCY
+
+
+def test_details_validates_the_number_of_ids(upstream):
+    assert asyncio.run(jgrants.get_subsidy_details([]))["success"] is False
+    too_many = [f"b{i}" for i in range(jgrants.DETAILS_MAX_IDS + 1)]
+    assert asyncio.run(jgrants.get_subsidy_details(too_many))["success"] is False
+    assert upstream.requests == []
+
+
+def test_cursor_pages_through_every_result_once(upstream):
+    upstream.subsidies = [search_record(i) for i in range(45)]
+
+    async def scenario():
+        pages = [await jgrants.search_subsidies("IT導入", limit=20)]
+        while pages[-1]["next_cursor"]:
+            pages.append(await jgrants.search_subsidies("IT導入", limit=20, cursor=pages[-1]["next_cursor"]))
+        return pages
+
+    pages = asyncio.run(scenario())
+
+    assert [len(page["subsidies"]) for page in pages] == [20, 20, 5]
+    assert [s["id"] for page in pages for s in page["subsidies"]] == [f"s{i:03d}" for i in range(45)]
+    assert all(page["count"] == 45 for page in pages)
+    # 全件は1回だけ取得してキャッシュから切り出す
+    assert len(upstream.requests) == 1
+
+
+def test_cursor_from_a_different_query_is_rejected(upstream):
+    upstream.subsidies = [search_record(i) for i in range(30)] + [search_record(i, "省エネ補助金") for i in range(30)]
+
+    async def scenario():
+        first = await jgrants.search_subsidies("IT導入", limit=10)
+        cursor = first["next_cursor"]
+        # 別のキーワード・並び順・ローカルの絞り込み条件のカーソルは使えない
+        return [
+            await jgrants.search_subsidies("省エネ", limit=10, cursor=cursor),
+            await jgrants.search_subsidies("IT導入", order="ASC", limit=10, cursor=cursor),
+            await jgrants.search_subsidies("IT導入", limit=10, cursor=cursor, subsidy_limit_min=3000000),
+            await jgrants.search_subsidies("IT導入", limit=10, cursor="not-a-cursor"),
+            await jgrants.search_subsidies("IT導入", limit=10, cursor=cursor)
+        ]
+
+    *rejected, accepted = asyncio.run(scenario())
+
+    assert all(result["success"] is False and "cursor" in result["error"] for result in rejected)
+    assert [s["id"] for s in accepted["subsidies"]] == [f"s{i:03d}" for i in range(10, 20)]
+
+
+def test_multi_search_merges_and_ranks_by_matches_then_deadline(upstream):
+    def record(subsidy_id, title, deadline):
+        return {"id": subsidy_id, "title": title, "acceptance_end_datetime": deadline}
+
+    upstream.subsidies = [
+        record("m1", "DX推進補助金", "2099-03-31T00:00:00Z"),
+        record("m2", "DX・設備投資補助金", "2099-06-30T00:00:00Z"),
+        record("m3", "設備投資補助金", "2099-01-31T00:00:00Z"),
+        record("m4", "DX・設備投資・省力化補助金", None)
+    ]
+    upstream.failing_keywords = {"障害"}
+
+    result = asyncio.run(jgrants.search_subsidies_multi(["DX", "設備投資", "DX", "障害"]))
+
+    assert result["success"] is True
+    assert result["queries"] == 3
+    assert [s["id"] for s in result["subsidies"]] == ["m2", "m4", "m3", "m1"]
+    assert result["subsidies"][0]["match_count"] == 2
+    assert result["subsidies"][0]["matched_keywords"] == ["DX", "設備投資"]
+    assert [query["keyword"] for query in result["failed_queries"]] == ["障害"]
+
+
+def test_multi_search_fails_only_when_every_query_fails(upstream):
+    upstream.failing_keywords = {"障害", "停止中"}
+
+    result = asyncio.run(jgrants.search_subsidies_multi(["障害", "停止中"]))
+
+    assert result["success"] is False
+    assert len(result["failed_queries"]) == 2
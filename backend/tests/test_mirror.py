@@ -0,0 +1,113 @@
+"""
+カタログミラー（CatalogMirror / search_mirror）のテスト
+"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from api import mirror as mirror_module
+from api.jgrants import get_cache_stats
+from api.mirror import CatalogMirror, load_fixture, search_mirror
+
+RECORDS = [
+    {
+        "id": "a1",
+        "name": "it-donyu",
+        "title": "IT導入補助金（デジタル化基盤導入枠）",
+        "target_area_search": "全国",
+        "subsidy_max_limit": 4500000,
+        "acceptance_start_datetime": "2020-01-01T00:00:00Z",
+        "acceptance_end_datetime": "2099-12-31T00:00:00Z",
+        "target_number_of_employees": "従業員数の制約なし",
+        "created_date": "2024-04-01T00:00:00Z"
+    },
+    {
+        "id": "a2",
+        "name": "shoene",
+        "title": "省エネルギー設備導入支援事業",
+        "target_area_search": "東京都",
+        "subsidy_max_limit": 10000000,
+        "acceptance_start_datetime": "2020-01-01T00:00:00Z",
+        "acceptance_end_datetime": "2021-03-31T00:00:00Z",
+        "target_number_of_employees": "300名以下",
+        "created_date": "2024-03-01T00:00:00Z",
+        "outline": "工場の省エネ設備への更新費用を補助します"
+    }
+]
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    """
+    フィクスチャを読み込んだ一時ミラー（共有インスタンスとして差し替える）
+    """
+    fixture = tmp_path / "fixture.json"
+    fixture.write_text(json.dumps({"result": RECORDS}, ensure_ascii=False), encoding="utf-8")
+    target = CatalogMirror(str(tmp_path / "mirror.sqlite3"))
+    assert load_fixture(str(fixture), target=target) == 2
+    monkeypatch.setattr(mirror_module, "mirror", target)
+    return target
+
+
+def params(keyword, **extra):
+    return {"keyword": keyword, "sort": "created_date", "order": "DESC", **extra}
+
+
+def test_fts_search_matches_title_and_outline(catalog):
+    # 3文字以上は trigram 索引、2文字以下は部分一致（NFKCで全角・半角を区別しない）
+    assert [s["id"] for s in catalog.search("ＩＴ導入")["subsidies"]] == ["a1"]
+    assert [s["id"] for s in catalog.search("省エネ設備")["subsidies"]] == ["a2"]
+    assert [s["id"] for s in catalog.search("導入")["subsidies"]] == ["a1", "a2"]
+    assert catalog.search("農業")["subsidies"] == []
+
+
+def test_search_filters_and_sort(catalog):
+    assert [s["id"] for s in catalog.search("導入", acceptance=1)["subsidies"]] == ["a1"]
+    assert [s["id"] for s in catalog.search("導入", target_area_search="東京都")["subsidies"]] == ["a2"]
+    assert [s["id"] for s in catalog.search("導入", order="ASC")["subsidies"]] == ["a2", "a1"]
+
+
+def test_fixture_load_marks_mirror_fresh(catalog):
+    assert not catalog.is_stale()
+
+    catalog.set_state("last_sync_at", time.time() - mirror_module.MIRROR_MAX_AGE - 1)
+    assert catalog.is_stale()
+
+
+def test_search_mirror_hit_is_marked_as_mirror_sourced(catalog):
+    result = asyncio.run(search_mirror(params("IT導入")))
+
+    assert result["source"] == "mirror"
+    assert result["synced_at"] == catalog.last_synced_at()
+    assert [s["id"] for s in result["subsidies"]] == ["a1"]
+
+
+@pytest.mark.parametrize("extra", [{"use_purpose": "設備整備・IT導入をしたい"}, {"industry": "製造業"}])
+def test_search_mirror_falls_back_for_unsupported_filters(catalog, extra):
+    assert asyncio.run(search_mirror(params("IT導入", **extra))) is None
+
+
+def test_search_mirror_falls_back_when_stale_or_no_hits(catalog):
+    assert asyncio.run(search_mirror(params("農業"))) is None
+
+    catalog.set_state("last_sync_at", time.time() - mirror_module.MIRROR_MAX_AGE - 1)
+    assert asyncio.run(search_mirror(params("IT導入"))) is None
+    assert catalog.misses == 2
+
+
+def test_cache_stats_read_the_mirror_off_the_event_loop(catalog, monkeypatch):
+    threads = []
+    original = catalog.stats
+
+    def stats():
+        threads.append(threading.current_thread())
+        return original()
+
+    monkeypatch.setattr(catalog, "stats", stats)
+    result = asyncio.run(get_cache_stats())
+
+    assert result["mirror"]["records"] == 2
+    assert threads and threads[0] is not threading.main_thread()
@@ -0,0 +1,77 @@
+"""
+会話セッション（sessions）のテスト
+"""
+import asyncio
+
+from api.sessions import SessionStore, finish_turn, start_turn, trim_history
+
+
+def tool_round(index):
+    """
+    Claude 形式のツール呼び出しと結果のペア
+    """
+    return [
+        {"role": "assistant", "content": [{"type": "tool_use", "id": f"toolu_{index}", "name": "search_subsidies", "input": {}}]},
+        {"role": "user", "content": [{"type": "tool_result", "tool_use_id": f"toolu_{index}", "content": "{}"}]}
+    ]
+
+
+def test_finish_turn_keeps_failed_models_unchanged():
+    histories = {"claude": [{"role": "user", "content": "前の質問"}, {"role": "assistant", "content": "前の回答"}]}
+    turn = start_turn(histories, ["claude", "openai"], "IT導入補助金は？")
+
+    assert turn["openai"] == [{"role": "user", "content": "IT導入補助金は？"}]
+    assert len(histories["claude"]) == 2
+
+    transcripts = {"claude": [{"role": "assistant", "content": "あります。"}], "openai": []}
+    results = {"claude": {"success": True}, "openai": {"success": False, "error": "timeout"}}
+    updated = finish_turn(histories, turn, transcripts, results)
+
+    assert updated["claude"][-2:] == [{"role": "user", "content": "IT導入補助金は？"}, {"role": "assistant", "content": "あります。"}]
+    # 失敗したモデルは履歴に今回の質問を残さない（再送でやり直せる）
+    assert "openai" not in updated
+
+
+def test_trim_history_never_splits_tool_use_from_its_result():
+    history = [{"role": "user", "content": "q1"}]
+    for index in range(3):
+        history += tool_round(index)
+    history += [{"role": "assistant", "content": "a1"}, {"role": "user", "content": "q2"}]
+    history += tool_round(3) + [{"role": "assistant", "content": "a2"}]
+
+    for max_messages in range(1, len(history)):
+        trimmed = trim_history(history, max_messages)
+        # 残す履歴はユーザーの発言から始まり、tool_result は直前の tool_use と必ず対になる
+        assert len(trimmed) <= max_messages
+        assert trimmed == history[len(history) - len(trimmed):]
+        assert not trimmed or isinstance(trimmed[0]["content"], str)
+        ids = set()
+        for message in trimmed:
+            for block in message["content"] if isinstance(message["content"], list) else []:
+                if block["type"] == "tool_use":
+                    ids.add(block["id"])
+                elif block["type"] == "tool_result":
+                    assert block["tool_use_id"] in ids
+
+
+def test_sessions_survive_restart_and_expire(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    histories = {"claude": [{"role": "user", "content": "q1"}, {"role": "assistant", "content": "a1"}]}
+
+    async def scenario():
+        store = SessionStore(path=path)
+        await store.save("s1", histories)
+
+        # メモリにないセッションもSQLiteから復元する
+        restarted = SessionStore(path=path)
+        assert await restarted.load("s1") == histories
+        assert restarted.memory.get("s1") == histories
+
+        await restarted.delete("s1")
+        assert await SessionStore(path=path).load("s1") is None
+
+        expired = SessionStore(ttl=-1, path=path)
+        await expired.save("s2", histories)
+        assert await SessionStore(ttl=-1, path=path).load("s2") is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,94 @@
+"""
+類似補助金の索引（SimilarityIndex / BM25）のテスト
+"""
+import math
+
+from api.similarity import (
+    BM25_B, BM25_K1, FIELD_WEIGHTS, SIMILAR_MAX_DOCS, SimilarityIndex, tokenize
+)
+
+DOCS = [
+    {"id": "it1", "title": "IT導入補助金", "purpose": "中小企業のITツール導入を支援", "outline": "会計ソフトの導入費用を補助"},
+    {"id": "it2", "title": "IT導入支援事業", "purpose": "中小企業のITツール導入", "outline": "受発注ソフトの導入を補助"},
+    {"id": "eco", "title": "省エネルギー設備導入補助金", "purpose": "工場の省エネ", "outline": "高効率空調への更新を補助"},
+    {"id": "farm", "title": "農業経営基盤強化", "purpose": "農地の集積", "outline": "農業機械の購入を補助"}
+]
+
+
+def reference_scores(index, subsidy_id):
+    """
+    BM25 の定義どおりに全 n-gram で計算したスコア
+    """
+    docs = index.docs
+    average = sum(doc.length for doc in docs.values()) / len(docs)
+    query = docs[subsidy_id].terms
+    scores = {}
+    for other_id, doc in docs.items():
+        if other_id == subsidy_id:
+            continue
+        score = 0.0
+        for gram in query:
+            count = doc.terms.get(gram, 0)
+            if not count:
+                continue
+            df = sum(1 for d in docs.values() if gram in d.terms)
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * count * (BM25_K1 + 1) / (count + BM25_K1 * (1 - BM25_B + BM25_B * doc.length / average))
+        if score:
+            scores[other_id] = round(score, 3)
+    return scores
+
+
+def test_tokenize_uses_character_ngrams_within_words():
+    assert tokenize("ＩＴ導入 補助") == ["it", "t導", "導入", "補助"]
+    assert tokenize("DX・a") == ["dx", "a"]
+
+
+def test_similar_ranks_by_bm25():
+    index = SimilarityIndex()
+    assert index.add_many(DOCS) == 4
+
+    results = index.similar("it1", k=3)
+
+    assert [r["id"] for r in results][:2] == ["it2", "eco"]
+    assert all("it1" != r["id"] for r in results)
+    assert [r["score"] for r in results] == sorted((r["score"] for r in results), reverse=True)
+    assert {r["id"]: r["score"] for r in results} == reference_scores(index, "it1")
+    assert results[0]["title"] == "IT導入支援事業"
+    assert len(index.similar("it1", k=1)) == 1
+
+
+def test_unchanged_text_keeps_postings_and_updates_record():
+    index = SimilarityIndex()
+    index.add_many(DOCS)
+    postings = {gram: dict(posting) for gram, posting in index.postings.items()}
+
+    assert index.add({**DOCS[0], "acceptance_end": "2099-12-31T00:00:00Z"}) is False
+    assert index.postings == postings
+    assert index.docs["it1"].record["acceptance_end"] == "2099-12-31T00:00:00Z"
+
+    # 本文が変わればポスティングを差し替える
+    assert index.add({**DOCS[0], "outline": "農業機械の導入を補助"}) is True
+    assert "it1" in index.postings["農業"]
+    assert "it1" not in index.postings.get("会計", {})
+
+
+def test_oldest_documents_are_evicted_first():
+    index = SimilarityIndex()
+    assert index.max_docs == SIMILAR_MAX_DOCS == 20000
+
+    for i in range(SIMILAR_MAX_DOCS + 5):
+        index.add({"id": f"d{i}", "title": f"補助金{i}号"})
+
+    assert len(index) == SIMILAR_MAX_DOCS
+    assert [f"d{i}" in index for i in range(6)] == [False] * 5 + [True]
+    assert f"d{SIMILAR_MAX_DOCS + 4}" in index
+    # 削除した補助金はポスティング・文書長の合計にも残らない
+    assert all(not posting.keys() & {f"d{i}" for i in range(5)} for posting in index.postings.values())
+    assert index.total_length == sum(doc.length for doc in index.docs.values())
+
+
+def test_title_weight_counts_more_than_body():
+    index = SimilarityIndex()
+    index.add({"id": "x", "title": "創業", "outline": "創業"})
+    assert index.docs["x"].terms["創業"] == FIELD_WEIGHTS["title"] + FIELD_WEIGHTS["outline"]
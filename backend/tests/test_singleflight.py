@@ -0,0 +1,90 @@
+"""
+同一リクエストの合流（SingleFlight）のテスト
+"""
+import asyncio
+
+import pytest
+
+from api.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_request():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            return {"success": True}
+
+        results = await asyncio.gather(*[flight.do("k", fetch) for _ in range(5)])
+
+        assert calls == 1
+        assert all(result is results[0] for result in results)
+        assert flight.stats() == {"inflight": 0, "leaders": 1, "coalesced": 4}
+
+        # 完了後の呼び出しは新しいリクエストになり、別のキーは合流しない
+        await asyncio.gather(flight.do("k", fetch), flight.do("other", fetch))
+        assert calls == 3
+
+    asyncio.run(scenario())
+
+
+def test_exception_reaches_every_waiter():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("503")
+
+        results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+
+        assert [str(result) for result in results] == ["503", "503"]
+        assert len(flight) == 0
+
+    asyncio.run(scenario())
+
+
+def test_shared_request_survives_until_the_last_waiter_is_cancelled():
+    """
+    呼び出し元の1つがキャンセルされても共有リクエストは続き、全員キャンセルされた場合のみ中断すること
+    """
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            started.set()
+            try:
+                await asyncio.sleep(0.1)
+                return "done"
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        first = asyncio.create_task(flight.do("k", fetch))
+        second = asyncio.create_task(flight.do("k", fetch))
+        await started.wait()
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == "done"
+        assert not cancelled.is_set()
+
+        # 待ち合わせ元が全員キャンセルされたら共有リクエストも中断する
+        third = asyncio.create_task(flight.do("k", fetch))
+        fourth = asyncio.create_task(flight.do("k", fetch))
+        await asyncio.sleep(0.01)
+        third.cancel()
+        fourth.cancel()
+        await asyncio.gather(third, fourth, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert cancelled.is_set()
+        assert len(flight) == 0
+
+    asyncio.run(scenario())
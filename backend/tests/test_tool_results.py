@@ -0,0 +1,92 @@
+"""
+ツール実行結果のコンパクトなエンコード（tool_results）のテスト
+"""
+import json
+
+import pytest
+
+from api.tool_results import TOOL_RESULT_MAX_RECORDS, TOOL_TOKEN_BUDGETS, encode_tool_result, estimate_tokens
+
+
+def search_record(index):
+    return {
+        "id": f"a{index:04d}",
+        "name": f"subsidy-{index}",
+        "title": "中小企業の生産性向上に向けた設備投資を支援する補助金" * 4,
+        "target_area": "全国",
+        "subsidy_max_limit": 10000000 + index,
+        "acceptance_start": "2025-04-01T00:00:00Z",
+        "acceptance_end": "2025-12-31T00:00:00Z",
+        "target_employees": "従業員数の制約なし",
+        "detail_url": "https://example.invalid/" + "x" * 200
+    }
+
+
+def detail(index):
+    return {
+        **search_record(index),
+        "subsidy_rate": "1/2以内",
+        "purpose": "生産性向上" * 200,
+        "outline": "設備投資の費用を補助します。" * 150,
+        "note": "申請前に必ず公募要領を確認してください。" * 100,
+        "grant_guideline_url": "https://example.invalid/guideline/" + "y" * 80,
+        "application_form_file_info": [{"name": "01.pdf", "size": 1024}]
+    }
+
+
+RESULTS = {
+    "search_subsidies": {"success": True, "count": 120, "subsidies": [search_record(i) for i in range(120)]},
+    "search_active_subsidies": {"success": True, "count": 120, "subsidies": [search_record(i) for i in range(120)]},
+    "search_subsidies_multi": {"success": True, "count": 50, "queries": 4, "subsidies": [
+        {**search_record(i), "match_count": 2, "matched_keywords": ["DX", "設備投資"]} for i in range(50)
+    ]},
+    "find_similar_subsidies": {"success": True, "count": 20, "subsidies": [
+        {**search_record(i), "score": 12.5} for i in range(20)
+    ]},
+    "get_subsidy_detail": {"success": True, "subsidy": detail(1)},
+    "get_subsidy_details": {"success": True, "count": 20, "succeeded": 19, "results": [
+        {"id": f"a{i:04d}", "success": True, "subsidy": detail(i)} for i in range(19)
+    ] + [{"id": "missing", "success": False, "error": "指定されたIDの補助金が見つかりませんでした"}]}
+}
+
+
+@pytest.mark.parametrize("tool_name", sorted(TOOL_TOKEN_BUDGETS))
+def test_large_results_fit_the_tool_budget(tool_name):
+    text = encode_tool_result(tool_name, RESULTS[tool_name])
+    payload = json.loads(text)
+
+    assert estimate_tokens(text) <= TOOL_TOKEN_BUDGETS[tool_name]
+    assert payload["success"] is True
+    # IDとURLは切り詰めない
+    for record in payload.get("subsidies") or [payload["subsidy"]]:
+        assert record["id"] == "missing" or record["id"].startswith("a")
+        if "grant_guideline_url" in record:
+            assert record["grant_guideline_url"].endswith("y" * 80)
+
+
+def test_search_result_keeps_count_and_drops_unlisted_fields():
+    text = encode_tool_result("search_subsidies", RESULTS["search_subsidies"], budget=100000)
+    payload = json.loads(text)
+
+    assert payload["count"] == 120
+    assert payload["shown"] == len(payload["subsidies"]) == TOOL_RESULT_MAX_RECORDS
+    assert "detail_url" not in payload["subsidies"][0]
+    assert payload["subsidies"][0]["title"] == RESULTS["search_subsidies"]["subsidies"][0]["title"]
+    assert ": " not in text and ", " not in text
+
+
+def test_failed_ids_in_batch_keep_id_and_error():
+    result = {"success": True, "count": 2, "succeeded": 1, "results": [
+        {"id": "a0001", "success": True, "subsidy": detail(1)},
+        {"id": "missing", "success": False, "error": "見つかりませんでした"}
+    ]}
+
+    payload = json.loads(encode_tool_result("get_subsidy_details", result, budget=100000))
+
+    assert payload["subsidies"][1] == {"id": "missing", "error": "見つかりませんでした"}
+    assert "application_form_file_info" not in payload["subsidies"][0]
+
+
+def test_errors_are_passed_through():
+    error = {"success": False, "error": "keywordは2～255文字で指定してください"}
+    assert json.loads(encode_tool_result("search_subsidies", error)) == error
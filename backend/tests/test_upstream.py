@@ -0,0 +1,146 @@
+"""
+上流アクセス層（UpstreamGuard）のテスト
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from api.upstream import UpstreamGuard, UpstreamUnavailable
+
+
+def server_error() -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "http://jgrants.test/subsidies")
+    return httpx.HTTPStatusError("503", request=request, response=httpx.Response(503, request=request))
+
+
+def test_rate_limited_probe_does_not_wedge_breaker():
+    """
+    half_open の試行がレート制限で拒否されても、次の試行が通ること
+    """
+    async def scenario():
+        guard = UpstreamGuard(rate=1, burst=1, max_wait=0.1, retries=0, failure_threshold=1, reset_timeout=0.1)
+
+        async def fail():
+            raise server_error()
+
+        async def ok():
+            return "ok"
+
+        # 1回の失敗でサーキットが開く（トークンも使い切る）
+        with pytest.raises(UpstreamUnavailable):
+            await guard.call(fail)
+        assert guard.breaker.state == "open"
+
+        # half_open の試行はトークン待ちが max_wait を超えるので拒否される
+        await asyncio.sleep(0.15)
+        with pytest.raises(UpstreamUnavailable, match="レート制限"):
+            await guard.call(ok)
+
+        # トークンが補充されれば試行が通り、サーキットが閉じる
+        await asyncio.sleep(1.0)
+        assert await guard.call(ok) == "ok"
+        assert guard.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_releases_breaker():
+    """
+    half_open の試行がトークン待ちの間にキャンセルされても、次の試行が通ること
+    """
+    async def scenario():
+        guard = UpstreamGuard(rate=2, burst=1, max_wait=5, retries=0, failure_threshold=1, reset_timeout=0.05)
+
+        async def fail():
+            raise server_error()
+
+        async def ok():
+            return "ok"
+
+        with pytest.raises(UpstreamUnavailable):
+            await guard.call(fail)
+        await asyncio.sleep(0.06)
+
+        # トークン待ち（約0.5秒）の途中でキャンセル
+        probe = asyncio.create_task(guard.call(ok))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert await guard.call(ok) == "ok"
+        assert guard.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_open_circuit_fails_fast_without_waiting_for_tokens():
+    async def scenario():
+        guard = UpstreamGuard(rate=0.1, burst=1, max_wait=5, retries=0, failure_threshold=1, reset_timeout=60)
+
+        async def fail():
+            raise server_error()
+
+        with pytest.raises(UpstreamUnavailable):
+            await guard.call(fail)
+
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        with pytest.raises(UpstreamUnavailable, match="サーキットブレーカー"):
+            await guard.call(fail)
+        assert loop.time() - started_at < 0.1
+
+    asyncio.run(scenario())
+
+
+def test_circuit_counts_failed_calls_not_attempts():
+    """
+    サーキットは再試行を含めた呼び出し単位の失敗回数で開くこと（各回の再試行では数えない）
+    """
+    async def scenario():
+        guard = UpstreamGuard(rate=0, burst=1, retries=2, backoff_max=0, failure_threshold=3, reset_timeout=60)
+        attempts = 0
+
+        async def fail():
+            nonlocal attempts
+            attempts += 1
+            raise server_error()
+
+        for calls in range(1, 3):
+            with pytest.raises(UpstreamUnavailable, match="再試行の上限"):
+                await guard.call(fail)
+            assert guard.breaker.state == "closed"
+            assert guard.breaker.failures == calls
+        assert attempts == 6
+
+        with pytest.raises(UpstreamUnavailable, match="再試行の上限"):
+            await guard.call(fail)
+        assert guard.breaker.state == "open"
+        assert attempts == 9
+
+    asyncio.run(scenario())
+
+
+def test_failed_probe_reopens_without_retrying():
+    async def scenario():
+        guard = UpstreamGuard(rate=0, burst=1, retries=2, backoff_max=0, failure_threshold=1, reset_timeout=0.05)
+        attempts = 0
+
+        async def fail():
+            nonlocal attempts
+            attempts += 1
+            raise server_error()
+
+        with pytest.raises(UpstreamUnavailable):
+            await guard.call(fail)
+        assert guard.breaker.state == "open"
+        await asyncio.sleep(0.06)
+
+        attempts = 0
+        with pytest.raises(UpstreamUnavailable, match="試行が失敗"):
+            await guard.call(fail)
+        assert attempts == 1
+        assert guard.breaker.state == "open"
+
+    asyncio.run(scenario())
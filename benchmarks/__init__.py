@@ -0,0 +1,5 @@
+"""
+ベンチマーク（偽のJグランツAPI・LLM APIサーバーを使った負荷試験）
+
+    python -m benchmarks.run --output results.json
+"""
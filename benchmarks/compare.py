@@ -0,0 +1,99 @@
+"""
+2つのベンチマーク結果（benchmarks.run の出力）を比較します
+
+使い方:
+    python -m benchmarks.compare base.json head.json
+    python -m benchmarks.compare base.json head.json --fail-above 10  # p95 が10%以上悪化したら終了コード1
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+# (表示名, 値の取り出し方, 大きいほど良いか)
+METRICS: List[Tuple[str, Tuple[str, ...], bool]] = [
+    ("p50 ms", ("latency_ms", "p50"), False),
+    ("p95 ms", ("latency_ms", "p95"), False),
+    ("p99 ms", ("latency_ms", "p99"), False),
+    ("req/s", ("throughput_rps",), True),
+    ("rss MB", ("peak_rss_mb",), False)
+]
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def lookup(item: Dict[str, Any], path: Tuple[str, ...]) -> Optional[float]:
+    for key in path:
+        if not isinstance(item, dict):
+            return None
+        item = item.get(key)
+    return item
+
+
+def change(base: Optional[float], head: Optional[float]) -> Optional[float]:
+    """
+    base からの変化率（%）
+    """
+    if base is None or head is None or base == 0:
+        return None
+    return (head - base) / base * 100
+
+
+def revision(result: Dict[str, Any]) -> str:
+    # 未コミットの変更を含む場合は末尾に + を付ける
+    return (result.get("commit") or "?")[:10] + ("+" if result.get("dirty") else "")
+
+
+def compare(base: Dict[str, Any], head: Dict[str, Any]) -> Tuple[List[str], Dict[str, Optional[float]]]:
+    """
+    シナリオ・指標ごとの比較表と、シナリオごとの p95 の変化率を返します
+    """
+    lines = [f"base: {revision(base)}  head: {revision(head)}", ""]
+    lines.append(f"{'scenario':<12} {'metric':<7} {'base':>10} {'head':>10} {'change':>9}")
+    regressions: Dict[str, Optional[float]] = {}
+
+    for name, head_item in head.get("scenarios", {}).items():
+        base_item = base.get("scenarios", {}).get(name)
+        if base_item is None or "skipped" in base_item or "skipped" in head_item:
+            lines.append(f"{name:<12} （比較できません）")
+            continue
+        for metric, path, higher_is_better in METRICS:
+            before, after = lookup(base_item, path), lookup(head_item, path)
+            delta = change(before, after)
+            marker = ""
+            if delta is not None and abs(delta) >= 5:
+                marker = " ✓" if (delta > 0) == higher_is_better else " ✗"
+            lines.append(
+                f"{name:<12} {metric:<7} {_cell(before)} {_cell(after)} "
+                f"{(f'{delta:+.1f}%' if delta is not None else '-'):>9}{marker}"
+            )
+        regressions[name] = change(lookup(base_item, ("latency_ms", "p95")), lookup(head_item, ("latency_ms", "p95")))
+    return lines, regressions
+
+
+def _cell(value: Optional[float]) -> str:
+    return f"{value:>10.1f}" if value is not None else f"{'-':>10}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ベンチマーク結果の比較")
+    parser.add_argument("base", help="比較元の結果（JSON）")
+    parser.add_argument("head", help="比較先の結果（JSON）")
+    parser.add_argument("--fail-above", type=float, help="p95 がこの割合（%%）以上悪化したシナリオがあれば終了コード1")
+    args = parser.parse_args()
+
+    lines, regressions = compare(load(args.base), load(args.head))
+    print("\n".join(lines))
+
+    if args.fail_above is not None:
+        failed = [name for name, delta in regressions.items() if delta is not None and delta >= args.fail_above]
+        if failed:
+            print(f"\n✗ p95 が{args.fail_above}%以上悪化: {', '.join(failed)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+偽のJグランツAPIサーバー
+
+記録したフィクスチャを元に /subsidies と /subsidies/id/{id} を返します。
+応答までの待ち時間・検索結果の件数・添付ファイル（base64）の個数とサイズを設定できます。
+"""
+import asyncio
+import json
+import random
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+
+from .fixtures import (
+    DETAIL_FIXTURE, SEARCH_FIXTURE, attachment_data, build_detail_response, build_search_response, load_fixture
+)
+
+DEFAULT_CONFIG = {
+    "latency": 0.05,  # 1リクエストの応答時間（秒）
+    "jitter": 0.02,  # 応答時間に加えるランダムな揺らぎ（秒、0～jitter）
+    "search_results": 50,  # 検索結果の件数
+    "attachments": 2,  # 詳細の添付ファイル数
+    "attachment_bytes": 1_000_000  # 添付ファイル1個のサイズ（デコード後のバイト数）
+}
+
+_ID_PLACEHOLDER = "__SUBSIDY_ID__"
+
+
+def create_app(config: Dict[str, Any]) -> FastAPI:
+    """
+    偽のJグランツAPIのアプリケーションを作成します
+
+    Args:
+        config: DEFAULT_CONFIG のキーを上書きする設定
+    """
+    config = {**DEFAULT_CONFIG, **config}
+    search_fixture = load_fixture(SEARCH_FIXTURE)
+
+    # 詳細はIDだけが異なるので、添付ファイルを含む本文は起動時に1回だけ作っておく
+    detail_template = json.dumps(
+        build_detail_response(
+            load_fixture(DETAIL_FIXTURE),
+            _ID_PLACEHOLDER,
+            config["attachments"],
+            attachment_data(config["attachment_bytes"])
+        ),
+        ensure_ascii=False
+    ).encode("utf-8")
+
+    app = FastAPI(title="Fake Jグランツ API")
+    counts = {"search": 0, "detail": 0}
+
+    async def wait() -> None:
+        delay = config["latency"] + random.uniform(0, config["jitter"])
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @app.get("/subsidies")
+    async def search(request: Request) -> Response:
+        counts["search"] += 1
+        await wait()
+        keyword = request.query_params.get("keyword", "")
+        data = build_search_response(search_fixture, keyword, config["search_results"])
+        return Response(json.dumps(data, ensure_ascii=False), media_type="application/json")
+
+    @app.get("/subsidies/id/{subsidy_id}")
+    async def detail(subsidy_id: str) -> Response:
+        counts["detail"] += 1
+        await wait()
+        body = detail_template.replace(_ID_PLACEHOLDER.encode("ascii"), json.dumps(subsidy_id)[1:-1].encode("utf-8"))
+        return Response(body, media_type="application/json")
+
+    @app.get("/_bench/stats")
+    async def stats() -> Dict[str, Any]:
+        return {"requests": dict(counts), "detail_bytes": len(detail_template)}
+
+    return app
@@ -0,0 +1,297 @@
+"""
+偽のLLM APIサーバー（Anthropic Messages API / OpenAI Chat Completions API）
+
+スクリプトに従ってツール呼び出しを返し、最後に回答テキストを返します。
+何番目の応答かは会話中のツール呼び出しの往復回数から決めるため、サーバーは状態を持ちません。
+ストリーミングではトークンごとに待ち時間を入れて送信します。
+"""
+import asyncio
+import json
+import secrets
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from .fixtures import subsidy_id_for
+
+# 既定のスクリプト: 質問をキーワードに検索 → 先頭の補助金の詳細を取得 → 回答
+# 入力の {question} は質問文、{subsidy_id} は偽のJグランツが返す先頭の補助金IDに置き換わる
+DEFAULT_SCRIPT: List[Dict[str, Any]] = [
+    {"tools": [{"name": "search_subsidies", "input": {"keyword": "{question}"}}]},
+    {"tools": [{"name": "get_subsidy_detail", "input": {"subsidy_id": "{subsidy_id}"}}]}
+]
+
+DEFAULT_CONFIG = {
+    "first_token": 0.2,  # 最初のトークンまでの時間（秒）
+    "token_delay": 0.005,  # トークン1個あたりの生成時間（秒）
+    "answer_tokens": 100,  # 回答のトークン数
+    "script": DEFAULT_SCRIPT
+}
+
+ANSWER_PIECES = ["ご質問", "の", "条件", "に", "合う", "補助金", "は", "、", "IT導入補助金", "です", "。", "申請", "期限", "に", "ご注意", "ください", "。"]
+
+# ツール呼び出し1回分の出力トークン数の目安
+TOOL_CALL_TOKENS = 20
+
+
+def _text_of(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            block.get("text", "") for block in content
+            if isinstance(block, dict) and block.get("type") == "text"
+        )
+    return ""
+
+
+def _has_tool_result(content: Any) -> bool:
+    return isinstance(content, list) and any(
+        isinstance(block, dict) and block.get("type") == "tool_result" for block in content
+    )
+
+
+def conversation_state(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    最後のユーザーの質問と、それ以降のツール呼び出しの往復回数を返します
+    """
+    rounds = 0
+    for message in reversed(messages):
+        role = message.get("role")
+        if role == "assistant":
+            rounds += 1
+        elif role == "user" and not _has_tool_result(message.get("content")):
+            return {"question": _text_of(message.get("content")).strip(), "rounds": rounds}
+    return {"question": "", "rounds": rounds}
+
+
+def next_step(config: Dict[str, Any], messages: List[Dict[str, Any]], tools_allowed: bool) -> Dict[str, Any]:
+    """
+    スクリプトから次の応答（ツール呼び出しまたは回答）を決めます
+
+    Returns:
+        {"tools": [{"id", "name", "input"}]} または {"text": 回答}
+    """
+    state = conversation_state(messages)
+    script = config["script"]
+    if tools_allowed and state["rounds"] < len(script) and script[state["rounds"]].get("tools"):
+        question = state["question"] or "補助金"
+        values = {"question": question, "subsidy_id": subsidy_id_for(f"{question}/0")}
+        return {"tools": [
+            {
+                "id": secrets.token_hex(8),
+                "name": tool["name"],
+                "input": json.loads(json.dumps(tool.get("input", {})).replace(
+                    "{question}", json.dumps(values["question"])[1:-1]
+                ).replace("{subsidy_id}", values["subsidy_id"]))
+            }
+            for tool in script[state["rounds"]]["tools"]
+        ]}
+    step = script[state["rounds"]] if state["rounds"] < len(script) else {}
+    if step.get("text"):
+        return {"text": step["text"]}
+    count = config["answer_tokens"]
+    return {"text": "".join(ANSWER_PIECES[index % len(ANSWER_PIECES)] for index in range(count))}
+
+
+def split_tokens(text: str, config: Dict[str, Any]) -> List[str]:
+    """
+    回答テキストをストリーミング用のトークンに分割します（回答は answer_tokens 個になる）
+    """
+    count = max(1, config["answer_tokens"])
+    size = max(1, -(-len(text) // count))
+    return [text[index:index + size] for index in range(0, len(text), size)] or [""]
+
+
+def output_tokens(step: Dict[str, Any], config: Dict[str, Any]) -> int:
+    if "tools" in step:
+        return TOOL_CALL_TOKENS * len(step["tools"])
+    return len(split_tokens(step["text"], config))
+
+
+def _sse(event: Optional[str], data: Any) -> str:
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    return (f"event: {event}\n" if event else "") + f"data: {payload}\n\n"
+
+
+def create_app(config: Dict[str, Any]) -> FastAPI:
+    """
+    偽のLLM APIのアプリケーションを作成します
+
+    Args:
+        config: DEFAULT_CONFIG のキーを上書きする設定
+    """
+    config = {**DEFAULT_CONFIG, **config}
+    app = FastAPI(title="Fake LLM API")
+    counts = {"anthropic": 0, "openai": 0}
+
+    async def generation_delay(step: Dict[str, Any]) -> None:
+        # ストリーミングしない場合は生成し終わるまで待ってから返す
+        await asyncio.sleep(config["first_token"] + output_tokens(step, config) * config["token_delay"])
+
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request) -> Any:
+        counts["anthropic"] += 1
+        body = await request.json()
+        tool_choice = body.get("tool_choice") or {}
+        step = next_step(config, body.get("messages", []), bool(body.get("tools")) and tool_choice.get("type") != "none")
+        input_tokens = len(json.dumps(body, ensure_ascii=False)) // 4
+        message_id = f"msg_{secrets.token_hex(12)}"
+        stop_reason = "tool_use" if "tools" in step else "end_turn"
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens(step, config),
+            "cache_read_input_tokens": 0,
+            "cache_creation_input_tokens": 0
+        }
+
+        if "tools" in step:
+            content = [{"type": "text", "text": "補助金を検索します。"}] + [
+                {"type": "tool_use", "id": f"toolu_{tool['id']}", "name": tool["name"], "input": tool["input"]}
+                for tool in step["tools"]
+            ]
+        else:
+            content = [{"type": "text", "text": step["text"]}]
+
+        if not body.get("stream"):
+            await generation_delay(step)
+            return {
+                "id": message_id,
+                "type": "message",
+                "role": "assistant",
+                "model": body.get("model"),
+                "content": content,
+                "stop_reason": stop_reason,
+                "stop_sequence": None,
+                "usage": usage
+            }
+
+        async def events() -> AsyncIterator[str]:
+            yield _sse("message_start", {
+                "type": "message_start",
+                "message": {
+                    "id": message_id,
+                    "type": "message",
+                    "role": "assistant",
+                    "model": body.get("model"),
+                    "content": [],
+                    "stop_reason": None,
+                    "stop_sequence": None,
+                    "usage": {**usage, "output_tokens": 0}
+                }
+            })
+            await asyncio.sleep(config["first_token"])
+            for index, block in enumerate(content):
+                if block["type"] == "text":
+                    yield _sse("content_block_start", {
+                        "type": "content_block_start", "index": index, "content_block": {"type": "text", "text": ""}
+                    })
+                    pieces = split_tokens(block["text"], config) if "text" in step else [block["text"]]
+                    for piece in pieces:
+                        yield _sse("content_block_delta", {
+                            "type": "content_block_delta", "index": index,
+                            "delta": {"type": "text_delta", "text": piece}
+                        })
+                        await asyncio.sleep(config["token_delay"])
+                else:
+                    yield _sse("content_block_start", {
+                        "type": "content_block_start", "index": index,
+                        "content_block": {"type": "tool_use", "id": block["id"], "name": block["name"], "input": {}}
+                    })
+                    await asyncio.sleep(TOOL_CALL_TOKENS * config["token_delay"])
+                    yield _sse("content_block_delta", {
+                        "type": "content_block_delta", "index": index,
+                        "delta": {"type": "input_json_delta", "partial_json": json.dumps(block["input"], ensure_ascii=False)}
+                    })
+                yield _sse("content_block_stop", {"type": "content_block_stop", "index": index})
+            yield _sse("message_delta", {
+                "type": "message_delta",
+                "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                "usage": {"output_tokens": usage["output_tokens"]}
+            })
+            yield _sse("message_stop", {"type": "message_stop"})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat_completions(request: Request) -> Any:
+        counts["openai"] += 1
+        body = await request.json()
+        step = next_step(config, body.get("messages", []), bool(body.get("tools")) and body.get("tool_choice") != "none")
+        completion_id = f"chatcmpl-{secrets.token_hex(12)}"
+        created = int(time.time())
+        prompt_tokens = len(json.dumps(body, ensure_ascii=False)) // 4
+        completion_tokens = output_tokens(step, config)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        tool_calls = [
+            {
+                "id": f"call_{tool['id']}",
+                "type": "function",
+                "function": {"name": tool["name"], "arguments": json.dumps(tool["input"], ensure_ascii=False)}
+            }
+            for tool in step.get("tools", [])
+        ]
+        finish_reason = "tool_calls" if tool_calls else "stop"
+
+        if not body.get("stream"):
+            await generation_delay(step)
+            message: Dict[str, Any] = {"role": "assistant", "content": step.get("text")}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage
+            }
+
+        def chunk(delta: Dict[str, Any], finish: Optional[str] = None) -> str:
+            return _sse(None, {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body.get("model"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]
+            })
+
+        async def events() -> AsyncIterator[str]:
+            yield chunk({"role": "assistant", "content": ""})
+            await asyncio.sleep(config["first_token"])
+            if "text" in step:
+                for piece in split_tokens(step["text"], config):
+                    yield chunk({"content": piece})
+                    await asyncio.sleep(config["token_delay"])
+            for index, call in enumerate(tool_calls):
+                yield chunk({"tool_calls": [{
+                    "index": index, "id": call["id"], "type": "function",
+                    "function": {"name": call["function"]["name"], "arguments": ""}
+                }]})
+                await asyncio.sleep(TOOL_CALL_TOKENS * config["token_delay"])
+                yield chunk({"tool_calls": [{"index": index, "function": {"arguments": call["function"]["arguments"]}}]})
+            yield chunk({}, finish_reason)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield _sse(None, {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body.get("model"),
+                    "choices": [],
+                    "usage": usage
+                })
+            yield _sse(None, "[DONE]")
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/_bench/stats")
+    async def stats() -> Dict[str, Any]:
+        return {"requests": dict(counts)}
+
+    return app
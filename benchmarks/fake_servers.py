@@ -0,0 +1,50 @@
+"""
+偽のJグランツAPI・LLM APIサーバーを1プロセスで起動します
+
+ベンチマーク本体（benchmarks.run）が別プロセスとして起動します。
+負荷をかける側・計測対象と同じプロセスで動かさないことで、偽サーバーの処理が計測値に混ざらないようにしています。
+
+単体で起動する場合:
+    python -m benchmarks.fake_servers --jgrants-port 9001 --llm-port 9002
+"""
+import argparse
+import asyncio
+import json
+
+import uvicorn
+
+from . import fake_jgrants, fake_llm
+
+
+async def serve(host: str, jgrants_port: int, llm_port: int, config: dict) -> None:
+    servers = [
+        uvicorn.Server(uvicorn.Config(
+            fake_jgrants.create_app(config.get("jgrants", {})),
+            host=host,
+            port=jgrants_port,
+            log_level="warning",
+            access_log=False
+        )),
+        uvicorn.Server(uvicorn.Config(
+            fake_llm.create_app(config.get("llm", {})),
+            host=host,
+            port=llm_port,
+            log_level="warning",
+            access_log=False
+        ))
+    ]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="偽のJグランツAPI・LLM APIサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--jgrants-port", type=int, required=True)
+    parser.add_argument("--llm-port", type=int, required=True)
+    parser.add_argument("--config", default="{}", help='設定（JSON）: {"jgrants": {...}, "llm": {...}}')
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.jgrants_port, args.llm_port, json.loads(args.config)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+ベンチマーク用のJグランツAPIレスポンス（フィクスチャ）
+
+fixtures/search.json・fixtures/detail.json は /subsidies・/subsidies/id/{id} のレスポンスを
+記録したものです（ファイル本体の base64 は空文字列にして保存）。偽のJグランツサーバーは
+これを元に、指定した件数の検索結果と、指定したサイズの添付ファイルを含む詳細を返します。
+
+実APIから記録し直す場合:
+    python -m benchmarks.fixtures --record --keyword 中小企業
+"""
+import argparse
+import base64
+import copy
+import hashlib
+import json
+import os
+from typing import Any, Dict, List
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SEARCH_FIXTURE = os.path.join(FIXTURES_DIR, "search.json")
+DETAIL_FIXTURE = os.path.join(FIXTURES_DIR, "detail.json")
+
+JGRANTS_API_BASE = "https://api.jgrants-portal.go.jp/exp/v1/public"
+
+
+def load_fixture(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def subsidy_id_for(seed: str) -> str:
+    """
+    文字列から補助金IDの形式（18文字）の決定的なIDを作ります
+    """
+    return "a0W" + hashlib.sha1(seed.encode("utf-8")).hexdigest()[:15]
+
+
+def build_search_response(fixture: Dict[str, Any], keyword: str, count: int) -> Dict[str, Any]:
+    """
+    記録した検索結果を繰り返して count 件の検索レスポンスを作ります
+
+    IDはキーワードごとに変わるため、キーワードを変えれば詳細のキャッシュもヒットしません。
+    """
+    records: List[Dict[str, Any]] = fixture["result"]
+    result = []
+    for index in range(count):
+        record = dict(records[index % len(records)])
+        record["id"] = subsidy_id_for(f"{keyword}/{index}")
+        if index >= len(records):
+            record["title"] = f"{record['title']}（{index + 1}）"
+        result.append(record)
+    return {
+        "metadata": {**fixture.get("metadata", {}), "resultset": {"count": count}},
+        "result": result
+    }
+
+
+def attachment_data(size: int) -> str:
+    """
+    デコード後 size バイトになる base64 文字列（添付ファイル本体の代わり）
+    """
+    # 圧縮されにくい決定的なバイト列を作る（PDFの本体に近いサイズ感にする）
+    chunk = hashlib.sha512(b"jgrants-benchmark").digest()
+    raw = (chunk * (size // len(chunk) + 1))[:size]
+    return base64.b64encode(raw).decode("ascii")
+
+
+def build_detail_response(
+    fixture: Dict[str, Any],
+    subsidy_id: str,
+    attachments: int,
+    attachment_blob: str
+) -> Dict[str, Any]:
+    """
+    記録した詳細に指定したIDと attachments 個の添付ファイルを設定した詳細レスポンスを作ります
+    """
+    detail = copy.deepcopy(fixture["result"][0])
+    detail["id"] = subsidy_id
+    names = [item.get("name") or "添付資料.pdf" for item in detail.get("application_form_files") or []]
+    names = names or ["添付資料.pdf"]
+    detail["application_form_files"] = [
+        {"name": f"{index + 1:02d}_{names[index % len(names)]}", "data": attachment_blob}
+        for index in range(attachments)
+    ]
+    return {"metadata": fixture.get("metadata", {}), "result": [detail]}
+
+
+def strip_blobs(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    詳細レスポンスから添付ファイルの base64 本体を取り除きます（フィクスチャを小さく保つ）
+    """
+    for record in data.get("result") or []:
+        for item in record.get("application_form_files") or []:
+            if isinstance(item, dict) and "data" in item:
+                item["data"] = ""
+    return data
+
+
+def record_fixtures(keyword: str) -> None:
+    """
+    実際のJグランツAPIから検索結果と先頭1件の詳細を取得してフィクスチャを更新します
+    """
+    import httpx
+
+    with httpx.Client(base_url=JGRANTS_API_BASE, timeout=60) as client:
+        response = client.get(
+            "/subsidies",
+            params={"keyword": keyword, "sort": "created_date", "order": "DESC", "acceptance": 1}
+        )
+        response.raise_for_status()
+        search = response.json()
+        if not search.get("result"):
+            raise SystemExit(f"検索結果が0件でした: {keyword}")
+
+        subsidy_id = search["result"][0]["id"]
+        response = client.get(f"/subsidies/id/{subsidy_id}")
+        response.raise_for_status()
+        detail = strip_blobs(response.json())
+
+    for path, data in ((SEARCH_FIXTURE, search), (DETAIL_FIXTURE, detail)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+    print(f"✓ 検索結果 {len(search['result'])}件と詳細 {subsidy_id} を記録しました")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ベンチマーク用フィクスチャの管理")
+    parser.add_argument("--record", action="store_true", help="実際のJグランツAPIからフィクスチャを記録し直す")
+    parser.add_argument("--keyword", default="中小企業", help="記録する検索キーワード")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.keyword)
+    else:
+        search = load_fixture(SEARCH_FIXTURE)
+        detail = load_fixture(DETAIL_FIXTURE)
+        print(f"検索結果: {len(search['result'])}件 / 詳細: {detail['result'][0]['id']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,578 @@
+"""
+Jグランツ補助金検索システムのベンチマーク
+
+偽のJグランツAPI・LLM APIサーバーを起動し、その上でバックエンド（FastAPI）と
+MCPサーバー（jgrants_server.py）に負荷をかけて、シナリオごとのレイテンシ（p50/p95/p99）・
+スループット・ピークRSSをJSONで出力します。結果にはコミットIDが入るため、
+コミット間の比較（python -m benchmarks.compare）に使えます。
+
+使い方（リポジトリのルートで実行）:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --scenarios search,detail --requests 500 --concurrency 20
+    python -m benchmarks.run --scenarios mcp_search,mcp_detail --mcp-python .venv/bin/python
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from . import fake_jgrants, fake_llm
+from .fixtures import subsidy_id_for
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(REPO_ROOT, "backend")
+MCP_SERVER = os.path.join(REPO_ROOT, "jgrants_server.py")
+
+BACKEND_SCENARIOS = ["search", "detail", "details", "chat", "chat_stream"]
+MCP_SCENARIOS = ["mcp_search", "mcp_detail"]
+SCENARIOS = BACKEND_SCENARIOS + MCP_SCENARIOS
+
+# 計測対象に渡す環境変数の既定値（--env で上書きできる）
+# レート制限は上流の保護のための待ち時間が計測値を支配しないよう無効にする
+BENCH_ENV = {
+    "JGRANTS_RATE_LIMIT": "0",
+    "JGRANTS_MCP_CACHE_PATH": "",
+    "JGRANTS_MIRROR_DB": "",
+    "SESSION_DB": "",
+    "TRACE_EXPORTERS": "",
+    "ANTHROPIC_API_KEY": "benchmark",
+    "OPENAI_API_KEY": "benchmark"
+}
+
+# 1回の呼び出し: 成功なら None、失敗ならエラーメッセージを返す
+Call = Callable[[str], Awaitable[Optional[str]]]
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def peak_rss_bytes(pid: int) -> Optional[int]:
+    """
+    プロセスのピークRSS（/proc/<pid>/status の VmHWM）を返します（Linux以外ではNone）
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss(pid: int) -> bool:
+    """
+    ピークRSSを現在のRSSに戻します（シナリオごとのピークを測るため。Linux 4.0以降）
+    """
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """
+    昇順に並んだ values の q パーセンタイル（線形補間）
+    """
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def git_revision() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    try:
+        return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def start_process(command: List[str], env: Dict[str, str], cwd: str, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    try:
+        return subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        log.close()
+
+
+def stop_process(process: Optional[subprocess.Popen]) -> None:
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def tail(path: str, lines: int = 20) -> str:
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return "".join(f.readlines()[-lines:])
+    except OSError:
+        return ""
+
+
+async def wait_until_ready(url: str, process: subprocess.Popen, log_path: str, timeout: float = 60) -> None:
+    """
+    url が応答するまで待ちます（プロセスが終了した場合はログの末尾とともに失敗）
+    """
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"起動に失敗しました: {' '.join(process.args)}\n{tail(log_path)}")
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{timeout}秒以内に起動しませんでした: {url}\n{tail(log_path)}")
+
+
+async def run_load(name: str, call: Call, args: argparse.Namespace, pid: Optional[int]) -> Dict[str, Any]:
+    """
+    シナリオに負荷をかけ、レイテンシ・スループット・ピークRSSを集計します
+
+    キーはシナリオ名と通し番号 % distinct から作るため、distinct が小さいほどキャッシュにヒットします。
+    ウォームアップは計測用とは別のキーで行います。
+    """
+    for index in range(args.warmup):
+        await call(f"{name}-warmup-{index}")
+
+    rss_reset = reset_peak_rss(pid) if pid is not None else False
+    indices = iter(range(args.requests))
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def worker() -> None:
+        for index in indices:
+            started_at = time.perf_counter()
+            try:
+                error = await call(f"{name}-{index % args.distinct}")
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            if error is None:
+                latencies.append(time.perf_counter() - started_at)
+            else:
+                errors.append(error)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    duration = time.perf_counter() - started_at
+
+    latencies.sort()
+    rss = peak_rss_bytes(pid) if pid is not None else None
+    return {
+        "requests": args.requests,
+        "errors": len(errors),
+        "error_samples": list(dict.fromkeys(errors))[:3],
+        "concurrency": args.concurrency,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 2) if duration > 0 else None,
+        "latency_ms": {
+            "p50": _ms(percentile(latencies, 50)),
+            "p95": _ms(percentile(latencies, 95)),
+            "p99": _ms(percentile(latencies, 99)),
+            "mean": _ms(sum(latencies) / len(latencies) if latencies else None),
+            "min": _ms(latencies[0] if latencies else None),
+            "max": _ms(latencies[-1] if latencies else None)
+        },
+        "peak_rss_mb": round(rss / 2**20, 1) if rss is not None else None,
+        "peak_rss_scope": "scenario" if rss_reset else "process"
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def _json_error(response: httpx.Response) -> Optional[str]:
+    """
+    バックエンドのJSONレスポンスを検査します（HTTPエラーまたは success: false ならエラーメッセージ）
+    """
+    if response.status_code != 200:
+        return f"HTTP {response.status_code}: {response.text[:200]}"
+    data = response.json()
+    if isinstance(data, dict) and data.get("success") is False:
+        return str(data.get("error"))
+    return None
+
+
+def backend_calls(client: httpx.AsyncClient, args: argparse.Namespace) -> Dict[str, Call]:
+    """
+    バックエンドのシナリオ（キー → 1回の呼び出し）
+    """
+    async def search(key: str) -> Optional[str]:
+        return _json_error(await client.post("/api/subsidies/search", json={"keyword": key}))
+
+    async def detail(key: str) -> Optional[str]:
+        return _json_error(await client.post("/api/subsidies/detail", json={"subsidy_id": subsidy_id_for(key)}))
+
+    async def details(key: str) -> Optional[str]:
+        ids = [subsidy_id_for(f"{key}/{index}") for index in range(args.details_batch)]
+        return _json_error(await client.post("/api/subsidies/details", json={"subsidy_ids": ids}))
+
+    def chat_request(key: str) -> Dict[str, Any]:
+        return {
+            "messages": [{"role": "user", "content": f"{key} の補助金を教えてください"}],
+            "model": args.chat_model,
+            "bypass_cache": True
+        }
+
+    async def chat(key: str) -> Optional[str]:
+        response = await client.post("/api/chat", json=chat_request(key))
+        error = _json_error(response)
+        if error is not None:
+            return error
+        failed = [
+            f"{model}: {result.get('error')}"
+            for model, result in response.json().get("responses", {}).items()
+            if not result.get("success")
+        ]
+        return "; ".join(failed) or None
+
+    async def chat_stream(key: str) -> Optional[str]:
+        async with client.stream("POST", "/api/chat/stream", json=chat_request(key)) as response:
+            if response.status_code != 200:
+                return f"HTTP {response.status_code}"
+            failed = []
+            async for line in response.aiter_lines():
+                if line.startswith("event: error"):
+                    failed.append("error event")
+                elif line.startswith("data: ") and '"type": "done"' in line:
+                    event = json.loads(line[6:])
+                    if not event["result"].get("success"):
+                        failed.append(f"{event['model']}: {event['result'].get('error')}")
+            return "; ".join(failed) or None
+
+    return {"search": search, "detail": detail, "details": details, "chat": chat, "chat_stream": chat_stream}
+
+
+class McpClient:
+    """
+    stdio で MCP サーバーと JSON-RPC をやり取りする最小限のクライアント
+
+    ベンチマークを実行するPython環境に mcp パッケージがなくても計測できるよう、
+    改行区切りのJSON-RPCを直接読み書きします。リクエストはIDで対応付けるため並行して送れます。
+    """
+
+    def __init__(self):
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._pending: Dict[int, "asyncio.Future[Dict[str, Any]]"] = {}
+        self._next_id = 0
+        self._reader: Optional["asyncio.Task[None]"] = None
+
+    async def start(self, command: List[str], env: Dict[str, str], log_path: str) -> None:
+        with open(log_path, "wb") as log:
+            self.process = await asyncio.create_subprocess_exec(
+                *command,
+                cwd=REPO_ROOT,
+                env=env,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=log,
+                # 検索結果はJSON1行で数百KBになることがある
+                limit=64 * 2**20
+            )
+        self._reader = asyncio.create_task(self._read())
+        await self.request("initialize", {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {"name": "jgrants-benchmark", "version": "1.0.0"}
+        })
+        await self._send({"jsonrpc": "2.0", "method": "notifications/initialized"})
+
+    async def _send(self, message: Dict[str, Any]) -> None:
+        self.process.stdin.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        await self.process.stdin.drain()
+
+    async def _read(self) -> None:
+        try:
+            while line := await self.process.stdout.readline():
+                message = json.loads(line)
+                future = self._pending.pop(message.get("id"), None) if "id" in message else None
+                if future is not None and not future.done():
+                    future.set_result(message)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("MCPサーバーが終了しました"))
+            self._pending.clear()
+
+    async def request(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = future
+        await self._send({"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params})
+        message = await future
+        if "error" in message:
+            raise RuntimeError(message["error"].get("message"))
+        return message["result"]
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Optional[str]:
+        """
+        ツールを呼び出します（成功なら None、失敗ならエラーメッセージ）
+        """
+        result = await self.request("tools/call", {"name": name, "arguments": arguments})
+        text = "".join(item.get("text", "") for item in result.get("content", []) if item.get("type") == "text")
+        if result.get("isError"):
+            return text[:200]
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None
+        if isinstance(data, dict) and data.get("success") is False:
+            return str(data.get("error"))
+        return None
+
+    async def close(self) -> None:
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            self.process.stdin.close()
+            try:
+                await asyncio.wait_for(self.process.wait(), timeout=10)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        if self._reader is not None:
+            await self._reader
+
+
+def mcp_calls(client: McpClient) -> Dict[str, Call]:
+    async def mcp_search(key: str) -> Optional[str]:
+        return await client.call_tool("search_subsidies", {"keyword": key})
+
+    async def mcp_detail(key: str) -> Optional[str]:
+        return await client.call_tool("get_subsidy_detail", {"subsidy_id": subsidy_id_for(key)})
+
+    return {"mcp_search": mcp_search, "mcp_detail": mcp_detail}
+
+
+def fake_config(args: argparse.Namespace) -> Dict[str, Any]:
+    llm: Dict[str, Any] = {
+        "first_token": args.llm_first_token,
+        "token_delay": args.llm_token_delay,
+        "answer_tokens": args.llm_answer_tokens
+    }
+    if args.llm_script:
+        with open(args.llm_script, encoding="utf-8") as f:
+            llm["script"] = json.load(f)
+    return {
+        "jgrants": {
+            "latency": args.jgrants_latency,
+            "jitter": args.jgrants_jitter,
+            "search_results": args.search_results,
+            "attachments": args.attachments,
+            "attachment_bytes": args.attachment_bytes
+        },
+        "llm": llm
+    }
+
+
+async def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"不明なシナリオ: {', '.join(unknown)}（指定できるもの: {', '.join(SCENARIOS)}）")
+
+    log_dir = tempfile.mkdtemp(prefix="jgrants-bench-")
+    jgrants_port, llm_port, backend_port = free_port(), free_port(), free_port()
+    jgrants_base = f"http://127.0.0.1:{jgrants_port}"
+    llm_base = f"http://127.0.0.1:{llm_port}"
+    config = fake_config(args)
+
+    env = {
+        **os.environ,
+        **BENCH_ENV,
+        "JGRANTS_API_BASE": jgrants_base,
+        "ANTHROPIC_BASE_URL": llm_base,
+        "OPENAI_BASE_URL": f"{llm_base}/v1"
+    }
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    results: Dict[str, Any] = {
+        **git_revision(),
+        "label": args.label,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "distinct": args.distinct,
+            "chat_model": args.chat_model,
+            "details_batch": args.details_batch,
+            "fakes": {
+                "jgrants": {**fake_jgrants.DEFAULT_CONFIG, **config["jgrants"]},
+                "llm": {**fake_llm.DEFAULT_CONFIG, **config["llm"]}
+            },
+            "env": {key: env[key] for key in sorted(set(BENCH_ENV) | {item.partition("=")[0] for item in args.env})}
+        },
+        "scenarios": {}
+    }
+
+    fakes = backend = None
+    try:
+        fakes_log = os.path.join(log_dir, "fakes.log")
+        fakes = start_process(
+            [
+                sys.executable, "-m", "benchmarks.fake_servers",
+                "--jgrants-port", str(jgrants_port),
+                "--llm-port", str(llm_port),
+                "--config", json.dumps(config, ensure_ascii=False)
+            ],
+            env, REPO_ROOT, fakes_log
+        )
+        await wait_until_ready(f"{jgrants_base}/_bench/stats", fakes, fakes_log)
+        await wait_until_ready(f"{llm_base}/_bench/stats", fakes, fakes_log)
+
+        backend_scenarios = [name for name in scenarios if name in BACKEND_SCENARIOS]
+        if backend_scenarios:
+            backend_log = os.path.join(log_dir, "backend.log")
+            backend = start_process(
+                [
+                    sys.executable, "-m", "uvicorn", "main:app",
+                    "--host", "127.0.0.1", "--port", str(backend_port),
+                    "--log-level", "warning", "--no-access-log"
+                ],
+                env, BACKEND_DIR, backend_log
+            )
+            await wait_until_ready(f"http://127.0.0.1:{backend_port}/api/health", backend, backend_log)
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{backend_port}", timeout=300, limits=limits
+            ) as client:
+                calls = backend_calls(client, args)
+                for name in backend_scenarios:
+                    print(f"▶ {name}", file=sys.stderr)
+                    results["scenarios"][name] = await run_load(name, calls[name], args, backend.pid)
+            rss = peak_rss_bytes(backend.pid)
+            results["backend_peak_rss_mb"] = round(rss / 2**20, 1) if rss is not None else None
+
+        mcp_scenarios = [name for name in scenarios if name in MCP_SCENARIOS]
+        if mcp_scenarios:
+            mcp_log = os.path.join(log_dir, "mcp.log")
+            client = McpClient()
+            try:
+                await asyncio.wait_for(client.start([args.mcp_python, MCP_SERVER], env, mcp_log), timeout=60)
+            except (ConnectionError, RuntimeError, asyncio.TimeoutError) as e:
+                await client.close()
+                reason = f"MCPサーバーを起動できませんでした（{args.mcp_python} に mcp パッケージが必要）: {e}"
+                print(f"✗ {reason}\n{tail(mcp_log)}", file=sys.stderr)
+                for name in mcp_scenarios:
+                    results["scenarios"][name] = {"skipped": reason}
+            else:
+                try:
+                    calls = mcp_calls(client)
+                    for name in mcp_scenarios:
+                        print(f"▶ {name}", file=sys.stderr)
+                        results["scenarios"][name] = await run_load(name, calls[name], args, client.process.pid)
+                    rss = peak_rss_bytes(client.process.pid)
+                    results["mcp_peak_rss_mb"] = round(rss / 2**20, 1) if rss is not None else None
+                finally:
+                    await client.close()
+
+        async with httpx.AsyncClient(timeout=10) as stats_client:
+            results["upstream_requests"] = {
+                "jgrants": (await stats_client.get(f"{jgrants_base}/_bench/stats")).json()["requests"],
+                "llm": (await stats_client.get(f"{llm_base}/_bench/stats")).json()["requests"]
+            }
+    finally:
+        stop_process(backend)
+        stop_process(fakes)
+
+    results["logs"] = log_dir
+    return results
+
+
+def format_summary(results: Dict[str, Any]) -> str:
+    """
+    結果を表形式の文字列にします（標準エラー出力に表示）
+    """
+    lines = [f"{'scenario':<12} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>8} {'errors':>6} {'rss MB':>8}"]
+    for name, item in results["scenarios"].items():
+        if "skipped" in item:
+            lines.append(f"{name:<12} skipped")
+            continue
+        latency = item["latency_ms"]
+        lines.append(
+            f"{name:<12} {_cell(latency['p50'])} {_cell(latency['p95'])} {_cell(latency['p99'])} "
+            f"{_cell(item['throughput_rps'], 8)} {item['errors']:>6} {_cell(item['peak_rss_mb'], 8)}"
+        )
+    return "\n".join(lines)
+
+
+def _cell(value: Optional[float], width: int = 9) -> str:
+    return f"{value:>{width}.1f}" if value is not None else f"{'-':>{width}}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Jグランツ補助金検索システムのベンチマーク")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"実行するシナリオ（カンマ区切り: {', '.join(SCENARIOS)}）")
+    parser.add_argument("--requests", type=int, default=100, help="シナリオごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=10, help="同時リクエスト数")
+    parser.add_argument("--warmup", type=int, default=5, help="計測前のウォームアップのリクエスト数")
+    parser.add_argument("--distinct", type=int, default=20, help="キー（キーワード・補助金ID）の種類数（小さいほどキャッシュにヒット）")
+    parser.add_argument("--chat-model", default="both", choices=["claude", "openai", "both"])
+    parser.add_argument("--details-batch", type=int, default=5, help="details シナリオで一括取得するID数")
+    parser.add_argument("--jgrants-latency", type=float, default=0.05, help="偽Jグランツの応答時間（秒）")
+    parser.add_argument("--jgrants-jitter", type=float, default=0.02, help="偽Jグランツの応答時間の揺らぎ（秒）")
+    parser.add_argument("--search-results", type=int, default=50, help="検索結果の件数")
+    parser.add_argument("--attachments", type=int, default=2, help="詳細の添付ファイル数")
+    parser.add_argument("--attachment-bytes", type=int, default=1_000_000, help="添付ファイル1個のサイズ（base64デコード後）")
+    parser.add_argument("--llm-first-token", type=float, default=0.2, help="偽LLMの最初のトークンまでの時間（秒）")
+    parser.add_argument("--llm-token-delay", type=float, default=0.005, help="偽LLMのトークン1個あたりの時間（秒）")
+    parser.add_argument("--llm-answer-tokens", type=int, default=100, help="偽LLMの回答のトークン数")
+    parser.add_argument("--llm-script", help="偽LLMのツール呼び出しスクリプト（JSON。形式は fake_llm.DEFAULT_SCRIPT）")
+    parser.add_argument("--mcp-python", default=sys.executable, help="MCPサーバーを実行するPython（mcp パッケージが必要）")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="計測対象に渡す環境変数（複数指定可）")
+    parser.add_argument("--label", help="結果に記録する任意のラベル")
+    parser.add_argument("--output", help="結果のJSONの出力先（省略時は標準出力）")
+    args = parser.parse_args()
+    if args.requests < 1 or args.concurrency < 1 or args.distinct < 1:
+        parser.error("--requests, --concurrency, --distinct は1以上を指定してください")
+
+    results = asyncio.run(run_benchmarks(args))
+    print(format_summary(results), file=sys.stderr)
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"✓ 結果を {args.output} に保存しました", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
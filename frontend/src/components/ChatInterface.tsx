@@ -2,8 +2,8 @@
 
 import React, { useState, useRef, useEffect } from 'react';
 import ChatMessage from './ChatMessage';
-import { sendChatMessage } from '../lib/api';
-import type { Message, ModelVisibility, ChatResponse } from '../types';
+import { streamChatMessage } from '../lib/api';
+import type { Message, ModelVisibility, ChatStreamEvent } from '../types';
 
 export default function ChatInterface() {
   const [messages, setMessages] = useState<Message[]>([]);
@@ -11,6 +11,13 @@ export default function ChatInterface() {
   const [openaiMessages, setOpenaiMessages] = useState<Message[]>([]);
   const [inputValue, setInputValue] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  // サーバー側で会話履歴を保持するセッションのID（初回送信時に発行される）
+  const [sessionId, setSessionId] = useState<string | null>(null);
+  // トークンの受信が始まったモデル（受信開始後は「考え中」表示を消す）
+  const [streamingModels, setStreamingModels] = useState<ModelVisibility>({
+    claude: false,
+    openai: false,
+  });
   const [modelVisibility, setModelVisibility] = useState<ModelVisibility>({
     claude: true,
     openai: true,
@@ -56,45 +63,62 @@ export default function ChatInterface() {
     setClaudeMessages(updatedClaudeMessages);
     setOpenaiMessages(updatedOpenaiMessages);
     setIsLoading(true);
+    setStreamingModels({ claude: false, openai: false });
 
-    try {
-      // API呼び出し
-      const response = await sendChatMessage(newMessages, 'both');
-
-      // Claudeのレスポンス処理
-      if (response.responses.claude?.success) {
-        const claudeResponse: Message = {
-          role: 'assistant',
-          content: response.responses.claude.response,
-          timestamp: new Date(),
-        };
-        setClaudeMessages(prev => [...prev, claudeResponse]);
-      } else if (response.responses.claude?.error) {
-        const claudeError: Message = {
-          role: 'assistant',
-          content: `エラー: ${response.responses.claude.error}`,
-          timestamp: new Date(),
-        };
-        setClaudeMessages(prev => [...prev, claudeError]);
+    const setters = {
+      claude: setClaudeMessages,
+      openai: setOpenaiMessages,
+    };
+    const started = { claude: false, openai: false };
+
+    // 受信したトークンを各モデルの最後のアシスタントメッセージに追記
+    const appendText = (model: 'claude' | 'openai', text: string) => {
+      const isFirst = !started[model];
+      started[model] = true;
+      if (isFirst) {
+        setStreamingModels(prev => ({ ...prev, [model]: true }));
       }
+      setters[model](prev => {
+        if (isFirst) {
+          return [...prev, { role: 'assistant', content: text, timestamp: new Date() }];
+        }
+        const last = prev[prev.length - 1];
+        return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+      });
+    };
 
-      // OpenAIのレスポンス処理
-      if (response.responses.openai?.success) {
-        const openaiResponse: Message = {
-          role: 'assistant',
-          content: response.responses.openai.response,
-          timestamp: new Date(),
-        };
-        setOpenaiMessages(prev => [...prev, openaiResponse]);
-      } else if (response.responses.openai?.error) {
-        const openaiError: Message = {
-          role: 'assistant',
-          content: `エラー: ${response.responses.openai.error}`,
-          timestamp: new Date(),
-        };
-        setOpenaiMessages(prev => [...prev, openaiError]);
+    const handleEvent = (event: ChatStreamEvent) => {
+      if (event.type === 'session') {
+        setSessionId(event.session_id);
+      } else if (event.type === 'token') {
+        appendText(event.model, event.text);
+      } else if (event.type === 'done') {
+        if (!event.result.success) {
+          const errorMessage: Message = {
+            role: 'assistant',
+            content: `エラー: ${event.result.error}`,
+            timestamp: new Date(),
+          };
+          setters[event.model](prev => [...prev, errorMessage]);
+        } else if (!started[event.model]) {
+          appendText(event.model, event.result.response);
+        } else {
+          // ツール呼び出し前の説明も token で届くため、完了時は保存・キャッシュされる回答（最後のターン）に置き換える
+          const response = event.result.response;
+          setters[event.model](prev => {
+            const last = prev[prev.length - 1];
+            return [...prev.slice(0, -1), { ...last, content: response }];
+          });
+        }
+        setStreamingModels(prev => ({ ...prev, [event.model]: true }));
+      } else if (event.type === 'error') {
+        console.error('Chat stream error:', event.error);
       }
+    };
 
+    try {
+      // API呼び出し（ストリーミング）: 履歴はセッションにあるため新しいメッセージのみ送信
+      await streamChatMessage(userMessage.content, sessionId, 'both', handleEvent);
     } catch (error) {
       console.error('Chat error:', error);
       const errorMessage: Message = {
@@ -175,7 +199,7 @@ export default function ChatInterface() {
                 {claudeMessages.map((msg, idx) => (
                   <ChatMessage key={idx} message={msg} model="claude" />
                 ))}
-                {isLoading && (
+                {isLoading && !streamingModels.claude && (
                   <div className="flex justify-start mb-3">
                     <div className="bg-gray-100 rounded-2xl px-4 py-3 border border-gray-200">
                       <div className="flex items-center gap-2">
@@ -204,7 +228,7 @@ export default function ChatInterface() {
                 {openaiMessages.map((msg, idx) => (
                   <ChatMessage key={idx} message={msg} model="openai" />
                 ))}
-                {isLoading && (
+                {isLoading && !streamingModels.openai && (
                   <div className="flex justify-start mb-3">
                     <div className="bg-gray-100 rounded-2xl px-4 py-3 border border-gray-200">
                       <div className="flex items-center gap-2">
@@ -1,5 +1,13 @@
 import axios from 'axios';
-import type { Message, ChatApiResponse, SubsidySearchResult, SubsidyDetail } from '../types';
+import type {
+  ChatApiResponse,
+  ChatOptions,
+  ChatStreamEvent,
+  Subsidy,
+  SubsidySearchFilters,
+  SubsidySearchResult,
+  SubsidyDetail,
+} from '../types';
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
 
@@ -12,27 +20,106 @@ const apiClient = axios.create({
 
 /**
  * チャットメッセージを送信
+ *
+ * 会話履歴はサーバー側のセッションに保存されるため、新しいメッセージのみを送信する。
+ * 初回は sessionId を省略し、レスポンスの session_id を次回以降に渡す。
+ * bypassCache を指定すると回答キャッシュを使わずに再生成する。
+ * options.deadline を過ぎたモデルは timed_out として返り、options.firstFinished なら先に完了したモデルの回答で返る
  */
 export async function sendChatMessage(
-  messages: Message[],
-  model: 'both' | 'claude' | 'openai' = 'both'
+  message: string,
+  sessionId: string | null = null,
+  model: 'both' | 'claude' | 'openai' = 'both',
+  bypassCache: boolean = false,
+  options: ChatOptions = {}
 ): Promise<ChatApiResponse> {
   const response = await apiClient.post<ChatApiResponse>('/api/chat', {
-    messages,
+    message,
+    session_id: sessionId,
     model,
+    bypass_cache: bypassCache,
+    deadline: options.deadline,
+    first_finished: options.firstFinished ?? false,
   });
   return response.data;
 }
 
+/**
+ * チャットメッセージを送信し、生成中のイベントを順次受け取る（Server-Sent Events）
+ *
+ * 最初に session イベントでセッションIDが届くので、次回以降の送信で渡す
+ */
+export async function streamChatMessage(
+  message: string,
+  sessionId: string | null,
+  model: 'both' | 'claude' | 'openai' = 'both',
+  onEvent: (event: ChatStreamEvent) => void,
+  bypassCache: boolean = false,
+  options: ChatOptions = {}
+): Promise<void> {
+  const response = await fetch(`${API_URL}/api/chat/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      message,
+      session_id: sessionId,
+      model,
+      bypass_cache: bypassCache,
+      deadline: options.deadline,
+      first_finished: options.firstFinished ?? false,
+    }),
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error(`Stream request failed: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // イベントは空行区切り
+    let separator = buffer.indexOf('\n\n');
+    while (separator !== -1) {
+      const rawEvent = buffer.slice(0, separator);
+      buffer = buffer.slice(separator + 2);
+      separator = buffer.indexOf('\n\n');
+
+      const lines = rawEvent.split('\n');
+      const eventName = lines.find((line) => line.startsWith('event:'))?.slice(6).trim();
+      const data = lines
+        .filter((line) => line.startsWith('data:'))
+        .map((line) => line.slice(5).trimStart())
+        .join('\n');
+
+      if (eventName === 'end') return;
+      if (data) onEvent(JSON.parse(data) as ChatStreamEvent);
+    }
+  }
+}
+
 /**
  * 補助金を検索
+ *
+ * limit / cursor を指定するとページ単位で取得する（続きはレスポンスの next_cursor を渡す）。
+ * filters の条件はサーバー側でローカルに絞り込む
  */
 export async function searchSubsidies(
   keyword: string,
   acceptance?: number,
   targetArea?: string,
   sort: string = 'created_date',
-  order: string = 'DESC'
+  order: string = 'DESC',
+  limit?: number,
+  cursor?: string,
+  filters: SubsidySearchFilters = {}
 ): Promise<SubsidySearchResult> {
   const response = await apiClient.post<SubsidySearchResult>('/api/subsidies/search', {
     keyword,
@@ -40,6 +127,9 @@ export async function searchSubsidies(
     target_area: targetArea,
     sort,
     order,
+    limit,
+    cursor,
+    ...filters,
   });
   return response.data;
 }
@@ -49,10 +139,99 @@ export async function searchSubsidies(
  */
 export async function searchActiveSubsidies(
   keyword: string,
-  targetArea?: string
+  targetArea?: string,
+  limit?: number,
+  cursor?: string,
+  filters: SubsidySearchFilters = {}
 ): Promise<SubsidySearchResult> {
   const response = await apiClient.get<SubsidySearchResult>('/api/subsidies/active', {
-    params: { keyword, target_area: targetArea },
+    params: { keyword, target_area: targetArea, limit, cursor, ...filters },
+  });
+  return response.data;
+}
+
+/**
+ * 募集中の補助金を検索し、1件ずつ受け取る（NDJSON）
+ *
+ * 最初の行が届いた時点から描画できる。戻り値は全件数と次ページのカーソル
+ */
+export async function streamActiveSubsidies(
+  keyword: string,
+  onSubsidy: (subsidy: Subsidy) => void,
+  targetArea?: string,
+  limit?: number,
+  cursor?: string
+): Promise<{ total: number; nextCursor: string | null }> {
+  const params = new URLSearchParams({ keyword });
+  if (targetArea) params.set('target_area', targetArea);
+  if (limit) params.set('limit', String(limit));
+  if (cursor) params.set('cursor', cursor);
+
+  const response = await fetch(`${API_URL}/api/subsidies/active?${params}`, {
+    headers: { Accept: 'application/x-ndjson' },
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Search request failed: ${response.status}`);
+  }
+  if (!response.headers.get('Content-Type')?.includes('application/x-ndjson')) {
+    // エラー時は通常のJSONで返る
+    const result = (await response.json()) as SubsidySearchResult;
+    throw new Error(result.error || 'Search failed');
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let newline = buffer.indexOf('\n');
+    while (newline !== -1) {
+      const line = buffer.slice(0, newline).trim();
+      buffer = buffer.slice(newline + 1);
+      newline = buffer.indexOf('\n');
+      if (line) onSubsidy(JSON.parse(line) as Subsidy);
+    }
+  }
+  if (buffer.trim()) onSubsidy(JSON.parse(buffer) as Subsidy);
+
+  return {
+    total: Number(response.headers.get('X-Total-Count') || 0),
+    nextCursor: response.headers.get('X-Next-Cursor'),
+  };
+}
+
+/**
+ * 複数のキーワード・地域でまとめて検索（重複を除き、一致数の多い順・申請期限の近い順）
+ */
+export async function searchSubsidiesMulti(
+  keywords: string[],
+  targetAreas?: string[],
+  acceptance: number = 1,
+  limit?: number
+): Promise<SubsidySearchResult & { queries?: number; failed_queries?: Array<{ keyword: string; target_area: string | null; error: string }> }> {
+  const response = await apiClient.post('/api/subsidies/search/multi', {
+    keywords,
+    target_areas: targetAreas,
+    acceptance,
+    limit,
+  });
+  return response.data;
+}
+
+/**
+ * 内容が似ている補助金を取得（取得済みの詳細から作ったサーバー側の索引で検索し、score の高い順）
+ */
+export async function findSimilarSubsidies(
+  subsidyId: string,
+  k: number = 5
+): Promise<SubsidySearchResult & { subsidy_id?: string; indexed?: number }> {
+  const response = await apiClient.post('/api/subsidies/similar', {
+    subsidy_id: subsidyId,
+    k,
   });
   return response.data;
 }
@@ -67,6 +246,22 @@ export async function getSubsidyDetail(subsidyId: string): Promise<{ success: bo
   return response.data;
 }
 
+/**
+ * 複数の補助金の詳細をまとめて取得（指定順。IDごとの失敗は各要素の error に入る）
+ */
+export async function getSubsidyDetails(subsidyIds: string[]): Promise<{
+  success: boolean;
+  count: number;
+  succeeded: number;
+  results: Array<{ id: string; success: boolean; subsidy?: SubsidyDetail; error?: string }>;
+  error?: string;
+}> {
+  const response = await apiClient.post('/api/subsidies/details', {
+    subsidy_ids: subsidyIds,
+  });
+  return response.data;
+}
+
 /**
  * ヘルスチェック
  */
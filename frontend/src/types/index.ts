@@ -15,6 +15,11 @@ export interface Subsidy {
   acceptance_start: string;
   acceptance_end: string;
   target_employees: string;
+  // 複数キーワード検索のみ: 一致したクエリ数とキーワード
+  match_count?: number;
+  matched_keywords?: string[];
+  // 類似補助金検索のみ: BM25 の類似度
+  score?: number;
 }
 
 // 補助金検索結果の型定義
@@ -22,9 +27,19 @@ export interface SubsidySearchResult {
   success: boolean;
   count: number;
   subsidies: Subsidy[];
+  next_cursor?: string | null;
+  total_before_filter?: number;
   error?: string;
 }
 
+// 補助金検索の絞り込み条件（上流APIにないためサーバー側でローカルに適用）
+export interface SubsidySearchFilters {
+  subsidy_limit_min?: number;
+  subsidy_limit_max?: number;
+  deadline_within_days?: number;
+  employees?: number;
+}
+
 // 補助金詳細の型定義
 export interface SubsidyDetail extends Subsidy {
   subsidy_rate: string;
@@ -42,16 +57,49 @@ export interface ChatResponse {
   response: string;
   tool_calls?: any[];
   error?: string;
+  // 制限時間切れ・先に完了したモデルがあって中断した場合（response は生成済みの部分）
+  timed_out?: boolean;
+}
+
+// チャットの制限時間・先着オプション
+export interface ChatOptions {
+  deadline?: number;  // 秒（省略時はサーバーの既定値）
+  firstFinished?: boolean;  // 最初に完了したモデルの回答で返し、残りは中断する
 }
 
 // API レスポンスの型定義
 export interface ChatApiResponse {
+  session_id?: string;
+  cached?: boolean;
   responses: {
     claude?: ChatResponse;
     openai?: ChatResponse;
   };
 }
 
+// ストリーミングイベントの型定義（/api/chat/stream）
+export type ChatStreamEvent =
+  | { type: 'session'; session_id: string }
+  | { type: 'token'; model: 'claude' | 'openai'; text: string }
+  | {
+      type: 'tool_start';
+      model: 'claude' | 'openai';
+      iteration: number;
+      id: string;
+      name: string;
+      arguments: Record<string, any>;
+    }
+  | {
+      type: 'tool_end';
+      model: 'claude' | 'openai';
+      iteration: number;
+      id: string;
+      name: string;
+      success: boolean;
+    }
+  | { type: 'done'; model: 'claude' | 'openai'; result: ChatResponse; cached?: boolean }
+  | { type: 'error'; error: string };
+
 // モデル選択の型定義
 export type ModelType = 'both' | 'claude' | 'openai';
 
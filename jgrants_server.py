@@ -4,197 +4,53 @@ Jグランツ（補助金電子申請システム）のAPIをMCP経由で利用
 
 このサーバーは、デジタル庁が運営するJグランツの公開APIをラップし、
 生成AIから補助金情報を検索・取得できるようにします。
+
+検索・詳細取得・キャッシュ・ローカルの絞り込み・類似検索・上流の保護層はバックエンドと共通の
+実装（backend/api/jgrants.py）を使います。このファイルはMCPのツール定義と呼び出しの変換のみを行います。
+取得結果はメモリにキャッシュされ、JGRANTS_MCP_CACHE_PATH を設定している場合はSQLiteにも保存されて
+再起動後も再利用されます。
 """
 
 import asyncio
 import json
-import requests
-from typing import Optional, Any
+import os
+from typing import Any
 from mcp.server.models import InitializationOptions
 from mcp.server import NotificationOptions, Server
 from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent
 
-# JグランツAPIのベースURL
-JGRANTS_API_BASE = "https://api.jgrants-portal.go.jp/exp/v1/public"
-
-# MCPサーバーの初期化
-server = Server("jgrants-subsidy-search")
-
-
-def search_subsidies_api(
-    keyword: str,
-    sort: str = "created_date",
-    order: str = "DESC",
-    acceptance: Optional[int] = None,
-    target_area_search: Optional[str] = None,
-    target_number_of_employees: Optional[str] = None,
-    use_purpose: Optional[str] = None,
-    industry: Optional[str] = None
-) -> dict:
-    """
-    Jグランツで補助金を検索します
-
-    Args:
-        keyword: 検索キーワード（2～255文字）。大文字・小文字や全角・半角の表記ゆれを許容
-        sort: ソート項目（created_date, acceptance_start_datetime, acceptance_end_datetime）
-        order: ソート順（ASC: 昇順, DESC: 降順）
-        acceptance: 募集期間内フィルタ（1: 募集中のみ, 0 or None: 全て）
-        target_area_search: 対象地域（都道府県名など）
-        target_number_of_employees: 従業員数要件
-        use_purpose: 利用目的（複数の場合は「 / 」で区切る）
-        industry: 業種（複数の場合は「 / 」で区切る）
+from backend.api import jgrants
 
-    Returns:
-        補助金情報のリスト（JSON形式）
-    """
+# 検索ツールが limit 省略時に返す件数（0なら全件を返し、limit を指定した呼び出しのみページ単位にする）
+SEARCH_PAGE_SIZE = int(os.getenv("JGRANTS_MCP_PAGE_SIZE", "0")) or None
 
-    # 必須パラメータのバリデーション
-    if not keyword or len(keyword) < 2 or len(keyword) > 255:
-        return {
-            "error": "keywordは2～255文字で指定してください",
-            "success": False
-        }
+# 結果キャッシュの永続化先（SQLite。未設定ならメモリのみ）
+CACHE_PATH = os.getenv("JGRANTS_MCP_CACHE_PATH", "")
 
-    if sort not in ["created_date", "acceptance_start_datetime", "acceptance_end_datetime"]:
-        return {
-            "error": "sortはcreated_date, acceptance_start_datetime, acceptance_end_datetimeのいずれかを指定してください",
-            "success": False
-        }
+# MCPサーバーの初期化
+server = Server("jgrants-subsidy-search")
 
-    if order not in ["ASC", "DESC"]:
-        return {
-            "error": "orderはASCまたはDESCを指定してください",
-            "success": False
-        }
 
-    # APIリクエストパラメータの構築
-    params = {
-        "keyword": keyword,
-        "sort": sort,
-        "order": order
+# 上流APIにない絞り込み条件（検索結果にローカルで適用する）
+SEARCH_FILTER_PROPERTIES = {
+    "subsidy_limit_min": {
+        "type": "number",
+        "description": "補助上限額の下限（円）。例: 1000万円以上なら 10000000"
+    },
+    "subsidy_limit_max": {
+        "type": "number",
+        "description": "補助上限額の上限（円）"
+    },
+    "deadline_within_days": {
+        "type": "integer",
+        "description": "申請締切が今日から指定日数以内のもののみ（例: 14）"
+    },
+    "employees": {
+        "type": "integer",
+        "description": "自社の従業員数（従業員数要件を満たすもののみ）"
     }
-
-    # オプションパラメータの追加
-    if acceptance is not None:
-        params["acceptance"] = acceptance
-    if target_area_search:
-        params["target_area_search"] = target_area_search
-    if target_number_of_employees:
-        params["target_number_of_employees"] = target_number_of_employees
-    if use_purpose:
-        params["use_purpose"] = use_purpose
-    if industry:
-        params["industry"] = industry
-
-    try:
-        # JグランツAPIへのリクエスト
-        url = f"{JGRANTS_API_BASE}/subsidies"
-        response = requests.get(url, params=params, timeout=30)
-        response.raise_for_status()
-
-        data = response.json()
-
-        # 結果の整形
-        result = {
-            "success": True,
-            "count": data.get("metadata", {}).get("resultset", {}).get("count", 0),
-            "subsidies": []
-        }
-
-        # 補助金情報を見やすく整形
-        for subsidy in data.get("result", []):
-            result["subsidies"].append({
-                "id": subsidy.get("id"),
-                "name": subsidy.get("name"),
-                "title": subsidy.get("title"),
-                "target_area": subsidy.get("target_area_search"),
-                "subsidy_max_limit": subsidy.get("subsidy_max_limit"),
-                "acceptance_start": subsidy.get("acceptance_start_datetime"),
-                "acceptance_end": subsidy.get("acceptance_end_datetime"),
-                "target_employees": subsidy.get("target_number_of_employees")
-            })
-
-        return result
-
-    except requests.exceptions.RequestException as e:
-        return {
-            "error": f"API通信エラー: {str(e)}",
-            "success": False
-        }
-    except Exception as e:
-        return {
-            "error": f"予期しないエラー: {str(e)}",
-            "success": False
-        }
-
-
-def get_subsidy_detail_api(subsidy_id: str) -> dict:
-    """
-    補助金の詳細情報を取得します
-
-    Args:
-        subsidy_id: 補助金ID（search_subsidiesで取得したID）
-
-    Returns:
-        補助金の詳細情報（JSON形式）
-    """
-
-    if not subsidy_id:
-        return {
-            "error": "subsidy_idを指定してください",
-            "success": False
-        }
-
-    try:
-        # JグランツAPIへのリクエスト
-        url = f"{JGRANTS_API_BASE}/subsidies/id/{subsidy_id}"
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-
-        data = response.json()
-
-        if not data.get("result"):
-            return {
-                "error": "指定されたIDの補助金が見つかりませんでした",
-                "success": False
-            }
-
-        subsidy = data["result"][0] if isinstance(data["result"], list) else data["result"]
-
-        # 詳細情報を整形（ファイルのbase64データは除外して見やすくする）
-        result = {
-            "success": True,
-            "subsidy": {
-                "id": subsidy.get("id"),
-                "name": subsidy.get("name"),
-                "title": subsidy.get("title"),
-                "target_area": subsidy.get("target_area_search"),
-                "subsidy_max_limit": subsidy.get("subsidy_max_limit"),
-                "subsidy_rate": subsidy.get("subsidy_rate"),
-                "acceptance_start": subsidy.get("acceptance_start_datetime"),
-                "acceptance_end": subsidy.get("acceptance_end_datetime"),
-                "target_employees": subsidy.get("target_number_of_employees"),
-                "purpose": subsidy.get("purpose"),
-                "outline": subsidy.get("outline"),
-                "note": subsidy.get("note"),
-                "grant_guideline_url": subsidy.get("grant_guideline_url"),
-                "application_form_files": len(subsidy.get("application_form_files", [])) if subsidy.get("application_form_files") else 0
-            }
-        }
-
-        return result
-
-    except requests.exceptions.RequestException as e:
-        return {
-            "error": f"API通信エラー: {str(e)}",
-            "success": False
-        }
-    except Exception as e:
-        return {
-            "error": f"予期しないエラー: {str(e)}",
-            "success": False
-        }
+}
 
 
 @server.list_tools()
@@ -205,7 +61,7 @@ async def handle_list_tools() -> list[Tool]:
     return [
         Tool(
             name="search_subsidies",
-            description="Jグランツで補助金を検索します。キーワードで検索し、募集中のみや地域でフィルタリングできます。",
+            description="Jグランツで補助金を検索します。キーワードで検索し、募集中のみや地域でフィルタリングできます。limit を指定すると結果はページ単位になり、結果に next_cursor がある場合は cursor に指定して続きを取得してください。",
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -225,7 +81,7 @@ async def handle_list_tools() -> list[Tool]:
                     "sort": {
                         "type": "string",
                         "description": "ソート項目",
-                        "enum": ["created_date", "acceptance_start_datetime", "acceptance_end_datetime"],
+                        "enum": ["created_date", "acceptance_start_datetime", "acceptance_end_datetime", "subsidy_max_limit"],
                         "default": "created_date"
                     },
                     "order": {
@@ -233,11 +89,54 @@ async def handle_list_tools() -> list[Tool]:
                         "description": "ソート順",
                         "enum": ["ASC", "DESC"],
                         "default": "DESC"
+                    },
+                    **SEARCH_FILTER_PROPERTIES,
+                    "limit": {
+                        "type": "integer",
+                        "description": "1ページの件数（最大100。省略時は全件）",
+                        "minimum": 1,
+                        "maximum": 100
+                    },
+                    "cursor": {
+                        "type": "string",
+                        "description": "次のページを取得する場合に、前の結果の next_cursor を指定"
                     }
                 },
                 "required": ["keyword"]
             }
         ),
+        Tool(
+            name="search_subsidies_multi",
+            description="複数のキーワード・地域で補助金をまとめて検索します。結果は重複を除き、一致したキーワードが多い順・申請期限が近い順に並びます。複数の観点（例: DX、省エネ、設備投資）で探す場合は search_subsidies を繰り返さずにこちらを使ってください。",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "keywords": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "検索キーワードのリスト（各2～255文字）"
+                    },
+                    "target_areas": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "対象地域のリスト（例: [\"東京都\", \"神奈川県\"]）"
+                    },
+                    "acceptance": {
+                        "type": "integer",
+                        "description": "募集中フィルタ（1: 募集中のみ, 0: 全て）",
+                        "enum": [0, 1],
+                        "default": 1
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "返す最大件数（既定50、最大100）",
+                        "minimum": 1,
+                        "maximum": 100
+                    }
+                },
+                "required": ["keywords"]
+            }
+        ),
         Tool(
             name="get_subsidy_detail",
             description="補助金IDを指定して詳細情報を取得します。補助率、概要、注意事項などの詳細が取得できます。",
@@ -252,9 +151,45 @@ async def handle_list_tools() -> list[Tool]:
                 "required": ["subsidy_id"]
             }
         ),
+        Tool(
+            name="get_subsidy_details",
+            description="複数の補助金IDの詳細情報をまとめて取得します。補助金の比較にはこちらを使うと1回の呼び出しで済みます。",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "subsidy_ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "補助金IDのリスト（search_subsidiesで取得したID、最大20件）"
+                    }
+                },
+                "required": ["subsidy_ids"]
+            }
+        ),
+        Tool(
+            name="find_similar_subsidies",
+            description="指定した補助金と目的・概要が似ている補助金を探します。代わりの補助金や類似の制度を探す場合は、キーワードを考えて検索し直さずにこちらを使ってください。",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "subsidy_id": {
+                        "type": "string",
+                        "description": "基準とする補助金ID"
+                    },
+                    "k": {
+                        "type": "integer",
+                        "description": "返す件数",
+                        "minimum": 1,
+                        "maximum": 20,
+                        "default": 5
+                    }
+                },
+                "required": ["subsidy_id"]
+            }
+        ),
         Tool(
             name="search_active_subsidies",
-            description="現在募集中の補助金を検索します（便利関数）。申請期限が近い順に表示します。",
+            description="現在募集中の補助金を検索します（便利関数）。申請期限が近い順に表示します。limit を指定した場合は search_subsidies と同じく next_cursor で続きを取得してください。",
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -265,6 +200,17 @@ async def handle_list_tools() -> list[Tool]:
                     "target_area": {
                         "type": "string",
                         "description": "対象地域（例: 東京都、大阪府など）"
+                    },
+                    **SEARCH_FILTER_PROPERTIES,
+                    "limit": {
+                        "type": "integer",
+                        "description": "1ページの件数（最大100。省略時は全件）",
+                        "minimum": 1,
+                        "maximum": 100
+                    },
+                    "cursor": {
+                        "type": "string",
+                        "description": "次のページを取得する場合に、前の結果の next_cursor を指定"
                     }
                 },
                 "required": ["keyword"]
@@ -279,26 +225,46 @@ async def handle_call_tool(name: str, arguments: dict[str, Any]) -> list[TextCon
     MCPクライアントからのツール呼び出しを処理する
     """
     if name == "search_subsidies":
-        result = search_subsidies_api(
+        result = await jgrants.search_subsidies(
             keyword=arguments["keyword"],
             sort=arguments.get("sort", "created_date"),
             order=arguments.get("order", "DESC"),
             acceptance=arguments.get("acceptance"),
-            target_area_search=arguments.get("target_area")
+            target_area_search=arguments.get("target_area"),
+            limit=arguments.get("limit", SEARCH_PAGE_SIZE),
+            cursor=arguments.get("cursor"),
+            **{name: arguments.get(name) for name in SEARCH_FILTER_PROPERTIES}
+        )
+        return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+
+    elif name == "search_subsidies_multi":
+        result = await jgrants.search_subsidies_multi(
+            keywords=arguments["keywords"],
+            target_areas=arguments.get("target_areas"),
+            acceptance=arguments.get("acceptance", 1),
+            limit=arguments.get("limit", SEARCH_PAGE_SIZE)
         )
         return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
 
     elif name == "get_subsidy_detail":
-        result = get_subsidy_detail_api(arguments["subsidy_id"])
+        result = await jgrants.get_subsidy_detail(arguments["subsidy_id"])
+        return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+
+    elif name == "get_subsidy_details":
+        result = await jgrants.get_subsidy_details(arguments["subsidy_ids"])
+        return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+
+    elif name == "find_similar_subsidies":
+        result = await jgrants.find_similar_subsidies(arguments["subsidy_id"], k=arguments.get("k", 5))
         return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
 
     elif name == "search_active_subsidies":
-        result = search_subsidies_api(
+        result = await jgrants.search_active_subsidies(
             keyword=arguments["keyword"],
-            acceptance=1,
-            target_area_search=arguments.get("target_area"),
-            sort="acceptance_end_datetime",
-            order="ASC"
+            target_area=arguments.get("target_area"),
+            limit=arguments.get("limit", SEARCH_PAGE_SIZE),
+            cursor=arguments.get("cursor"),
+            **{name: arguments.get(name) for name in SEARCH_FILTER_PROPERTIES}
         )
         return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
 
@@ -310,19 +276,25 @@ async def main():
     """
     MCPサーバーのメイン関数
     """
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="jgrants-subsidy-search",
-                server_version="1.0.0",
-                capabilities=server.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={}
+    store = jgrants.persist_caches(CACHE_PATH) if CACHE_PATH else None
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="jgrants-subsidy-search",
+                    server_version="1.0.0",
+                    capabilities=server.get_capabilities(
+                        notification_options=NotificationOptions(),
+                        experimental_capabilities={}
+                    )
                 )
             )
-        )
+    finally:
+        await jgrants.close_client()
+        if store is not None:
+            store.close()
 
 
 if __name__ == "__main__":